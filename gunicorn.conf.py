@@ -0,0 +1,21 @@
+"""Gunicorn settings, read from the working directory when gunicorn starts."""
+
+import os
+import shutil
+
+
+def on_starting(server):
+    """Start from an empty Prometheus multiprocess directory."""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        # Files left by a previous run would be merged into /metrics forever
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):
+    """Tell the metrics collector that a worker is gone."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,267 @@
+"""Helpers shared by the benchmark and seed management commands."""
+
+from __future__ import annotations
+
+import http.client
+import itertools
+import random
+import statistics
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from django.db import connection, transaction
+
+from .counters import reconcile_follow_counts, reconcile_like_counts
+from .models import Follow, Like, Post, User
+
+# Distinct words in the synthetic posts, so searches have realistic hit counts
+VOCABULARY_SIZE = 5000
+
+
+@contextmanager
+def scratch_database(verbosity: int = 0):
+    """
+    Run the block against a freshly migrated throwaway database.
+
+    This is the same test database the test runner creates, so a benchmark
+    never touches the configured database's data.
+    """
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def timed(func, *args, **kwargs) -> tuple[float, object]:
+    """Return the wall time in milliseconds and the result of a call."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    """Return the mean and p50/p95/p99 of a list of timings."""
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return {"mean": value, "p50": value, "p95": value, "p99": value}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "mean": statistics.fmean(samples),
+        "p50": cuts[49],
+        "p95": cuts[94],
+        "p99": cuts[98],
+    }
+
+
+def http_load(
+    address: tuple[str, int],
+    path: str,
+    concurrency: int,
+    duration: float,
+    headers: dict[str, str] | None = None,
+) -> dict:
+    """
+    GET `path` from `concurrency` keep-alive connections for `duration` seconds.
+
+    Returns the throughput, the latency percentiles in milliseconds, and how
+    many requests failed or answered with an error status.
+    """
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        connection = http.client.HTTPConnection(*address, timeout=60)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                connection.request("GET", path, headers=headers or {})
+                response = connection.getresponse()
+                response.read()
+                ok = response.status < 400
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                ok = False
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += not ok
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / wall,
+        "ms": summarize(latencies),
+    }
+
+
+def _insert(model, rows: Iterable, batch_size: int) -> Iterator:
+    """Insert rows in batches, yielding each saved row, without listing them all."""
+    # bulk_create(batch_size=...) would first turn the whole iterable into a list
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, batch_size)):
+        yield from model.objects.bulk_create(batch)
+
+
+def _insert_pairs(model, columns: tuple[str, str], pairs: Iterable, batch_size: int):
+    """Insert two-column rows with executemany, skipping model instances."""
+    # Building a model per follow or like would cost more than inserting it
+    qn = connection.ops.quote_name
+    sql = (
+        f"INSERT INTO {qn(model._meta.db_table)} "
+        f"({qn(columns[0])}, {qn(columns[1])}) VALUES (%s, %s)"
+    )
+    pairs = iter(pairs)
+    while batch := list(itertools.islice(pairs, batch_size)):
+        # One transaction per batch, not per row as autocommit would do
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+
+
+def _cum_weights(count: int, alpha: float) -> list[float]:
+    """Return cumulative power-law weights, highest for rank 0."""
+    return list(itertools.accumulate(1 / (rank + 1) ** alpha for rank in range(count)))
+
+
+def _heavy_tailed(rng: random.Random, mean: int, cap: int) -> int:
+    """Return a Pareto-distributed count averaging about `mean`, capped."""
+    # Pareto(1.5) has mean 3
+    return min(cap, int(rng.paretovariate(1.5) * mean / 3))
+
+
+def vocabulary(size: int = VOCABULARY_SIZE, seed: int = 0) -> list[str]:
+    """Return `size` distinct made-up words, the most common first."""
+    rng = random.Random(seed)
+    syllables = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+    words = {}
+    while len(words) < size:
+        words["".join(rng.choices(syllables, k=rng.randint(2, 4)))] = None
+    return list(words)
+
+
+def synthetic_texts(count: int, words: list[str], rng: random.Random) -> Iterator:
+    """Yield `count` post texts whose words follow Zipf's law, like real text."""
+    weights = _cum_weights(len(words), 1.0)
+    for _ in range(count):
+        yield " ".join(rng.choices(words, cum_weights=weights, k=rng.randint(5, 20)))
+
+
+def power_law_graph(
+    num_users: int,
+    posts_per_user: int,
+    mean_follows: int,
+    alpha: float = 1.2,
+    seed: int = 0,
+    batch_size: int = 1000,
+    mean_likes: int = 0,
+    like_alpha: float = 1.2,
+    prefix: str = "user",
+    password: str = "!",
+) -> list[int]:
+    """
+    Bulk-insert users, posts, follows and likes with power-law popularity.
+
+    User `i` is followed with probability proportional to `1 / (i + 1) **
+    alpha`, so a handful of accounts collect most of the followers. Posts are
+    liked the same way with `like_alpha`, ranked in a random order. How many
+    users each user follows, and how many posts each likes, is heavy-tailed
+    too. Returns the user ids in popularity order.
+
+    Rows are streamed in batches, so memory stays bounded by a few integers per
+    user and post however many follows and likes are generated. `password` is
+    stored as is, so pass a hash. Post texts are drawn from `vocabulary()`.
+    Rows go through `bulk_create`, so no signals fire and no timelines are
+    built; the counters are reconciled at the end.
+    """
+    rng = random.Random(seed)
+    user_ids = [
+        user.pk
+        for user in _insert(
+            User,
+            (
+                User(username=f"{prefix}{i}", password=password)
+                for i in range(num_users)
+            ),
+            batch_size,
+        )
+    ]
+    user_weights = _cum_weights(num_users, alpha)
+
+    def follows():
+        for follower_id in user_ids:
+            count = _heavy_tailed(rng, mean_follows, num_users - 1)
+            picks = rng.choices(user_ids, cum_weights=user_weights, k=count)
+            for followee_id in set(picks) - {follower_id}:
+                yield follower_id, followee_id
+
+    _insert_pairs(Follow, ("from_user_id", "to_user_id"), follows(), batch_size)
+    # Authors are picked at random, so each one's posts interleave in time
+    post_ids, author_ids = array("q"), array("q")
+    texts = synthetic_texts(num_users * posts_per_user, vocabulary(seed=seed), rng)
+    posts = (Post(user_id=rng.choice(user_ids), text=text) for text in texts)
+    for post in _insert(Post, posts, batch_size):
+        post_ids.append(post.pk)
+        author_ids.append(post.user_id)
+    if mean_likes and post_ids:
+        ranking = array("q", range(len(post_ids)))
+        rng.shuffle(ranking)
+        post_weights = _cum_weights(len(post_ids), like_alpha)
+
+        def likes():
+            for user_id in user_ids:
+                count = _heavy_tailed(rng, mean_likes, len(post_ids))
+                picks = rng.choices(ranking, cum_weights=post_weights, k=count)
+                for index in set(picks):
+                    # The database rejects likes of one's own posts
+                    if author_ids[index] != user_id:
+                        yield post_ids[index], user_id
+
+        _insert_pairs(Like, ("post_id", "user_id"), likes(), batch_size)
+    # bulk_create skips the signals that maintain the counters
+    reconcile_follow_counts(batch_size)
+    reconcile_like_counts(batch_size)
+    return user_ids
+
+
+def regressions(baseline: dict, current: dict, tolerance: float = 0.25) -> list[str]:
+    """
+    Compare two `benchmark_views` results and describe each regression.
+
+    A view regresses when it runs more queries per request than before, or
+    when its p95 latency grew by more than `tolerance` (0.25 is 25%). Query
+    counts are exact, so any increase is reported. Scales or views missing
+    from either side are skipped.
+    """
+    found = []
+    for scale, result in current["scales"].items():
+        before = baseline["scales"].get(scale)
+        if before is None:
+            continue
+        for view, stats in result["views"].items():
+            old = before["views"].get(view)
+            if old is None:
+                continue
+            if stats["queries"]["max"] > old["queries"]["max"]:
+                found.append(
+                    f"{view} @ {scale} posts: {old['queries']['max']} -> "
+                    f"{stats['queries']['max']} queries"
+                )
+            if stats["ms"]["p95"] > old["ms"]["p95"] * (1 + tolerance):
+                found.append(
+                    f"{view} @ {scale} posts: p95 {old['ms']['p95']:.2f} -> "
+                    f"{stats['ms']['p95']:.2f} ms"
+                )
+    return found
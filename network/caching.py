@@ -0,0 +1,298 @@
+"""
+Caches for rendered post cards and anonymous feed pages.
+
+A card body (text, timestamp, author link and edited marker) only changes when
+the post is edited, so it is cached under the post's id and `version`. Editing
+bumps the version, which moves readers to a fresh key, and the old key is
+deleted eagerly so it does not sit in the cache until it expires.
+
+Whole feed pages are cached for logged-out visitors, who all see the same HTML,
+when the cache is shared by every worker (`CACHE_SHARED`).
+Each cached page is registered under the posts it shows so an edit can purge
+exactly those pages, and a new post purges the first pages it appears on.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter
+from functools import wraps
+from inspect import iscoroutinefunction
+from typing import TYPE_CHECKING
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from . import metrics
+from .pagination import decode_cursor
+
+if TYPE_CHECKING:
+    from django.http import HttpRequest
+
+    from .models import Post
+
+DEFAULT_CARD_TIMEOUT = 60 * 60
+DEFAULT_PAGE_TIMEOUT = 30
+# How long a stale page may still be served while one worker regenerates it
+PAGE_GRACE = 60
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 0.05
+LOCK_POLLS = 20
+
+# Per-process hit/miss counters, see `card_stats()` and `page_stats()`
+_stats = Counter()
+
+
+def _count(cache_name: str, result: str) -> None:
+    """Count a cache lookup in this process and in the Prometheus metrics."""
+    _stats[f"{cache_name}_{result}"] += 1
+    metrics.CACHE_LOOKUPS.labels(cache_name, result).inc()
+
+
+def card_key(post: Post, version: int, show_user: bool) -> str:
+    """Return the cache key of one rendering of a card body."""
+    # The timestamp keeps keys unique should ids be reused, e.g. after a flush
+    stamp = int(post.created.timestamp() * 1_000_000)
+    return f"post-card:{post.pk}:{stamp}:{version}:{int(show_user)}"
+
+
+def get_card(post: Post, show_user: bool) -> str | None:
+    """Return a cached card body, counting the hit or miss."""
+    html = cache.get(card_key(post, post.version, show_user))
+    _count("card", "hits" if html is not None else "misses")
+    return html
+
+
+def set_card(post: Post, show_user: bool, html: str) -> None:
+    """Cache a rendered card body."""
+    timeout = getattr(settings, "POST_CARD_CACHE_TIMEOUT", DEFAULT_CARD_TIMEOUT)
+    cache.set(card_key(post, post.version, show_user), html, timeout)
+
+
+def invalidate_card(post: Post, version: int) -> None:
+    """Drop both renderings of a card body at an outdated version."""
+    cache.delete_many([card_key(post, version, show) for show in (True, False)])
+
+
+def _ratio(hits: int, misses: int) -> dict[str, float]:
+    """Return hits, misses and the hit ratio."""
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / lookups if lookups else 0.0,
+    }
+
+
+def card_stats() -> dict[str, float]:
+    """Return this process's card cache hits, misses and hit ratio."""
+    return _ratio(_stats["card_hits"], _stats["card_misses"])
+
+
+def page_stats() -> dict[str, float]:
+    """Return this process's page cache hits, misses and stale serves."""
+    stats = _ratio(_stats["page_hits"] + _stats["page_stale"], _stats["page_misses"])
+    stats["stale"] = _stats["page_stale"]
+    return stats
+
+
+def reset_stats() -> None:
+    """Zero this process's cache counters."""
+    _stats.clear()
+
+
+def page_cache_enabled() -> bool:
+    """
+    Return whether anonymous pages may be cached.
+
+    A purge only reaches the cache it runs against, so with a cache per worker
+    the other workers would keep serving pages a write made stale, and the
+    stampede lock would only hold within one worker.
+    """
+    return getattr(settings, "CACHE_SHARED", False)
+
+
+def page_key(path: str, cursor: str = "") -> str:
+    """Return the cache key of an anonymous page."""
+    return f"page:{path}?{cursor}"
+
+
+def _request_page_key(request: HttpRequest) -> str | None:
+    """
+    Return the page key for a request, or None if it must not be cached.
+
+    Only logged-out GETs of the first page or of an older cursor page are
+    cached, and only in a cache all workers share. Offset `?page=` pages and
+    newer (backward) cursor pages shift whenever a post is written, so no
+    single purge could keep them correct.
+    """
+    if request.method != "GET" or request.user.is_authenticated:
+        return None
+    if "page" in request.GET or not page_cache_enabled():
+        return None
+    decoded = decode_cursor(request.GET.get("cursor"))
+    if decoded is None:
+        # Missing or malformed cursors both render the first page
+        return page_key(request.path)
+    if decoded[0]:
+        return None
+    return page_key(request.path, request.GET["cursor"])
+
+
+def _page_timeout() -> int:
+    """Return how many seconds a cached page is fresh."""
+    return getattr(settings, "ANON_PAGE_CACHE_TIMEOUT", DEFAULT_PAGE_TIMEOUT)
+
+
+def _replay(request: HttpRequest, entry: dict) -> HttpResponse:
+    """Rebuild a response from a cached page, or a 304 if the client has it."""
+    response = HttpResponse(entry["content"], content_type=entry["content_type"])
+    for header, value in entry["validators"].items():
+        response[header] = value
+    return get_conditional_response(
+        request,
+        etag=response.get("ETag"),
+        last_modified=parse_http_date_safe(response.get("Last-Modified")),
+        response=response,
+    )
+
+
+def _store_page(key: str, response, started: float) -> None:
+    """Cache a rendered page and register it under the posts it shows."""
+    # A purge that landed while this page rendered means it may be stale
+    purged = cache.get(f"{key}:purged")
+    if purged is not None and purged >= started:
+        return
+    timeout = _page_timeout()
+    cache.set(
+        key,
+        {
+            "content": response.content,
+            "content_type": response["Content-Type"],
+            "validators": {
+                header: response[header]
+                for header in ("ETag", "Last-Modified")
+                if response.has_header(header)
+            },
+            "fresh_until": time.time() + timeout,
+        },
+        timeout + PAGE_GRACE,
+    )
+    page = (getattr(response, "context_data", None) or {}).get("page", ())
+    registries = {f"post-pages:{post.pk}": post.pk for post in page}
+    current = cache.get_many(registries)
+    cache.set_many(
+        {name: current.get(name, set()) | {key} for name in registries},
+        timeout + PAGE_GRACE,
+    )
+
+
+def cache_anonymous_page(view):
+    """
+    Serve a view's logged-out pages from the cache.
+
+    The view must return a `TemplateResponse` whose context holds the `page`.
+    Once a page goes stale, the first worker to notice takes a lock and
+    regenerates it while the others keep serving the stale copy, so an
+    expired front page causes one render rather than a stampede. A worker
+    finding no copy at all waits briefly for the lock holder's result.
+    Async views must have `request.user` loaded already.
+    """
+
+    if iscoroutinefunction(view):
+        return _acache_anonymous_page(view)
+
+    @wraps(view)
+    def wrapper(request: HttpRequest, *args, **kwargs):
+        key = _request_page_key(request)
+        if key is None:
+            return view(request, *args, **kwargs)
+        entry = cache.get(key)
+        if entry is not None and entry["fresh_until"] > time.time():
+            _count("page", "hits")
+            return _replay(request, entry)
+        lock = f"{key}:lock"
+        if not cache.add(lock, 1, LOCK_TIMEOUT):
+            if entry is not None:
+                _count("page", "stale")
+                return _replay(request, entry)
+            for _ in range(LOCK_POLLS):
+                time.sleep(LOCK_WAIT)
+                if (entry := cache.get(key)) is not None:
+                    _count("page", "hits")
+                    return _replay(request, entry)
+        _count("page", "misses")
+        started = time.time()
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, "render"):
+                response.render()
+            if response.status_code == 200:
+                _store_page(key, response, started)
+        finally:
+            cache.delete(lock)
+        return response
+
+    return wrapper
+
+
+def _acache_anonymous_page(view):
+    """Async version of `cache_anonymous_page`."""
+
+    @wraps(view)
+    async def wrapper(request: HttpRequest, *args, **kwargs):
+        key = _request_page_key(request)
+        if key is None:
+            return await view(request, *args, **kwargs)
+        entry = await cache.aget(key)
+        if entry is not None and entry["fresh_until"] > time.time():
+            _count("page", "hits")
+            return _replay(request, entry)
+        lock = f"{key}:lock"
+        if not await cache.aadd(lock, 1, LOCK_TIMEOUT):
+            if entry is not None:
+                _count("page", "stale")
+                return _replay(request, entry)
+            for _ in range(LOCK_POLLS):
+                await asyncio.sleep(LOCK_WAIT)
+                if (entry := await cache.aget(key)) is not None:
+                    _count("page", "hits")
+                    return _replay(request, entry)
+        _count("page", "misses")
+        started = time.time()
+        try:
+            response = await view(request, *args, **kwargs)
+            # Templates may still run queries, which must not block the loop
+            if hasattr(response, "render"):
+                await sync_to_async(response.render)()
+            if response.status_code == 200:
+                await sync_to_async(_store_page)(key, response, started)
+        finally:
+            await cache.adelete(lock)
+        return response
+
+    return wrapper
+
+
+def purge_pages(keys) -> None:
+    """Drop cached pages, and keep renders already in flight from restoring them."""
+    keys = list(keys)
+    cache.delete_many(keys)
+    cache.set_many({f"{key}:purged": time.time() for key in keys}, LOCK_TIMEOUT)
+
+
+def purge_first_pages(*paths: str) -> None:
+    """Drop the cached first pages of the given feeds."""
+    purge_pages(page_key(path) for path in paths)
+
+
+def purge_post_pages(post_id: int) -> None:
+    """Drop every cached page showing a post."""
+    registry = f"post-pages:{post_id}"
+    purge_pages(cache.get(registry, ()))
+    cache.delete(registry)
@@ -0,0 +1,142 @@
+"""
+ETag and Last-Modified validators for the feeds, computed without rendering.
+
+Every write that changes what a feed shows (a new post, an edit, a like)
+stamps `Post.modified`, so the newest `(modified, id)` pair is a watermark for
+the whole post table, read with one index seek. The Following feed adds the
+viewer's `graph_version`, and profiles add their header counters. A client
+holding a matching ETag gets a 304 before the feed query or template runs.
+
+Last-Modified is only sent for the logged-out All Posts feed. A date cannot
+carry the viewer, their follow graph or a profile's counters, so anywhere else
+a client revalidating with If-Modified-Since alone could get a stale 304.
+Deleting a post stamps another one (see network/signals.py) so the watermark
+moves past it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from functools import wraps
+from inspect import iscoroutinefunction
+from typing import TYPE_CHECKING
+
+from asgiref.sync import sync_to_async
+from django.db.models import OuterRef, Subquery
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+
+from .models import Post, User
+
+if TYPE_CHECKING:
+    from datetime import datetime
+
+    from django.http import HttpRequest
+
+
+def _latest(posts) -> tuple[datetime, int] | None:
+    """Return the `(modified, id)` of the most recently changed post."""
+    return posts.order_by("-modified", "-id").values_list("modified", "id").first()
+
+
+def _viewer(request: HttpRequest) -> str:
+    """Return what a page depends on about whoever is viewing it."""
+    if not request.user.is_authenticated:
+        return "anonymous"
+    # Pages embed a token derived from the CSRF secret, which rotates on login;
+    # get_token() creates the secret now if this request has none yet
+    get_token(request)
+    secret = hashlib.sha256(request.META["CSRF_COOKIE"].encode())
+    return f"{request.user.pk}:{secret.hexdigest()[:16]}"
+
+
+def _posts_state(request: HttpRequest) -> tuple | None:
+    """Return the validator state of the All Posts feed."""
+    latest = _latest(Post.objects.all())
+    return (latest[0], latest) if latest else (None, None)
+
+
+def _following_state(request: HttpRequest) -> tuple | None:
+    """Return the validator state of the viewer's Following feed."""
+    if not request.user.is_authenticated:
+        return None
+    latest = _latest(Post.objects.all())
+    return (latest[0] if latest else None, (latest, request.user.graph_version))
+
+
+def _profile_state(request: HttpRequest, username: str) -> tuple | None:
+    """Return the validator state of a profile, header included, in one query."""
+    posts = Post.objects.filter(user=OuterRef("pk")).order_by("-modified", "-id")
+    row = (
+        User.objects.filter(username=username)
+        .annotate(
+            last_modified=Subquery(posts.values("modified")[:1]),
+            last_id=Subquery(posts.values("id")[:1]),
+        )
+        .values_list(
+            "last_modified", "last_id", "pk", "follower_count", "following_count"
+        )
+        .first()
+    )
+    if row is None:
+        # Let the view answer 404 for unknown users
+        return None
+    # Following or unfollowing anyone bumps the viewer's graph version, which
+    # covers the Follow/Unfollow button without probing the follows table
+    return row[0], (row, getattr(request.user, "graph_version", None))
+
+
+def _state(request: HttpRequest, feed: str, kwargs: dict) -> tuple | None:
+    """Compute `(last_modified, etag_parts)` once per request."""
+    if not hasattr(request, "_feed_state"):
+        states = {
+            "posts": _posts_state,
+            "following": _following_state,
+            "profile": _profile_state,
+        }
+        request._feed_state = states[feed](request, **kwargs)
+    return request._feed_state
+
+
+def conditional_feed(feed: str):
+    """
+    Answer conditional GETs of a feed view with 304 when nothing changed.
+
+    `feed` is "posts", "following" or "profile". The ETag covers the feed's
+    watermark, the viewer and the query string, so each cursor page and each
+    viewer gets its own validator. Clients that send both validators are
+    matched on the ETag, which is the complete one; only logged-out All Posts
+    pages also get a Last-Modified. Async views must have
+    `request.user` loaded already.
+    """
+
+    def etag(request: HttpRequest, **kwargs) -> str | None:
+        state = _state(request, feed, kwargs)
+        if state is None:
+            return None
+        parts = (feed, state[1], _viewer(request), request.GET.urlencode())
+        return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+    def last_modified(request: HttpRequest, **kwargs) -> datetime | None:
+        if feed != "posts" or request.user.is_authenticated:
+            return None
+        state = _state(request, feed, kwargs)
+        return state[0] if state else None
+
+    conditional = condition(etag_func=etag, last_modified_func=last_modified)
+
+    def decorator(view):
+        if not iscoroutinefunction(view):
+            return conditional(view)
+        wrapped = conditional(view)
+
+        @wraps(view)
+        async def wrapper(request: HttpRequest, **kwargs):
+            # The validators are called synchronously; compute their state
+            # off the event loop first so they only read it
+            await sync_to_async(_state)(request, feed, kwargs)
+            return await wrapped(request, **kwargs)
+
+        return wrapper
+
+    return decorator
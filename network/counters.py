@@ -0,0 +1,229 @@
+"""Maintain and reconcile the denormalized counter columns."""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.constants import OnConflict
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .models import Follow, Like, Post, User
+
+BATCH_SIZE = 10_000
+
+
+def _count_subquery(through, column: str) -> Coalesce:
+    """Return an expression counting each outer row's rows in `through`."""
+    counts = (
+        through.objects.filter(**{column: OuterRef("pk")})
+        .order_by()
+        .values(column)
+        .annotate(total=Count("*"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def _like_count_subquery() -> Coalesce:
+    """Return an expression counting each post's rows in the likes table."""
+    return _count_subquery(Like, "post_id")
+
+
+def _follow_count_subqueries() -> dict[str, Coalesce]:
+    """Return expressions counting each user's rows in the follows table."""
+    return {
+        "follower_count": _count_subquery(Follow, "to_user_id"),
+        "following_count": _count_subquery(Follow, "from_user_id"),
+    }
+
+
+def add_likes(post_ids: Iterable[int], amount: int = 1) -> int:
+    """Atomically add `amount` to the like counter of each post."""
+    return Post.objects.filter(pk__in=list(post_ids)).update(
+        like_count=Greatest(F("like_count") + amount, 0), modified=timezone.now()
+    )
+
+
+def recount_likes(post_ids: Iterable[int]) -> int:
+    """Recount the likes of the given posts from the likes table."""
+    return Post.objects.filter(pk__in=list(post_ids)).update(
+        like_count=_like_count_subquery(), modified=timezone.now()
+    )
+
+
+def add_follows(follower_ids: set[int], followee_ids: set[int]) -> None:
+    """Atomically count new follows from every follower to every followee."""
+    User.objects.filter(pk__in=follower_ids).update(
+        following_count=F("following_count") + len(followee_ids),
+        graph_version=F("graph_version") + 1,
+    )
+    User.objects.filter(pk__in=followee_ids).update(
+        follower_count=F("follower_count") + len(follower_ids)
+    )
+
+
+def recount_follows(user_ids: Iterable[int]) -> int:
+    """Recount both follow counters of the given users from the follows table."""
+    return User.objects.filter(pk__in=list(user_ids)).update(
+        **_follow_count_subqueries()
+    )
+
+
+def bump_graph_versions(follower_ids: Iterable[int]) -> int:
+    """Mark the given users' Following feeds as changed."""
+    return User.objects.filter(pk__in=list(follower_ids)).update(
+        graph_version=F("graph_version") + 1
+    )
+
+
+def _set_row(through, values: dict[str, int], present: bool) -> bool:
+    """
+    Insert or delete one through-table row, returning whether it changed.
+
+    The insert ignores conflicts and both statements report their row count,
+    so repeating a request is harmless and no read is needed first. A change
+    sends `post_save` or `post_delete` for the row, as the ORM would.
+    """
+    qn = connection.ops.quote_name
+    table = qn(through._meta.db_table)
+    columns = list(values)
+    with connection.cursor() as cursor:
+        if present:
+            cursor.execute(
+                f"{connection.ops.insert_statement(OnConflict.IGNORE)} {table} "
+                f"({', '.join(map(qn, columns))}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))}) "
+                + connection.ops.on_conflict_suffix_sql(
+                    [], OnConflict.IGNORE, None, None
+                ),
+                list(values.values()),
+            )
+        else:
+            cursor.execute(
+                f"DELETE FROM {table} "
+                f"WHERE {' AND '.join(f'{qn(column)} = %s' for column in columns)}",
+                list(values.values()),
+            )
+        changed = cursor.rowcount == 1
+    if changed:
+        row = through(**values)
+        if present:
+            post_save.send(
+                sender=through, instance=row, created=True, using=connection.alias
+            )
+        else:
+            post_delete.send(
+                sender=through, instance=row, using=connection.alias, origin=row
+            )
+    return changed
+
+
+def _add_returning(model, pk: int, column: str, amount: int, **values) -> int:
+    """
+    Add `amount` to a counter column, and set any other `values`, in one UPDATE
+    that returns the new count where the database supports RETURNING.
+
+    The count never drops below 0, so a counter that drifted low does not turn
+    a removal into a constraint violation.
+    """
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    where = f"{qn(model._meta.pk.column)} = %s"
+    count = f"{qn(column)} + %s"
+    sets = [f"{qn(column)} = CASE WHEN {count} > 0 THEN {count} ELSE 0 END"]
+    sets += [f"{qn(name)} = %s" for name in values]
+    params = [amount, amount, *values.values(), pk]
+    sql = f"UPDATE {table} SET {', '.join(sets)} WHERE {where}"
+    with connection.cursor() as cursor:
+        if connection.vendor in ("postgresql", "sqlite") and (
+            connection.features.can_return_columns_from_insert
+        ):
+            cursor.execute(f"{sql} RETURNING {qn(column)}", params)
+        else:
+            cursor.execute(sql, params)
+            cursor.execute(f"SELECT {qn(column)} FROM {table} WHERE {where}", [pk])
+        return cursor.fetchone()[0]
+
+
+def set_like(post: Post, user_id: int, liked: bool) -> tuple[bool, int]:
+    """
+    Like or unlike a post, returning whether that changed anything and its count.
+
+    One INSERT (ignoring conflicts) or DELETE, then, only if a row changed, one
+    UPDATE ... RETURNING of the counter; both in a single transaction.
+    """
+    with transaction.atomic():
+        changed = _set_row(Like, {"post_id": post.pk, "user_id": user_id}, liked)
+        if not changed:
+            return False, post.like_count
+        modified = connection.ops.adapt_datetimefield_value(timezone.now())
+        return True, _add_returning(
+            Post, post.pk, "like_count", 1 if liked else -1, modified=modified
+        )
+
+
+def set_follow(follower_id: int, followee: User, following: bool) -> tuple[bool, int]:
+    """
+    Follow or unfollow a user, returning whether that changed anything and the
+    followee's follower count.
+
+    Same shape as `set_like`, plus the follower's own counter and graph version.
+    """
+    with transaction.atomic():
+        changed = _set_row(
+            Follow, {"from_user_id": follower_id, "to_user_id": followee.pk}, following
+        )
+        if not changed:
+            return False, followee.follower_count
+        amount = 1 if following else -1
+        User.objects.filter(pk=follower_id).update(
+            following_count=Greatest(F("following_count") + amount, 0),
+            graph_version=F("graph_version") + 1,
+        )
+        return True, _add_returning(User, followee.pk, "follower_count", amount)
+
+
+def _reconcile(model, counters: dict, batch_size: int, dry_run: bool) -> int:
+    """
+    Find and repair rows whose counter columns drifted from their tables.
+
+    Walks the table in primary-key ranges so each statement touches a bounded
+    number of rows. Returns how many rows were (or would be) repaired.
+    """
+    repaired = 0
+    last_pk = 0
+    drift = Q()
+    for field in counters:
+        drift |= ~Q(**{field: F(f"actual_{field}")})
+    while True:
+        pks = list(
+            model.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not pks:
+            return repaired
+        drifted = list(
+            model.objects.filter(pk__gte=pks[0], pk__lte=pks[-1])
+            .annotate(**{f"actual_{field}": expr for field, expr in counters.items()})
+            .filter(drift)
+            .values_list("pk", flat=True)
+        )
+        if drifted and not dry_run:
+            model.objects.filter(pk__in=drifted).update(**counters)
+        repaired += len(drifted)
+        last_pk = pks[-1]
+
+
+def reconcile_like_counts(batch_size: int = BATCH_SIZE, dry_run: bool = False) -> int:
+    """Repair posts whose like counter drifted from the likes table."""
+    return _reconcile(Post, {"like_count": _like_count_subquery()}, batch_size, dry_run)
+
+
+def reconcile_follow_counts(batch_size: int = BATCH_SIZE, dry_run: bool = False) -> int:
+    """Repair users whose follow counters drifted from the follows table."""
+    return _reconcile(User, _follow_count_subqueries(), batch_size, dry_run)
@@ -0,0 +1,282 @@
+"""
+Hybrid fan-out timelines that back the Following feed.
+
+Posts are pushed into each follower's materialized timeline when they are
+written, except for celebrities: authors with at least
+`settings.FEED_CELEBRITY_THRESHOLD` followers. Their posts are pulled at read
+time and merged into the timeline with a heap-based k-way merge on
+`(created, id)`, so one post never costs hundreds of thousands of inserts.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+from typing import TYPE_CHECKING, Iterable
+
+from django.conf import settings
+
+from .models import Follow, Post, TimelineEntry, User
+from .pagination import CursorPaginator, seek
+
+if TYPE_CHECKING:
+    from django.db.models import QuerySet
+
+BATCH_SIZE = 1000
+DEFAULT_CELEBRITY_THRESHOLD = 10_000
+
+
+def _insert(entries: Iterable[TimelineEntry], batch_size: int = BATCH_SIZE) -> int:
+    """Insert timeline entries in batches, skipping ones that already exist."""
+    total = 0
+    entries = iter(entries)
+    while batch := list(itertools.islice(entries, batch_size)):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        total += len(batch)
+    return total
+
+
+def merge_streams(streams: Iterable[Iterable[tuple]], reverse: bool = True):
+    """
+    Lazily k-way merge sorted `(created, id)` streams with a heap.
+
+    Each stream must already be sorted in the requested direction. A post that
+    shows up in more than one stream, e.g. in a timeline from before its author
+    became a celebrity, is yielded once.
+    """
+    merged = heapq.merge(*streams, reverse=reverse)
+    return (key for key, _ in itertools.groupby(merged))
+
+
+class FeedEngine:
+    """
+    Fan posts out on write, except for celebrities, and merge on read.
+
+    A threshold of 0 makes every author a celebrity (pure fan-out-on-read) and
+    `float("inf")` makes none of them one (pure fan-out-on-write).
+    """
+
+    def __init__(self, threshold: float | None = None):
+        self._threshold = threshold
+
+    @property
+    def threshold(self) -> float:
+        """Return the follower count at which an author stops being fanned out."""
+        if self._threshold is not None:
+            return self._threshold
+        return getattr(
+            settings, "FEED_CELEBRITY_THRESHOLD", DEFAULT_CELEBRITY_THRESHOLD
+        )
+
+    def celebrity_ids(self, author_ids: Iterable[int] | None = None) -> set[int]:
+        """
+        Return which of `author_ids` are read-time merged celebrities.
+
+        With no `author_ids`, return every celebrity.
+        """
+        if self.threshold == float("inf"):
+            return set()
+        authors = User.objects.all()
+        if author_ids is not None:
+            author_ids = list(author_ids)
+            if self.threshold <= 0:
+                return set(author_ids)
+            authors = authors.filter(pk__in=author_ids)
+        if self.threshold > 0:
+            authors = authors.filter(follower_count__gte=self.threshold)
+        return set(authors.values_list("pk", flat=True))
+
+    def publish(self, post: Post, batch_size: int = BATCH_SIZE) -> int:
+        """Copy a new post into its author's followers' timelines."""
+        if self.celebrity_ids([post.user_id]):
+            return 0
+        follower_ids = (
+            Follow.objects.filter(to_user_id=post.user_id)
+            .values_list("from_user_id", flat=True)
+            .iterator(chunk_size=batch_size)
+        )
+        return _insert(
+            (
+                TimelineEntry(
+                    owner_id=follower_id,
+                    post_id=post.pk,
+                    author_id=post.user_id,
+                    created=post.created,
+                )
+                for follower_id in follower_ids
+            ),
+            batch_size,
+        )
+
+    def follow(
+        self, owner_id: int, author_ids: Iterable[int], batch_size: int = BATCH_SIZE
+    ) -> int:
+        """Backfill a timeline with the posts of newly followed authors."""
+        author_ids = set(author_ids)
+        return self._backfill(
+            owner_id, author_ids - self.celebrity_ids(author_ids), batch_size
+        )
+
+    def unfollow(self, owner_id: int, author_ids: Iterable[int] | None = None) -> int:
+        """Prune the posts of unfollowed authors, or every post, from a timeline."""
+        entries = TimelineEntry.objects.filter(owner_id=owner_id)
+        if author_ids is not None:
+            entries = entries.filter(author_id__in=list(author_ids))
+        return entries.delete()[0]
+
+    def demote_crossed(self, removed: dict[int, int]) -> int:
+        """
+        Fan out authors who just dropped below the threshold.
+
+        `removed` maps author ids to how many followers they just lost. Posts
+        they wrote as celebrities were never fanned out, so once their reads
+        stop being merged those posts are pushed to the remaining followers.
+        """
+        if not removed or not 0 < self.threshold < float("inf"):
+            return 0
+        counts = dict(
+            User.objects.filter(pk__in=removed).values_list("pk", "follower_count")
+        )
+        total = 0
+        for author_id, lost in removed.items():
+            remaining = counts.get(author_id, 0)
+            if remaining < self.threshold <= remaining + lost:
+                total += self.demote(author_id)
+        return total
+
+    def demote(self, author_id: int, batch_size: int = BATCH_SIZE) -> int:
+        """Push all of an author's posts into every follower's timeline."""
+        follower_ids = Follow.objects.filter(to_user_id=author_id).values_list(
+            "from_user_id", flat=True
+        )
+        return sum(
+            self._backfill(follower_id, [author_id], batch_size)
+            for follower_id in follower_ids.iterator(chunk_size=batch_size)
+        )
+
+    def rebuild(self, batch_size: int = BATCH_SIZE) -> int:
+        """
+        Discard every timeline and rebuild them all from the follow graph.
+
+        Run this after changing `FEED_CELEBRITY_THRESHOLD`.
+        """
+        TimelineEntry.objects.all().delete()
+        if self.threshold <= 0:
+            return 0
+        follows = Follow.objects.order_by("from_user_id").values_list(
+            "from_user_id", "to_user_id"
+        )
+        if self.threshold < float("inf"):
+            follows = follows.filter(to_user__follower_count__lt=self.threshold)
+        total = 0
+        for owner_id, rows in itertools.groupby(
+            follows.iterator(chunk_size=batch_size), key=lambda row: row[0]
+        ):
+            total += self._backfill(owner_id, [row[1] for row in rows], batch_size)
+        return total
+
+    def read(
+        self, owner: User, position=None, backward: bool = False, limit: int = 10
+    ) -> list[tuple]:
+        """
+        Return up to `limit` `(created, id)` keys from a user's Following feed.
+
+        The timeline is one index range scan; each followed celebrity adds one
+        more range scan over their own posts, and the streams are k-way merged.
+        """
+        celebrities = self.followed_celebrities(owner)
+        author_ids = list(celebrities) if celebrities is not None else []
+        streams = self._streams(owner, author_ids, position, backward, limit)
+        return list(itertools.islice(merge_streams(streams, not backward), limit))
+
+    async def aread(
+        self, owner: User, position=None, backward: bool = False, limit: int = 10
+    ) -> list[tuple]:
+        """Async version of `read`."""
+        celebrities = self.followed_celebrities(owner)
+        author_ids = [pk async for pk in celebrities] if celebrities is not None else []
+        streams = []
+        # Each stream is read whole before merging, at most `limit` rows
+        for stream in self._streams(owner, author_ids, position, backward, limit):
+            streams.append([row async for row in stream])
+        return list(itertools.islice(merge_streams(streams, not backward), limit))
+
+    def _streams(
+        self, owner: User, author_ids: list[int], position, backward: bool, limit: int
+    ) -> list[QuerySet]:
+        """Return the timeline and each followed celebrity's posts, as keysets."""
+        entries = TimelineEntry.objects.filter(owner=owner)
+        streams = [
+            seek(entries, position, backward, keys=("created", "post_id")).values_list(
+                "created", "post_id"
+            )[:limit]
+        ]
+        for author_id in sorted(author_ids):
+            posts = Post.objects.filter(user_id=author_id)
+            streams.append(
+                seek(posts, position, backward).values_list("created", "id")[:limit]
+            )
+        return streams
+
+    def followed_celebrities(self, owner: User | int) -> QuerySet | None:
+        """Return the ids of the celebrities a user follows, in one query."""
+        if self.threshold == float("inf"):
+            return None
+        followed = User.objects.filter(followers=owner)
+        if self.threshold > 0:
+            followed = followed.filter(follower_count__gte=self.threshold)
+        return followed.values_list("pk", flat=True)
+
+    def _backfill(
+        self, owner_id: int, author_ids: Iterable[int], batch_size: int
+    ) -> int:
+        """Insert every post by `author_ids` into one timeline."""
+        author_ids = list(author_ids)
+        if not author_ids:
+            return 0
+        posts = (
+            Post.objects.filter(user_id__in=author_ids)
+            .values_list("id", "user_id", "created")
+            .iterator(chunk_size=batch_size)
+        )
+        return _insert(
+            (
+                TimelineEntry(
+                    owner_id=owner_id, post_id=pk, author_id=user_id, created=created
+                )
+                for pk, user_id, created in posts
+            ),
+            batch_size,
+        )
+
+
+class TimelinePaginator(CursorPaginator):
+    """
+    Page through a user's Following feed as built by a `FeedEngine`.
+
+    The engine only returns `(created, id)` keys; the page's posts are then
+    loaded with one primary-key lookup through `queryset` so callers keep
+    their `select_related`/`prefetch_related`.
+    """
+
+    def __init__(
+        self, queryset: QuerySet, owner: User, engine: FeedEngine | None = None, **kw
+    ):
+        super().__init__(queryset, **kw)
+        self.owner = owner
+        self.engine = engine or FeedEngine()
+
+    def fetch(self, position, backward: bool, limit: int) -> list:
+        """Return up to `limit` feed posts strictly past `position`."""
+        post_ids = [
+            pk for _, pk in self.engine.read(self.owner, position, backward, limit)
+        ]
+        posts = self.queryset.in_bulk(post_ids)
+        return [posts[pk] for pk in post_ids if pk in posts]
+
+    async def afetch(self, position, backward: bool, limit: int) -> list:
+        """Async version of `fetch`."""
+        keys = await self.engine.aread(self.owner, position, backward, limit)
+        post_ids = [pk for _, pk in keys]
+        posts = await self.queryset.ain_bulk(post_ids)
+        return [posts[pk] for pk in post_ids if pk in posts]
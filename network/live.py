@@ -0,0 +1,288 @@
+"""
+Live "new posts" notifications, streamed to the feeds as Server-Sent Events.
+
+A new post is published, once its transaction commits, to an in-process
+broker: to the `posts` channel and to its author's channel. Each open stream
+subscribes to `posts` (All Posts) or to the channels of the authors its viewer
+follows (Following), and sends a batched `posts` event with how many new posts
+arrived and the newest few of them.
+
+Streams are served by `events_application`, a plain ASGI app that
+project4/asgi.py routes `/events/` to ahead of Django. Django's handler keeps
+a thread for each request until its response ends, which an endless stream
+never does, so only the viewer lookup at connect time leaves the event loop
+here. An idle stream is then one coroutine and one small `Subscription`.
+
+The broker is per process: with several workers, a stream only hears of posts
+written, and follows made, through its own worker. Follows reach it from the
+signals on the follows table, however they are made (see network/signals.py).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from collections import defaultdict, deque
+from http import HTTPStatus
+from http.cookies import SimpleCookie
+from importlib import import_module
+from typing import Iterable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.http import HttpRequest
+from django.http.request import split_domain_port, validate_host
+
+from . import metrics
+from .models import Follow
+
+PREFIX = "/events/"
+FEEDS = ("posts", "following")
+DEFAULT_HEARTBEAT = 15
+# Posts kept for the next event of a stream; the count is always exact
+MAX_PENDING = 20
+
+
+def heartbeat() -> float:
+    """Return the seconds between keep-alive comments on an idle stream."""
+    return getattr(settings, "LIVE_HEARTBEAT_SECONDS", DEFAULT_HEARTBEAT)
+
+
+class Subscription:
+    """One open stream: who is watching and what arrived since its last event."""
+
+    __slots__ = ("loop", "viewer_id", "channels", "count", "posts", "ready")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, viewer_id: int | None):
+        self.loop = loop
+        self.viewer_id = viewer_id
+        self.channels: set[str] = set()
+        self.count = 0
+        self.posts = deque(maxlen=MAX_PENDING)
+        self.ready = asyncio.Event()
+
+    def deliver(self, post: dict) -> None:
+        """Queue a new post for the next event; runs on the stream's loop."""
+        # Viewers already see their own posts, added by the compose form
+        if post["author_id"] == self.viewer_id:
+            return
+        self.count += 1
+        self.posts.append(post)
+        self.ready.set()
+
+    def take(self) -> dict:
+        """Return and forget what arrived since the last event."""
+        event = {"count": self.count, "posts": list(self.posts)}
+        self.count = 0
+        self.posts.clear()
+        self.ready.clear()
+        return event
+
+
+class Broker:
+    """Channels of subscriptions, published to from any thread."""
+
+    def __init__(self):
+        self._subscribers: dict[str, set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, subscription: Subscription, channels: Iterable[str]) -> None:
+        """Add a subscription to channels."""
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscription)
+                subscription.channels.add(channel)
+
+    def unsubscribe(
+        self, subscription: Subscription, channels: Iterable[str] | None = None
+    ) -> None:
+        """Remove a subscription from channels, by default from all of them."""
+        with self._lock:
+            for channel in list(
+                subscription.channels if channels is None else channels
+            ):
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+                subscription.channels.discard(channel)
+
+    def publish(self, channels: Iterable[str], post: dict) -> int:
+        """Deliver a post to every subscription of any of `channels`, once."""
+        with self._lock:
+            subscriptions = set().union(
+                *(self._subscribers.get(channel, ()) for channel in channels)
+            )
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.deliver, post)
+        return len(subscriptions)
+
+    def set_follow(self, viewer_id: int, author_id: int, following: bool) -> None:
+        """Start or stop sending an author's posts to a viewer's Following streams."""
+        with self._lock:
+            streams = list(self._subscribers.get(f"following:{viewer_id}", ()))
+        for subscription in streams:
+            if following:
+                self.subscribe(subscription, [f"author:{author_id}"])
+            else:
+                self.unsubscribe(subscription, [f"author:{author_id}"])
+
+    def streams(self) -> int:
+        """Return how many subscriptions are open in this process."""
+        with self._lock:
+            return len(set().union(*self._subscribers.values()))
+
+
+broker = Broker()
+
+
+def publish_post(post) -> int:
+    """Notify the All Posts streams and the author's followers of a new post."""
+    return broker.publish(
+        ["posts", f"author:{post.user_id}"],
+        {
+            "post_id": post.pk,
+            "author_id": post.user_id,
+            "username": post.user.username,
+            "created": post.created,
+        },
+    )
+
+
+def _load_viewer(session_key: str | None, feed: str) -> tuple[int | None, list[int]]:
+    """Return the viewer's id and, for the Following feed, whom they follow."""
+    try:
+        request = HttpRequest()
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore(
+            session_key
+        )
+        user = get_user(request)
+        if not user.is_authenticated:
+            return None, []
+        if feed != "following":
+            return user.pk, []
+        followed = Follow.objects.filter(from_user_id=user.pk)
+        return user.pk, list(followed.values_list("to_user_id", flat=True))
+    finally:
+        # Pool threads never see request_finished, which would close these
+        connections.close_all()
+
+
+def _event(name: str, data: dict) -> bytes:
+    """Return one Server-Sent Event."""
+    return (
+        f"event: {name}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n".encode()
+    )
+
+
+async def _respond(send, status: int, body: dict) -> None:
+    """Send a complete JSON response."""
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json")],
+        }
+    )
+    await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+
+async def _disconnected(receive) -> None:
+    """Return once the client has gone away."""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def stream(subscription: Subscription, send, receive) -> None:
+    """Send a subscription's events until the client disconnects."""
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                # Stop nginx and similar proxies from buffering the stream
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": b": open\n\n", "more_body": True})
+    gone = asyncio.ensure_future(_disconnected(receive))
+    try:
+        while not gone.done():
+            ready = asyncio.ensure_future(subscription.ready.wait())
+            await asyncio.wait(
+                {ready, gone}, timeout=heartbeat(), return_when=asyncio.FIRST_COMPLETED
+            )
+            ready.cancel()
+            if gone.done():
+                break
+            if ready.done():
+                chunk = _event("posts", subscription.take())
+            else:
+                # Lets proxies and the client see the idle stream is alive
+                chunk = b": keep-alive\n\n"
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    finally:
+        gone.cancel()
+
+
+def _allowed_host(scope) -> bool:
+    """Return whether the request's host is in `ALLOWED_HOSTS`, as Django checks."""
+    headers = dict(scope["headers"])
+    if b"host" in headers:
+        host = headers[b"host"].decode("latin-1")
+    elif scope.get("server"):
+        host = "%s:%s" % tuple(scope["server"])
+    else:
+        # Django's ASGI handler names an unknown server the same way
+        host = "unknown"
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = [".localhost", "127.0.0.1", "[::1]"]
+    domain, _ = split_domain_port(host)
+    return bool(domain) and validate_host(domain, allowed_hosts)
+
+
+async def events_application(scope, receive, send) -> None:
+    """Serve `/events/posts` and `/events/following` as Server-Sent Events."""
+    # Django's middleware never sees these requests, so check what it would
+    if not _allowed_host(scope):
+        return await _respond(send, HTTPStatus.BAD_REQUEST, {"error": "Bad host."})
+    feed = scope["path"][len(PREFIX) :]
+    if feed not in FEEDS:
+        return await _respond(send, HTTPStatus.NOT_FOUND, {"error": "Unknown feed."})
+    if scope["method"] != "GET":
+        return await _respond(
+            send, HTTPStatus.METHOD_NOT_ALLOWED, {"error": "GET request required."}
+        )
+    cookies = SimpleCookie()
+    for name, value in scope["headers"]:
+        if name == b"cookie":
+            cookies.load(value.decode("latin-1"))
+    session = cookies.get(settings.SESSION_COOKIE_NAME)
+    # Off the loop, on a pool thread that is free again once this returns
+    viewer_id, followed = await sync_to_async(_load_viewer, thread_sensitive=False)(
+        session.value if session else None, feed
+    )
+    if feed == "following" and viewer_id is None:
+        return await _respond(send, HTTPStatus.FORBIDDEN, {"error": "Log in first."})
+    if feed == "following":
+        channels = [f"following:{viewer_id}"]
+        channels += [f"author:{author_id}" for author_id in followed]
+    else:
+        channels = ["posts"]
+    subscription = Subscription(asyncio.get_running_loop(), viewer_id)
+    broker.subscribe(subscription, channels)
+    metrics.LIVE_STREAMS.inc()
+    try:
+        await stream(subscription, send, receive)
+    finally:
+        broker.unsubscribe(subscription)
+        metrics.LIVE_STREAMS.dec()
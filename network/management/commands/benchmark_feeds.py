@@ -0,0 +1,142 @@
+# network/management/commands/benchmark_feeds.py
+
+import json
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import reset_queries
+
+from network.benchmarks import power_law_graph, scratch_database, summarize, timed
+from network.feeds import FeedEngine
+from network.models import Follow, Post, TimelineEntry, User
+from network.pagination import seek
+
+STRATEGIES = ("pull", "push", "hybrid")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare fan-out-on-read, fan-out-on-write and hybrid Following feeds "
+        "on a synthetic power-law follow graph in a scratch database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--posts-per-user", type=int, default=20)
+        parser.add_argument("--mean-follows", type=int, default=50)
+        parser.add_argument("--alpha", type=float, default=1.2)
+        parser.add_argument(
+            "--threshold",
+            type=int,
+            default=None,
+            help="Hybrid celebrity threshold (default: 5%% of users)",
+        )
+        parser.add_argument("--samples", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        threshold = options["threshold"] or max(1, options["users"] // 20)
+        with scratch_database():
+            user_ids = power_law_graph(
+                options["users"],
+                options["posts_per_user"],
+                options["mean_follows"],
+                alpha=options["alpha"],
+                seed=options["seed"],
+            )
+            results = {
+                "dataset": {
+                    "users": len(user_ids),
+                    "posts": Post.objects.count(),
+                    "follows": Follow.objects.count(),
+                    "threshold": threshold,
+                },
+                "strategies": {},
+            }
+            for strategy in STRATEGIES:
+                results["strategies"][strategy] = self.run(
+                    strategy, threshold, user_ids, options
+                )
+        self.report(results)
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(results, f, indent=2)
+
+    def run(self, strategy: str, threshold: int, user_ids: list[int], options):
+        """Build one strategy's timelines, then time writes and reads."""
+        rng = random.Random(options["seed"])
+        engine = FeedEngine(
+            {"pull": 0, "push": float("inf"), "hybrid": threshold}[strategy]
+        )
+        build_ms, entries = timed(engine.rebuild)
+        # Writers are weighted like the follow graph, so celebrities post too
+        writers = rng.choices(
+            user_ids,
+            weights=[1 / (rank + 1) for rank in range(len(user_ids))],
+            k=options["samples"],
+        )
+        write_ms, written = [], []
+        for author_id in writers:
+            # bulk_create skips post_save, so only this engine fans out
+            (post,) = Post.objects.bulk_create(
+                [Post(user_id=author_id, text="Benchmark post")]
+            )
+            written.append(post.pk)
+            if strategy == "pull":
+                write_ms.append(0.0)
+            else:
+                write_ms.append(timed(engine.publish, post)[0])
+        read = self.pull_read if strategy == "pull" else engine.read
+        sample = rng.sample(user_ids, min(len(user_ids), options["samples"]))
+        first_ms, walk_ms = [], []
+        for reader in User.objects.filter(pk__in=sample):
+            elapsed, keys = timed(read, reader)
+            first_ms.append(elapsed)
+            if keys:
+                # Five more pages, following the last key of each page; the
+                # walk stops early at the end of a short feed
+                total, position = elapsed, keys[-1]
+                for _ in range(5):
+                    elapsed, keys = timed(read, reader, position)
+                    total += elapsed
+                    if not keys:
+                        break
+                    position = keys[-1]
+                walk_ms.append(total)
+            reset_queries()
+        timeline_rows = TimelineEntry.objects.count()
+        # Leave the dataset as it was for the next strategy
+        Post.objects.filter(pk__in=written).delete()
+        return {
+            "timeline_rows": timeline_rows,
+            "build_ms": build_ms,
+            "rebuild_rows": entries,
+            "publish_ms": summarize(write_ms),
+            "read_first_page_ms": summarize(first_ms),
+            # Time to read pages 1 through 6 in turn, not page 6 alone
+            "read_pages_1_to_6_ms": summarize(walk_ms),
+        }
+
+    @staticmethod
+    def pull_read(reader, position=None, limit=10):
+        """Read a page the way `views.following` did before timelines."""
+        posts = Post.objects.filter(user__in=reader.following.all())
+        return list(seek(posts, position).values_list("created", "id")[:limit])
+
+    def report(self, results):
+        """Write a one-line summary per strategy."""
+        dataset = results["dataset"]
+        self.stdout.write(
+            f"{dataset['users']} users, {dataset['posts']} posts, "
+            f"{dataset['follows']} follows, hybrid threshold {dataset['threshold']}"
+        )
+        for strategy, result in results["strategies"].items():
+            self.stdout.write(
+                f"{strategy:>6}: {result['timeline_rows']:>9} timeline rows | "
+                f"publish p50 {result['publish_ms']['p50']:7.2f} ms "
+                f"p99 {result['publish_ms']['p99']:8.2f} ms | "
+                f"read p50 {result['read_first_page_ms']['p50']:6.2f} ms "
+                f"p99 {result['read_first_page_ms']['p99']:7.2f} ms | "
+                f"pages 1-6 p50 {result['read_pages_1_to_6_ms']['p50']:6.2f} ms"
+            )
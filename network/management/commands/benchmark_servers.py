@@ -0,0 +1,224 @@
+# network/management/commands/benchmark_servers.py
+
+import http.client
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from network.benchmarks import http_load
+
+# The deployment before ASGI, and the one in the Procfile now
+SERVERS = {
+    "wsgi": ["gunicorn", "project4.wsgi", "--worker-class", "sync"],
+    "asgi": [
+        "gunicorn",
+        "project4.asgi",
+        "--worker-class",
+        "uvicorn_worker.UvicornWorker",
+    ],
+}
+STARTUP_TIMEOUT = 30
+
+
+def _free_port() -> int:
+    """Return a local TCP port nothing is listening on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_listening(process, port: int) -> None:
+    """Wait for a server to accept connections, or fail if it exits."""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f"Server exited with status {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise CommandError(f"Server did not listen on {port} in {STARTUP_TIMEOUT}s")
+
+
+def _log_in(port: int, username: str, password: str) -> str:
+    """Log in through the login form and return the session's Cookie header."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    connection.request("GET", reverse("login"))
+    response = connection.getresponse()
+    response.read()
+    token = re.search(r"csrftoken=([^;]+)", response.getheader("Set-Cookie", ""))
+    if token is None:
+        raise CommandError("The login page set no CSRF cookie")
+    body = urlencode(
+        {
+            "username": username,
+            "password": password,
+            "csrfmiddlewaretoken": token[1],
+        }
+    )
+    connection.request(
+        "POST",
+        reverse("login"),
+        body,
+        {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Cookie": f"csrftoken={token[1]}",
+        },
+    )
+    response = connection.getresponse()
+    response.read()
+    session = re.search(r"sessionid=([^;]+)", response.getheader("Set-Cookie", ""))
+    if session is None:
+        raise CommandError(f"Could not log in as {username}")
+    return f"sessionid={session[1]}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the throughput of the WSGI (sync workers) and ASGI (uvicorn "
+        "workers) deployments under concurrent load and a slow database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--posts-per-user", type=int, default=10)
+        parser.add_argument(
+            "--latency-ms",
+            type=int,
+            default=50,
+            help="Simulated delay before every query (default: 50)",
+        )
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--concurrency", type=int, default=64)
+        parser.add_argument(
+            "--duration", type=float, default=10, help="Seconds of load per view"
+        )
+        parser.add_argument(
+            "--views",
+            default="index,api_posts,api_following",
+            help="Comma-separated views to load, requested as a logged-in user",
+        )
+        parser.add_argument(
+            "--servers", default=",".join(SERVERS), help="Comma-separated servers"
+        )
+        parser.add_argument("--json", help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        servers = options["servers"].split(",")
+        if unknown := set(servers) - set(SERVERS):
+            raise CommandError(f"Unknown servers: {', '.join(sorted(unknown))}")
+        if shutil.which("gunicorn") is None:
+            raise CommandError("gunicorn is not installed")
+        directory = tempfile.mkdtemp()
+        try:
+            env = self.prepare(directory, options)
+            results = {
+                "latency_ms": options["latency_ms"],
+                "workers": options["workers"],
+                "concurrency": options["concurrency"],
+                "servers": {
+                    server: self.run(server, env, options) for server in servers
+                },
+            }
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        self.report(results)
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(results, f, indent=2)
+
+    def prepare(self, directory: str, options) -> dict[str, str]:
+        """Migrate and seed a scratch SQLite database for the servers."""
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'db.sqlite3')}",
+            "DEBUG": "False",
+        }
+        # Several workers must not share one metrics directory between runs
+        env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        manage = [sys.executable, os.path.join(settings.BASE_DIR, "manage.py")]
+        self.stdout.write(f"Seeding {options['users']} users in {directory}")
+        for command in (
+            ["migrate", "--verbosity", "0"],
+            [
+                "seed",
+                "--users",
+                str(options["users"]),
+                "--posts-per-user",
+                str(options["posts_per_user"]),
+            ],
+        ):
+            subprocess.run(
+                manage + command,
+                env=env,
+                check=True,
+                stdout=subprocess.DEVNULL,
+                cwd=settings.BASE_DIR,
+            )
+        env["SIMULATED_DB_LATENCY_MS"] = str(options["latency_ms"])
+        return env
+
+    def run(self, server: str, env: dict[str, str], options) -> dict:
+        """Start one server and load each view in turn."""
+        port = _free_port()
+        command = SERVERS[server] + [
+            "--workers",
+            str(options["workers"]),
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--log-level",
+            "warning",
+        ]
+        # Tells the settings whether the workers share a cache
+        env = {**env, "WEB_CONCURRENCY": str(options["workers"])}
+        process = subprocess.Popen(command, env=env, cwd=settings.BASE_DIR)
+        try:
+            _wait_until_listening(process, port)
+            headers = {"Cookie": _log_in(port, "user0", "testpass")}
+            views = {}
+            for view in options["views"].split(","):
+                views[view] = http_load(
+                    ("127.0.0.1", port),
+                    reverse(view),
+                    options["concurrency"],
+                    options["duration"],
+                    headers,
+                )
+            return views
+        finally:
+            process.terminate()
+            process.wait()
+
+    def report(self, results: dict):
+        """Write one line per server and view, then the ASGI speedups."""
+        self.stdout.write(
+            f"{results['workers']} workers, {results['concurrency']} concurrent "
+            f"clients, {results['latency_ms']} ms per query"
+        )
+        servers = results["servers"]
+        for server, views in servers.items():
+            for view, stats in views.items():
+                self.stdout.write(
+                    f"{server:>4} {view:>14}: {stats['rps']:8.1f} req/s | "
+                    f"p50 {stats['ms']['p50']:8.1f} ms p95 {stats['ms']['p95']:8.1f} "
+                    f"ms p99 {stats['ms']['p99']:8.1f} ms | "
+                    f"{stats['errors']} errors of {stats['requests']}"
+                )
+        if {"wsgi", "asgi"} <= set(servers):
+            for view, stats in servers["asgi"].items():
+                speedup = stats["rps"] / max(servers["wsgi"][view]["rps"], 1e-9)
+                self.stdout.write(
+                    self.style.SUCCESS(f"✅ {view}: ASGI {speedup:.1f}x WSGI req/s")
+                )
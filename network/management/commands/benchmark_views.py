@@ -0,0 +1,202 @@
+# network/management/commands/benchmark_views.py
+
+import itertools
+import json
+import random
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from network.benchmarks import (
+    power_law_graph,
+    regressions,
+    scratch_database,
+    summarize,
+    timed,
+    vocabulary,
+)
+from network.feeds import FeedEngine
+from network.models import Follow, Like, Post, User
+
+VIEWS = (
+    "index",
+    "following",
+    "profile",
+    "compose",
+    "edit_post",
+    "toggle_like",
+    "toggle_follow",
+    "search",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure latency percentiles and query counts of every view at several "
+        "dataset sizes in a scratch database, optionally against a baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scales",
+            default="1000,100000,1000000",
+            help="Comma-separated numbers of posts to benchmark at",
+        )
+        parser.add_argument("--posts-per-user", type=int, default=10)
+        parser.add_argument("--mean-follows", type=int, default=20)
+        parser.add_argument("--mean-likes", type=int, default=10)
+        parser.add_argument("--samples", type=int, default=100)
+        parser.add_argument("--viewers", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", help="Also write the results to this file")
+        parser.add_argument(
+            "--compare", help="Fail if results regressed from this JSON file"
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="Allowed p95 latency growth over the baseline (default: 25%%)",
+        )
+
+    def handle(self, *args, **options):
+        scales = [int(scale) for scale in options["scales"].split(",")]
+        results = {"samples": options["samples"], "scales": {}}
+        for scale in scales:
+            with scratch_database():
+                results["scales"][str(scale)] = self.run(scale, options)
+            self.report(scale, results["scales"][str(scale)])
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(results, f, indent=2)
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                found = regressions(json.load(f), results, options["tolerance"])
+            if found:
+                raise CommandError("Regressions:\n  " + "\n  ".join(found))
+            self.stdout.write(self.style.SUCCESS("✅ No regressions"))
+
+    def run(self, scale: int, options) -> dict:
+        """Seed one dataset size, then time every view on it."""
+        users = max(2, scale // max(1, options["posts_per_user"]))
+        seed_ms, user_ids = timed(
+            power_law_graph,
+            users,
+            max(1, scale // users),
+            options["mean_follows"],
+            seed=options["seed"],
+            mean_likes=options["mean_likes"],
+        )
+        FeedEngine().rebuild()
+        cache.clear()
+        dataset = {
+            "users": len(user_ids),
+            "posts": Post.objects.count(),
+            "follows": Follow.objects.count(),
+            "likes": Like.objects.count(),
+            "seed_ms": seed_ms,
+        }
+        rng = random.Random(options["seed"])
+        # Readers are random users; profiles, follows and likes target the
+        # most followed users and the newest posts, as real traffic does
+        self.clients = []
+        sample = rng.sample(user_ids, min(len(user_ids), options["viewers"]))
+        for viewer in User.objects.filter(pk__in=sample):
+            client = Client()
+            client.force_login(viewer)
+            self.clients.append((viewer, client))
+        self.targets = list(
+            User.objects.filter(pk__in=user_ids[:1000]).values_list("pk", "username")
+        )
+        self.recent = list(
+            Post.objects.order_by("-created", "-id").values_list("pk", "user_id")[:1000]
+        )
+        self.composed = {viewer.pk: [] for viewer, _ in self.clients}
+        self.words = vocabulary(seed=options["seed"])
+        # Zipf's law, as the seeded posts' words are drawn
+        self.word_weights = list(
+            itertools.accumulate(1 / (rank + 1) for rank in range(len(self.words)))
+        )
+        views = {}
+        for view in VIEWS:
+            latencies, queries, statuses = [], [], set()
+            for viewer, client, method, url, body in self.requests(view, rng, options):
+                kwargs = {}
+                if body is not None:
+                    kwargs = {
+                        "data": json.dumps(body),
+                        "content_type": "application/json",
+                    }
+                with CaptureQueriesContext(connection) as captured:
+                    elapsed, response = timed(getattr(client, method), url, **kwargs)
+                latencies.append(elapsed)
+                queries.append(len(captured))
+                statuses.add(response.status_code)
+                if view == "compose" and response.status_code == 201:
+                    self.composed[viewer.pk].append(response.json()["post_id"])
+            views[view] = {
+                "ms": summarize(latencies),
+                "queries": {"mean": sum(queries) / len(queries), "max": max(queries)},
+                "statuses": sorted(statuses),
+            }
+        return {"dataset": dataset, "views": views}
+
+    def requests(self, view: str, rng: random.Random, options):
+        """Yield `(viewer, client, method, url, body)` for each sample of a view."""
+        for i in range(options["samples"]):
+            viewer, client = self.clients[i % len(self.clients)]
+            # Each viewer alternates rounds of likes and unlikes, follows and
+            # unfollows, so both directions are measured
+            adding = i // len(self.clients) % 2 == 0
+            if view in ("index", "following"):
+                yield viewer, client, "get", reverse(view), None
+            elif view == "profile":
+                _, username = rng.choice(self.targets)
+                yield viewer, client, "get", reverse(view, args=[username]), None
+            elif view == "compose":
+                body = {"text": f"Benchmark post {i}"}
+                yield viewer, client, "post", reverse(view), body
+            elif view == "edit_post":
+                post_id = rng.choice(self.composed[viewer.pk])
+                body = {"text": f"Benchmark edit {i}"}
+                yield viewer, client, "put", reverse(view, args=[post_id]), body
+            elif view == "search":
+                # One or two words, as likely to be searched as to be written
+                words = rng.choices(
+                    self.words,
+                    cum_weights=self.word_weights,
+                    k=rng.randint(1, 2),
+                )
+                url = f"{reverse(view)}?{urlencode({'q': ' '.join(words)})}"
+                yield viewer, client, "get", url, None
+            elif view == "toggle_like":
+                post_id, author_id = self.recent[i // (2 * len(self.clients))]
+                if author_id != viewer.pk:
+                    method = "put" if adding else "delete"
+                    yield viewer, client, method, reverse(view, args=[post_id]), None
+            else:
+                followee_id, username = self.targets[i // (2 * len(self.clients))]
+                if followee_id != viewer.pk:
+                    method = "post" if adding else "delete"
+                    url = reverse(view, args=[username])
+                    yield viewer, client, method, url, None
+
+    def report(self, scale: int, result: dict):
+        """Write one line per view for a dataset size."""
+        dataset = result["dataset"]
+        self.stdout.write(
+            f"{dataset['posts']} posts, {dataset['users']} users, "
+            f"{dataset['follows']} follows, {dataset['likes']} likes"
+        )
+        for view, stats in result["views"].items():
+            self.stdout.write(
+                f"{view:>14}: p50 {stats['ms']['p50']:7.2f} ms "
+                f"p95 {stats['ms']['p95']:7.2f} ms p99 {stats['ms']['p99']:7.2f} ms | "
+                f"queries mean {stats['queries']['mean']:5.1f} "
+                f"max {stats['queries']['max']:3d} | status {stats['statuses']}"
+            )
@@ -0,0 +1,97 @@
+# network/management/commands/profile_summary.py
+
+import os
+import pstats
+import re
+from collections import Counter
+from io import StringIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Summarize the hottest functions and queries across the requests "
+        "profiled by SamplingProfilerMiddleware"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dir", help="Profile directory (default: settings.PROFILE_DIR)"
+        )
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument(
+            "--sort",
+            choices=("tottime", "cumulative", "ncalls"),
+            default="tottime",
+            help="Order of the cProfile table",
+        )
+        parser.add_argument("--view", help="Only include requests to this view")
+
+    def handle(self, *args, **options):
+        directory = options["dir"] or settings.PROFILE_DIR
+        if not os.path.isdir(directory):
+            raise CommandError(f"No profiles in {directory}")
+        names = sorted(os.listdir(directory))
+        if options["view"]:
+            names = [name for name in names if f"ms-{options['view']}-" in name]
+        paths = {
+            suffix: [os.path.join(directory, n) for n in names if n.endswith(suffix)]
+            for suffix in (".prof", ".folded", ".sql")
+        }
+        requests = len(paths[".folded"])
+        self.stdout.write(
+            f"{requests} requests, {len(paths['.prof'])} with cProfile, "
+            f"in {directory}"
+        )
+        if paths[".prof"]:
+            self.cprofile(paths[".prof"], options)
+        self.samples(paths[".folded"], options["limit"])
+        self.queries(paths[".sql"], options["limit"])
+
+    def cprofile(self, paths: list[str], options):
+        """Print the merged cProfile table of every sampled request."""
+        out = StringIO()
+        stats = pstats.Stats(*paths, stream=out)
+        stats.strip_dirs().sort_stats(options["sort"]).print_stats(options["limit"])
+        self.stdout.write(f"\nHottest functions by {options['sort']} (cProfile):")
+        self.stdout.write(out.getvalue().split("\n\n", 1)[-1].rstrip())
+
+    def samples(self, paths: list[str], limit: int):
+        """Print the functions most often on top of, and inside, a stack."""
+        own, total, count = Counter(), Counter(), 0
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    stack, _, samples = line.rstrip().rpartition(" ")
+                    frames = stack.split(";")
+                    own[frames[-1]] += int(samples)
+                    for frame in set(frames):
+                        total[frame] += int(samples)
+                    count += int(samples)
+        if not count:
+            return
+        self.stdout.write(f"\nHottest functions in {count} stack samples:")
+        self.stdout.write(f"{'own':>6} {'total':>6}  function")
+        for frame, samples in own.most_common(limit):
+            self.stdout.write(
+                f"{samples / count:6.1%} {total[frame] / count:6.1%}  {frame}"
+            )
+
+    def queries(self, paths: list[str], limit: int):
+        """Print the statements that took the most time across requests."""
+        spent, runs = Counter(), Counter()
+        for path in paths:
+            with open(path) as f:
+                entries = re.findall(r"^-- ([\d.]+) ms\n(.*?);$", f.read(), re.M | re.S)
+            for ms, sql in entries:
+                # Group statements that differ only in their literal values
+                shape = re.sub(r"\b\d+\b|'[^']*'", "?", sql)
+                spent[shape] += float(ms)
+                runs[shape] += 1
+        if not spent:
+            return
+        self.stdout.write("\nSlowest queries in total:")
+        for shape, ms in spent.most_common(limit):
+            self.stdout.write(f"{ms:9.2f} ms {runs[shape]:5}x  {shape[:160]}")
@@ -0,0 +1,23 @@
+# network/management/commands/rebuild_timelines.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from network.feeds import BATCH_SIZE, FeedEngine
+
+
+class Command(BaseCommand):
+    help = "Rebuild every Following timeline from the follow graph"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Rows to read and insert per batch",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = FeedEngine().rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} timeline entries rebuilt"))
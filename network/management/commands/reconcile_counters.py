@@ -0,0 +1,33 @@
+# network/management/commands/reconcile_counters.py
+
+from django.core.management.base import BaseCommand
+
+from network.counters import (
+    BATCH_SIZE,
+    reconcile_follow_counts,
+    reconcile_like_counts,
+)
+
+
+class Command(BaseCommand):
+    help = "Find and repair denormalized counters that drifted from their tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Rows to check per statement",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many counters drifted",
+        )
+
+    def handle(self, *args, **options):
+        verb = "drifted" if options["dry_run"] else "repaired"
+        likes = reconcile_like_counts(options["batch_size"], options["dry_run"])
+        self.stdout.write(self.style.SUCCESS(f"✅ {likes} post like counts {verb}"))
+        follows = reconcile_follow_counts(options["batch_size"], options["dry_run"])
+        self.stdout.write(self.style.SUCCESS(f"✅ {follows} user follow counts {verb}"))
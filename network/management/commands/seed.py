@@ -3,17 +3,58 @@
 import random
 
 from django.contrib.auth import get_user_model
-from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
 
-from network.models import Post
+from network.benchmarks import power_law_graph, timed
+from network.feeds import FeedEngine
+from network.models import Follow, Like, Post
 
 User = get_user_model()
 
 
 class Command(BaseCommand):
-    help = "Seed the database with test users, posts, likes, and follows"
+    help = (
+        "Seed the database with test users, posts, likes, and follows. "
+        "With --users, generate a synthetic dataset of that size instead"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=0,
+            help="Generate this many synthetic users (default: the demo accounts)",
+        )
+        parser.add_argument("--posts-per-user", type=int, default=10)
+        parser.add_argument("--mean-follows", type=int, default=20)
+        parser.add_argument(
+            "--follow-alpha",
+            type=float,
+            default=1.2,
+            help="Power-law exponent of follower counts",
+        )
+        parser.add_argument("--mean-likes", type=int, default=20)
+        parser.add_argument(
+            "--like-alpha",
+            type=float,
+            default=1.2,
+            help="Power-law exponent of like counts",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--prefix", default="user", help="Username prefix")
+        parser.add_argument("--password", default="testpass")
+        parser.add_argument(
+            "--skip-timelines",
+            action="store_true",
+            help="Leave the Following timelines for rebuild_timelines",
+        )
 
     def handle(self, *args, **options):
+        if options["users"]:
+            self.generate(options)
+            return
         # Create test users
         usernames = ["alice", "bob", "charlie"]
         for username in usernames:
@@ -52,3 +93,38 @@ class Command(BaseCommand):
         for post in Post.objects.filter(user=bob):
             post.likes.add(charlie)
         self.stdout.write(self.style.SUCCESS("✅ Likes added"))
+
+    def generate(self, options):
+        """Stream a synthetic power-law dataset into the database."""
+        if get_user_model().objects.filter(username=f"{options['prefix']}0").exists():
+            raise CommandError(
+                f"Users prefixed {options['prefix']!r} exist; pass another --prefix"
+            )
+        elapsed, user_ids = timed(
+            power_law_graph,
+            options["users"],
+            options["posts_per_user"],
+            options["mean_follows"],
+            alpha=options["follow_alpha"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            mean_likes=options["mean_likes"],
+            like_alpha=options["like_alpha"],
+            prefix=options["prefix"],
+            # Hashing once keeps the accounts usable without hashing per user
+            password=make_password(options["password"]),
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ {len(user_ids)} users, {Post.objects.count()} posts, "
+                f"{Follow.objects.count()} follows and {Like.objects.count()} likes "
+                f"in {elapsed / 1000:.1f} s"
+            )
+        )
+        if not options["skip_timelines"]:
+            elapsed, entries = timed(FeedEngine().rebuild, options["batch_size"])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"✅ {entries} timeline entries in {elapsed / 1000:.1f} s"
+                )
+            )
@@ -0,0 +1,82 @@
+"""
+Prometheus metrics for the network app, served at `/metrics`.
+
+Under gunicorn, point `PROMETHEUS_MULTIPROC_DIR` at an empty directory before
+the workers start. Each worker then writes its samples to its own
+memory-mapped files there, so workers share no locks, and `/metrics` merges
+every worker's files whichever worker answers the scrape. See gunicorn.conf.py.
+
+Metrics are off unless `PROMETHEUS_METRICS` is set. `/metrics` then answers
+staff, and scrapers that send `Authorization: Bearer <PROMETHEUS_TOKEN>`.
+"""
+
+from __future__ import annotations
+
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+REQUESTS = Counter(
+    "network_requests", "HTTP requests handled", ["view", "method", "status"]
+)
+LATENCY = Histogram(
+    "network_request_duration_seconds",
+    "Time to handle a request",
+    ["view"],
+    buckets=LATENCY_BUCKETS,
+)
+QUERIES = Histogram(
+    "network_db_queries_per_request",
+    "Database queries run by a request",
+    ["view"],
+    buckets=QUERY_BUCKETS,
+)
+DB_TIME = Histogram(
+    "network_db_duration_seconds",
+    "Time a request spent in database queries",
+    ["view"],
+    buckets=LATENCY_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "network_cache_lookups",
+    "Post card and anonymous page cache lookups",
+    ["cache", "result"],
+)
+POSTS_CREATED = Counter("network_posts_created", "Posts created")
+LIKES_CREATED = Counter("network_likes_created", "Likes added")
+FOLLOWS_CREATED = Counter("network_follows_created", "Follows added")
+# Summed over the live workers only, as a dead worker's streams are closed
+LIVE_STREAMS = Gauge(
+    "network_live_streams", "Open live event streams", multiprocess_mode="livesum"
+)
+
+
+def observe_request(
+    view: str, method: str, status: int, seconds: float, queries: int, sql: float
+) -> None:
+    """Record one handled request."""
+    REQUESTS.labels(view, method, str(status)).inc()
+    LATENCY.labels(view).observe(seconds)
+    QUERIES.labels(view).observe(queries)
+    DB_TIME.labels(view).observe(sql)
+
+
+def exposition() -> tuple[bytes, str]:
+    """Return every worker's metrics in the text format, and its content type."""
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,378 @@
+"""
+Per-request instrumentation: query count, SQL time, template and view time.
+
+With `REQUEST_TIMING` on, every response carries a `Server-Timing` header that
+browser devtools show next to the request, and each view's timings are added
+to this worker's histograms, see `timing_stats()`. With `PROMETHEUS_METRICS`
+on, request rates, latencies and query counts feed network/metrics.py. With
+`PROFILE_SAMPLE_RATE` or `PROFILE_SLOW_MS` set, sampled and slow requests are
+profiled, see network/profiling.py. Each middleware removes itself when the
+server starts if its setting is off, so requests do not pass through it.
+
+Queries are recorded by one execute wrapper on every connection, which hands
+them to whatever the current request's context registered. Under ASGI the
+async ORM runs queries on another thread than the request, which copies that
+context along, so no per-thread wrapper would see them.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial, wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics, profiling
+
+# Upper bounds in milliseconds of the histogram buckets
+BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float("inf"))
+METRICS = ("db", "tpl", "view", "total")
+
+# The timings of the request being handled in this thread or task
+_current: ContextVar[_Timing | None] = ContextVar("request_timing", default=None)
+# What the queries of the request being handled are reported to
+_query_sinks: ContextVar[tuple] = ContextVar("query_sinks", default=())
+# Per-process histograms: view name -> metric -> count per bucket
+_histograms = defaultdict(lambda: {metric: [0] * len(BUCKETS) for metric in METRICS})
+_sums = defaultdict(lambda: dict.fromkeys(METRICS, 0.0))
+_requests = defaultdict(int)
+
+
+class _Timing:
+    """What one request spent, in seconds."""
+
+    __slots__ = ("queries", "sql", "template", "rendering")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.template = 0.0
+        self.rendering = False
+
+
+def _report_query(execute, sql, params, many, context):
+    """Database execute wrapper that times each query for the current request."""
+    sinks = _query_sinks.get()
+    if not sinks:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        for sink in sinks:
+            sink(sql, elapsed)
+
+
+def _wrap_connection(connection, **kwargs) -> None:
+    """Install `_report_query` on a connection, once."""
+    if _report_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _report_query)
+
+
+def _wrap_open_connections(**kwargs) -> None:
+    """Install `_report_query` on this thread's already open connections."""
+    for connection in connections.all(initialized_only=True):
+        _wrap_connection(connection)
+
+
+def _install_query_hook() -> None:
+    """Report the queries of every connection, including ones opened later."""
+    connection_created.connect(_wrap_connection, dispatch_uid="report_query")
+    # Sent on the thread that will run the request's queries, under ASGI too
+    request_started.connect(_wrap_open_connections, dispatch_uid="report_query")
+    _wrap_open_connections()
+
+
+@contextmanager
+def _recording_queries(sink):
+    """Call `sink(sql, seconds)` for every query run inside the block."""
+    token = _query_sinks.set((*_query_sinks.get(), sink))
+    try:
+        yield
+    finally:
+        _query_sinks.reset(token)
+
+
+def _record_query(timing: _Timing, sql: str, seconds: float) -> None:
+    """Count and time one query."""
+    timing.sql += seconds
+    timing.queries += 1
+
+
+def _view_name(request) -> str:
+    """Return the URL name of the view that handled a request."""
+    match = request.resolver_match
+    return match.view_name if match else "unresolved"
+
+
+def _install_template_timer() -> None:
+    """Time the outermost template render of each timed request."""
+    if getattr(Template.render, "_timed", False):
+        return
+    render = Template.render
+
+    @wraps(render)
+    def timed_render(self, context):
+        timing = _current.get()
+        # Includes and cached card bodies render inside the page template
+        if timing is None or timing.rendering:
+            return render(self, context)
+        timing.rendering = True
+        sql_before = timing.sql
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            # Queries run from the template count as database time only
+            elapsed = time.perf_counter() - start
+            timing.template += elapsed - (timing.sql - sql_before)
+            timing.rendering = False
+
+    timed_render._timed = True
+    Template.render = timed_render
+
+
+def _observe(view: str, durations: dict[str, float]) -> None:
+    """Add one request's durations, in milliseconds, to its view's histograms."""
+    _requests[view] += 1
+    for metric, value in durations.items():
+        counts = _histograms[view][metric]
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                counts[index] += 1
+                break
+        _sums[view][metric] += value
+
+
+def timing_stats() -> dict[str, dict]:
+    """Return this process's per-view request counts and timing histograms."""
+    stats = {}
+    for view, histograms in _histograms.items():
+        stats[view] = {"requests": _requests[view]}
+        for metric, counts in histograms.items():
+            # Cumulative, like Prometheus `le` buckets
+            running, buckets = 0, {}
+            for bound, count in zip(BUCKETS, counts):
+                running += count
+                buckets[str(bound)] = running
+            stats[view][metric] = {"buckets": buckets, "sum_ms": _sums[view][metric]}
+    return stats
+
+
+def reset_timing_stats() -> None:
+    """Forget this process's timing histograms."""
+    _histograms.clear()
+    _sums.clear()
+    _requests.clear()
+
+
+class ServerTimingMiddleware:
+    """
+    Measure each request and report it in a `Server-Timing` header.
+
+    `db` is the time spent in queries, `tpl` the time rendering templates
+    minus their queries, `view` everything else in Python (views, other
+    middleware), and `total` the whole request as this middleware saw it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "REQUEST_TIMING", False):
+            raise MiddlewareNotUsed
+        _install_template_timer()
+        _install_query_hook()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timing = _Timing()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            with _recording_queries(partial(_record_query, timing)):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, timing, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timing = _Timing()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            with _recording_queries(partial(_record_query, timing)):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, timing, time.perf_counter() - start)
+
+    def report(self, request, response, timing: _Timing, total: float):
+        """Add the `Server-Timing` header and update the view's histograms."""
+        durations = {
+            "db": timing.sql * 1000,
+            "tpl": timing.template * 1000,
+            "view": (total - timing.sql - timing.template) * 1000,
+            "total": total * 1000,
+        }
+        response["Server-Timing"] = ", ".join(
+            f"{metric};dur={value:.2f}"
+            + (f';desc="{timing.queries} queries"' if metric == "db" else "")
+            for metric, value in durations.items()
+        )
+        _observe(_view_name(request), durations)
+        return response
+
+
+class MetricsMiddleware:
+    """Record each request's view, status, latency and queries for Prometheus."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROMETHEUS_METRICS", False):
+            raise MiddlewareNotUsed
+        _install_query_hook()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timing = _Timing()
+        start = time.perf_counter()
+        with _recording_queries(partial(_record_query, timing)):
+            response = self.get_response(request)
+        return self.report(request, response, timing, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timing = _Timing()
+        start = time.perf_counter()
+        with _recording_queries(partial(_record_query, timing)):
+            response = await self.get_response(request)
+        return self.report(request, response, timing, time.perf_counter() - start)
+
+    def report(self, request, response, timing: _Timing, total: float):
+        """Add the request to the Prometheus metrics."""
+        metrics.observe_request(
+            _view_name(request),
+            request.method,
+            response.status_code,
+            total,
+            timing.queries,
+            timing.sql,
+        )
+        return response
+
+
+class SamplingProfilerMiddleware:
+    """
+    Profile a sample of requests, and keep the profile of any slow one.
+
+    Both profilers follow one thread. Under WSGI that is the request's thread;
+    under ASGI it is the event loop thread, followed only while the request's
+    coroutine runs on it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not profiling.enabled():
+            raise MiddlewareNotUsed
+        _install_query_hook()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        profile = profiling.RequestProfile()
+        with _recording_queries(profile.record_query), profile:
+            response = self.get_response(request)
+        return self.report(request, response, profile)
+
+    async def __acall__(self, request):
+        profile = profiling.RequestProfile()
+        with _recording_queries(profile.record_query):
+            response = await profile.run(self.get_response(request))
+        return self.report(request, response, profile)
+
+    def report(self, request, response, profile: profiling.RequestProfile):
+        """Save the request's profile if it was sampled or slow."""
+        if profile.keep():
+            profile.save(_view_name(request))
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise, able to run under ASGI without a thread per request.
+
+    WhiteNoise is synchronous only, and a synchronous middleware at the top
+    of the stack would push every request onto a thread. Static files are
+    opened and read on threads, which WhiteNoise can only do synchronously.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is None:
+            return await self.get_response(request)
+        response = await sync_to_async(self.serve, thread_sensitive=False)(
+            static_file, request
+        )
+        if getattr(response, "file_to_stream", None) is not None:
+            # Stream the file asynchronously, so Django need not buffer it
+            response.streaming_content = _read_chunks(
+                response.file_to_stream, response.block_size
+            )
+        return response
+
+
+async def _read_chunks(file, size: int):
+    """Yield a file's contents, reading each chunk on a thread."""
+    read = sync_to_async(file.read, thread_sensitive=False)
+    try:
+        while chunk := await read(size):
+            yield chunk
+    finally:
+        file.close()
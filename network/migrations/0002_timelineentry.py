@@ -0,0 +1,114 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:57
+
+import itertools
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def backfill_timelines(apps, schema_editor):
+    """Fill the timelines of the follows that exist before fan-out starts."""
+    User = apps.get_model("network", "User")
+    Post = apps.get_model("network", "Post")
+    TimelineEntry = apps.get_model("network", "TimelineEntry")
+    Follow = User.following.through
+    # Mirrors FeedEngine.rebuild; its models are newer than this migration
+    threshold = getattr(settings, "FEED_CELEBRITY_THRESHOLD", 10_000)
+    if threshold <= 0:
+        return
+    follows = Follow.objects.order_by("from_user_id", "to_user_id")
+    if threshold < float("inf"):
+        celebrities = (
+            Follow.objects.values("to_user_id")
+            .annotate(followers=Count("id"))
+            .filter(followers__gte=threshold)
+            .values("to_user_id")
+        )
+        follows = follows.exclude(to_user_id__in=celebrities)
+    entries = (
+        TimelineEntry(
+            owner_id=owner_id, post_id=post_id, author_id=author_id, created=created
+        )
+        for owner_id, author_id in follows.values_list(
+            "from_user_id", "to_user_id"
+        ).iterator(chunk_size=BATCH_SIZE)
+        for post_id, created in Post.objects.filter(user_id=author_id)
+        .values_list("id", "created")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    while batch := list(itertools.islice(entries, BATCH_SIZE)):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("network", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimelineEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created", models.DateTimeField()),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to="network.post",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "timeline entry",
+                "verbose_name_plural": "timeline entries",
+                "indexes": [
+                    models.Index(
+                        fields=["owner", "created", "post"],
+                        name="timeline_owner_created",
+                    ),
+                    models.Index(
+                        fields=["owner", "author"], name="timeline_owner_author"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("owner", "post"), name="unique_timeline_entry"
+                    )
+                ],
+            },
+        ),
+        # Timelines are otherwise only written as posts and follows happen
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
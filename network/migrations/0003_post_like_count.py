@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_likes(apps, schema_editor):
+    """Fill the new counter from the existing likes."""
+    Post = apps.get_model("network", "Post")
+    counts = (
+        Post.likes.through.objects.filter(post_id=OuterRef("pk"))
+        .order_by()
+        .values("post_id")
+        .annotate(total=Count("*"))
+        .values("total")
+    )
+    Post.objects.update(like_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("network", "0002_timelineentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_likes, migrations.RunPython.noop),
+    ]
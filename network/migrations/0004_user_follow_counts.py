@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:03
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_follows(apps, schema_editor):
+    """Fill the new counters from the existing follows."""
+    User = apps.get_model("network", "User")
+    Follow = User.following.through
+
+    def counts(column):
+        return Coalesce(
+            Subquery(
+                Follow.objects.filter(**{column: OuterRef("pk")})
+                .order_by()
+                .values(column)
+                .annotate(total=Count("*"))
+                .values("total")
+            ),
+            Value(0),
+        )
+
+    User.objects.update(
+        follower_count=counts("to_user_id"), following_count=counts("from_user_id")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("network", "0003_post_like_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="follower_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="following_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_follows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("network", "0004_user_follow_counts"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["created", "id"], name="post_created_id"),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["user", "created", "id"], name="post_user_created"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="post",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="posts",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        # Auto-created through tables have no Meta, so index them by hand; the
+        # unique (from, to) and (post, user) indexes already serve one direction
+        migrations.RunSQL(
+            'CREATE INDEX "follow_to_from" '
+            'ON "network_user_following" ("to_user_id", "from_user_id")',
+            'DROP INDEX "follow_to_from"',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX "like_user_post" '
+            'ON "network_post_likes" ("user_id", "post_id")',
+            'DROP INDEX "like_user_post"',
+        ),
+    ]
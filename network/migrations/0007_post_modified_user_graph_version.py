@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:41
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_created(apps, schema_editor):
+    """Treat every existing post as last changed when it was created."""
+    Post = apps.get_model("network", "Post")
+    Post.objects.update(modified=F("created"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("network", "0006_post_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="modified",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="graph_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(copy_created, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["modified", "id"], name="post_modified_id"),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["user", "modified", "id"], name="post_user_modified"
+            ),
+        ),
+    ]
@@ -0,0 +1,156 @@
+# Generated by Django 5.2.4 on 2026-10-17 05:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# The post's author lives in another table, so a CHECK cannot see it
+TRIGGERS = {
+    "sqlite": (
+        [
+            'CREATE TRIGGER "like_not_own_post" BEFORE INSERT ON "network_post_likes" '
+            'WHEN NEW."user_id" = '
+            '(SELECT "user_id" FROM "network_post" WHERE "id" = NEW."post_id") '
+            "BEGIN SELECT RAISE(ABORT, 'Users cannot like own posts.'); END",
+        ],
+        ['DROP TRIGGER IF EXISTS "like_not_own_post"'],
+    ),
+    "postgresql": (
+        [
+            "CREATE FUNCTION like_not_own_post() RETURNS trigger AS $$ BEGIN "
+            'IF NEW."user_id" = '
+            '(SELECT "user_id" FROM "network_post" WHERE "id" = NEW."post_id") '
+            "THEN RAISE EXCEPTION 'Users cannot like own posts.' "
+            "USING ERRCODE = 'check_violation'; END IF; "
+            "RETURN NEW; END $$ LANGUAGE plpgsql",
+            'CREATE TRIGGER "like_not_own_post" BEFORE INSERT ON "network_post_likes" '
+            "FOR EACH ROW EXECUTE FUNCTION like_not_own_post()",
+        ],
+        [
+            'DROP TRIGGER IF EXISTS "like_not_own_post" ON "network_post_likes"',
+            "DROP FUNCTION IF EXISTS like_not_own_post()",
+        ],
+    ),
+}
+
+
+def create_like_trigger(apps, schema_editor):
+    """Reject likes of one's own post in the database."""
+    for statement in TRIGGERS.get(schema_editor.connection.vendor, ([], []))[0]:
+        schema_editor.execute(statement)
+
+
+def drop_like_trigger(apps, schema_editor):
+    """Drop the trigger added by `create_like_trigger`."""
+    for statement in TRIGGERS.get(schema_editor.connection.vendor, ([], []))[1]:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("network", "0007_post_modified_user_graph_version"),
+    ]
+
+    operations = [
+        # Adopt the implicit through tables as they are, indexes from 0005 too
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="Follow",
+                    fields=[
+                        ("id", models.AutoField(primary_key=True, serialize=False)),
+                        (
+                            "from_user",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="+",
+                                to=settings.AUTH_USER_MODEL,
+                            ),
+                        ),
+                        (
+                            "to_user",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="+",
+                                to=settings.AUTH_USER_MODEL,
+                            ),
+                        ),
+                    ],
+                    options={
+                        "verbose_name": "follow",
+                        "verbose_name_plural": "follows",
+                        "db_table": "network_user_following",
+                        "indexes": [
+                            models.Index(
+                                fields=["to_user", "from_user"], name="follow_to_from"
+                            )
+                        ],
+                        "unique_together": {("from_user", "to_user")},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name="user",
+                    name="following",
+                    field=models.ManyToManyField(
+                        blank=True,
+                        related_name="followers",
+                        through="network.Follow",
+                        through_fields=("from_user", "to_user"),
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                migrations.CreateModel(
+                    name="Like",
+                    fields=[
+                        ("id", models.AutoField(primary_key=True, serialize=False)),
+                        (
+                            "post",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="+",
+                                to="network.post",
+                            ),
+                        ),
+                        (
+                            "user",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="+",
+                                to=settings.AUTH_USER_MODEL,
+                            ),
+                        ),
+                    ],
+                    options={
+                        "verbose_name": "like",
+                        "verbose_name_plural": "likes",
+                        "db_table": "network_post_likes",
+                        "indexes": [
+                            models.Index(fields=["user", "post"], name="like_user_post")
+                        ],
+                        "unique_together": {("post", "user")},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name="post",
+                    name="likes",
+                    field=models.ManyToManyField(
+                        blank=True,
+                        related_name="liked_posts",
+                        through="network.Like",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="follow",
+            constraint=models.CheckConstraint(
+                condition=models.Q(("from_user", models.F("to_user")), _negated=True),
+                name="follow_not_self",
+            ),
+        ),
+        # SQLite drops triggers with their table, so any later migration that
+        # rebuilds network_post_likes must recreate this one
+        migrations.RunPython(create_like_trigger, drop_like_trigger),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.4 on 2026-10-17 06:02
+
+from django.db import migrations
+
+# The database keeps the index current on every write to a post's text
+SEARCH_INDEX = {
+    "sqlite": (
+        [
+            # External content: the text itself stays in network_post only
+            'CREATE VIRTUAL TABLE "network_post_fts" USING fts5(text, '
+            "content='network_post', content_rowid='id', "
+            "tokenize='porter unicode61')",
+            'CREATE TRIGGER "post_fts_insert" AFTER INSERT ON "network_post" BEGIN '
+            'INSERT INTO "network_post_fts"("rowid", "text") '
+            'VALUES (NEW."id", NEW."text"); END',
+            'CREATE TRIGGER "post_fts_delete" AFTER DELETE ON "network_post" BEGIN '
+            'INSERT INTO "network_post_fts"("network_post_fts", "rowid", "text") '
+            'VALUES (\'delete\', OLD."id", OLD."text"); END',
+            'CREATE TRIGGER "post_fts_update" AFTER UPDATE OF "text" '
+            'ON "network_post" WHEN OLD."text" IS NOT NEW."text" BEGIN '
+            'INSERT INTO "network_post_fts"("network_post_fts", "rowid", "text") '
+            'VALUES (\'delete\', OLD."id", OLD."text"); '
+            'INSERT INTO "network_post_fts"("rowid", "text") '
+            'VALUES (NEW."id", NEW."text"); END',
+            # Index the posts written before this migration
+            'INSERT INTO "network_post_fts"("network_post_fts") VALUES (\'rebuild\')',
+        ],
+        [
+            'DROP TRIGGER IF EXISTS "post_fts_update"',
+            'DROP TRIGGER IF EXISTS "post_fts_delete"',
+            'DROP TRIGGER IF EXISTS "post_fts_insert"',
+            'DROP TABLE IF EXISTS "network_post_fts"',
+        ],
+    ),
+    "postgresql": (
+        [
+            'ALTER TABLE "network_post" ADD COLUMN "search_vector" tsvector '
+            "GENERATED ALWAYS AS (to_tsvector('english', \"text\")) STORED",
+            'CREATE INDEX "post_search" ON "network_post" USING GIN ("search_vector")',
+        ],
+        [
+            'DROP INDEX IF EXISTS "post_search"',
+            'ALTER TABLE "network_post" DROP COLUMN IF EXISTS "search_vector"',
+        ],
+    ),
+}
+
+
+def create_search_index(apps, schema_editor):
+    """Index post text for full-text search."""
+    for statement in SEARCH_INDEX.get(schema_editor.connection.vendor, ([], []))[0]:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    """Drop the index added by `create_search_index`."""
+    for statement in SEARCH_INDEX.get(schema_editor.connection.vendor, ([], []))[1]:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("network", "0008_follow_like"),
+    ]
+
+    operations = [
+        # SQLite drops triggers with their table, so any later migration that
+        # rebuilds network_post must recreate these ones
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
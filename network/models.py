@@ -1,8 +1,13 @@
 """Models for the network app."""
 
+from __future__ import annotations
+
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
+
+from .caching import invalidate_card, purge_post_pages
 
 
 class User(AbstractUser):
@@ -15,47 +20,108 @@ class User(AbstractUser):
         verbose_name_plural = "users"
 
     following = models.ManyToManyField(
-        "self", symmetrical=False, blank=True, related_name="followers"
+        "self",
+        symmetrical=False,
+        blank=True,
+        related_name="followers",
+        through="Follow",
+        through_fields=("from_user", "to_user"),
     )
+    # Denormalized `followers.count()`/`following.count()`, see network/counters.py
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # Bumped whenever the user follows or unfollows, see network/conditional.py
+    graph_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         """Return the username when converting to string."""
         return str(self.username)
 
-    def clean(self):
-        """Called during validation to ensure not self-following."""
-        if self.pk and self.following.filter(pk=self.pk).exists():
-            raise ValidationError("Users cannot follow themselves.")
-
     def num_following(self) -> int:
         """Return the number of users the User is following."""
-        return self.following.count()
+        return self.following_count
 
     def num_followers(self) -> int:
         """Return the number of users who are following the User."""
-        return self.followers.count()
+        return self.follower_count
 
     def save(self, *args, **kwargs):
-        """Custom save method to ensure clean() runs on save."""
-        self.full_clean()
+        """
+        Validate the fields being written, then save.
+
+        A save never changes the follow graph, whose invariants the Follow
+        model enforces, so validation reads nothing. Uniqueness is left to the
+        unique indexes, which callers catch as `IntegrityError`. Saves with
+        `update_fields`, such as `login()` stamping `last_login`, validate just
+        those fields.
+        """
+        exclude = None
+        if kwargs.get("update_fields") is not None:
+            update_fields = set(kwargs["update_fields"])
+            exclude = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not {field.name, field.attname} & update_fields
+            ]
+        self.full_clean(exclude=exclude, validate_unique=False)
         super().save(*args, **kwargs)
 
 
+class PostQuerySet(models.QuerySet):
+    """QuerySet with per-viewer annotations for rendering feeds."""
+
+    def with_viewer_liked(self, viewer) -> PostQuerySet:
+        """
+        Annotate `viewer_liked`: whether `viewer` likes each post.
+
+        This is an EXISTS probe of the likes table per row, so a post with 50k
+        likes costs the same as one with none.
+        """
+        if not viewer.is_authenticated:
+            return self.annotate(viewer_liked=models.Value(False))
+        return self.annotate(
+            viewer_liked=models.Exists(
+                Like.objects.filter(post_id=models.OuterRef("pk"), user_id=viewer.pk)
+            )
+        )
+
+
 class Post(models.Model):
     """Model for a post which includes the user, text, created fields, and likes"""
 
     class Meta:
-        """Explicitly set the default ordering, verbose name and plural name."""
+        """Set the default ordering, feed indexes, verbose name and plural name."""
 
         ordering = ["-created"]
+        # Match the keyset order `(created, id)` of the global and profile feeds
+        indexes = [
+            models.Index(fields=["created", "id"], name="post_created_id"),
+            models.Index(fields=["user", "created", "id"], name="post_user_created"),
+            # Find the latest change to a feed for its ETag in one index seek
+            models.Index(fields=["modified", "id"], name="post_modified_id"),
+            models.Index(fields=["user", "modified", "id"], name="post_user_modified"),
+        ]
         verbose_name = "post"
         verbose_name_plural = "posts"
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="posts")
-    likes = models.ManyToManyField(User, blank=True, related_name="liked_posts")
+    # `post_user_created` leads with user, so skip the standalone FK index
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="posts", db_index=False
+    )
+    likes = models.ManyToManyField(
+        User, blank=True, related_name="liked_posts", through="Like"
+    )
     text = models.CharField(max_length=512, blank=False)
     created = models.DateTimeField(auto_now_add=True)
+    # Set on create, edit and like changes; `.update()` callers must set it too
+    modified = models.DateTimeField(auto_now=True)
     was_edited = models.BooleanField(default=False)
+    # Denormalized `likes.count()`, see network/counters.py
+    like_count = models.PositiveIntegerField(default=0)
+    # Bumped on every edit; keys the cached card body, see network/caching.py
+    version = models.PositiveIntegerField(default=1)
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self) -> str:
         """Return the text and username truncated if necessary converted to string."""
@@ -64,21 +130,148 @@ class Post(models.Model):
         return f"{self.text} by {self.user}"
 
     def clean(self):
-        """Custom clean method tp prevent users from liking their own posts."""
+        """Custom clean method to reject blank post text."""
         if not self.text.strip():
             raise ValidationError("Post text cannot be empty or whitespace.")
-        if self.pk and self.likes.filter(pk=self.pk).exists():
-            raise ValidationError("Users cannot like their own posts.")
+
+    def edit(self, text: str) -> bool:
+        """
+        Replace the text with one conditional UPDATE, or return False on conflict.
+
+        The UPDATE only matches while `version` is still the one this instance
+        was loaded with, so an edit that landed in between is detected without
+        locking. Model validation is skipped; callers check the new text.
+        """
+        if text == self.text:
+            return True
+        updated = Post.objects.filter(pk=self.pk, version=self.version).update(
+            text=text,
+            was_edited=True,
+            version=models.F("version") + 1,
+            modified=timezone.now(),
+        )
+        if not updated:
+            return False
+        self.text, self.was_edited = text, True
+        self.version += 1
+        self._forget_version(self.version - 1)
+        return True
 
     def num_likes(self) -> int:
         """Return the number of likes for the `Post`."""
-        return self.likes.count()
+        return self.like_count
 
     def save(self, *args, **kwargs):
         """Custom save method to ensure clean() runs on save."""
-        if self.pk and Post.objects.filter(pk=self.pk).exists():
-            original = Post.objects.get(pk=self.pk)
-            if original.text != self.text:
+        stale_version = None
+        if self.pk:
+            original = (
+                Post.objects.filter(pk=self.pk).values_list("text", "version").first()
+            )
+            if original and original[0] != self.text:
                 self.was_edited = True
+                stale_version = original[1]
+                self.version = stale_version + 1
         self.full_clean()
         super().save(*args, **kwargs)
+        if stale_version is not None:
+            self._forget_version(stale_version)
+
+    def _forget_version(self, version: int):
+        """Drop the cached card and pages rendered from an outdated version."""
+        # Readers already moved to the new card key; free the old one
+        invalidate_card(self, version)
+        purge_post_pages(self.pk)
+
+
+class Follow(models.Model):
+    """One row of the follow graph: `from_user` follows `to_user`."""
+
+    class Meta:
+        """Keep the table of the former implicit through model and guard it."""
+
+        db_table = "network_user_following"
+        unique_together = [("from_user", "to_user")]
+        constraints = [
+            models.CheckConstraint(
+                condition=~models.Q(from_user=models.F("to_user")),
+                name="follow_not_self",
+            ),
+        ]
+        # The unique index serves the other direction
+        indexes = [models.Index(fields=["to_user", "from_user"], name="follow_to_from")]
+        verbose_name = "follow"
+        verbose_name_plural = "follows"
+
+    # The implicit through model had a 32-bit id, unlike the other models
+    id = models.AutoField(primary_key=True)
+    from_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    to_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+
+    def __str__(self) -> str:
+        """Return the follower and the followed user ids."""
+        return f"{self.from_user_id} follows {self.to_user_id}"
+
+
+class Like(models.Model):
+    """
+    One like of a post by a user.
+
+    Liking one's own post is rejected by a database trigger, since the post's
+    author lives in another table; see migration 0008.
+    """
+
+    class Meta:
+        """Keep the table of the former implicit through model."""
+
+        db_table = "network_post_likes"
+        unique_together = [("post", "user")]
+        # The unique index serves the other direction
+        indexes = [models.Index(fields=["user", "post"], name="like_user_post")]
+        verbose_name = "like"
+        verbose_name_plural = "likes"
+
+    # The implicit through model had a 32-bit id, unlike the other models
+    id = models.AutoField(primary_key=True)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+
+    def __str__(self) -> str:
+        """Return the liking user id and the post id."""
+        return f"{self.user_id} likes post {self.post_id}"
+
+
+class TimelineEntry(models.Model):
+    """A post fanned out into a follower's materialized Following feed."""
+
+    class Meta:
+        """Index the owner's feed in `(created, post)` order for keyset reads."""
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "post"], name="unique_timeline_entry"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["owner", "created", "post"], name="timeline_owner_created"
+            ),
+            models.Index(fields=["owner", "author"], name="timeline_owner_author"),
+        ]
+        verbose_name = "timeline entry"
+        verbose_name_plural = "timeline entries"
+
+    # The composite indexes lead with owner, so skip the standalone FK index
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="timeline", db_index=False
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    # Copied from the post so the feed never joins back to `network_post`
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    created = models.DateTimeField()
+
+    def __str__(self) -> str:
+        """Return the post id and the timeline owner."""
+        return f"Post {self.post_id} for {self.owner_id}"
@@ -0,0 +1,211 @@
+"""Keyset (cursor) pagination for the post feeds."""
+
+from __future__ import annotations
+
+import base64
+import binascii
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+if TYPE_CHECKING:
+    from django.db.models import QuerySet
+    from django.http import HttpRequest
+
+PER_PAGE = 10
+
+
+def page_size() -> int:
+    """Return how many posts a feed page shows."""
+    return getattr(settings, "FEED_PAGE_SIZE", PER_PAGE)
+
+
+def decode_cursor(
+    cursor: str | None, parse=datetime.fromisoformat
+) -> tuple[bool, tuple[datetime, int]] | None:
+    """
+    Decode an opaque cursor into `(backward, (created, id))`.
+
+    `parse` turns the first sort key back into its type. Returns None when the
+    cursor is missing or malformed so callers fall back to the first page, the
+    same way `Paginator.get_page` forgives bad input.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode() + b"=" * (-len(cursor) % 4))
+        direction, key, pk = raw.decode().split("|")
+        if direction not in ("n", "p"):
+            return None
+        return direction == "p", (parse(key), int(pk))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def encode_cursor(position: tuple[datetime, int], backward: bool = False) -> str:
+    """Encode `(created, id)` and a direction into an opaque URL-safe cursor."""
+    key, pk = position
+    # repr() round-trips floats exactly, such as search scores
+    key = key.isoformat() if isinstance(key, datetime) else repr(key)
+    raw = f"{'p' if backward else 'n'}|{key}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def seek(
+    queryset: QuerySet, position, backward: bool = False, keys=("created", "id")
+) -> QuerySet:
+    """
+    Filter and order `queryset` to the rows strictly past `position`.
+
+    Uses `created <= c AND NOT (created = c AND id >= i)` rather than an OR of
+    the two cases so the database can walk an index on `keys` from the cursor
+    position instead of merging two range scans.
+    """
+    first, second = keys
+    if position is not None:
+        created, pk = position
+        if backward:
+            queryset = queryset.filter(
+                Q(**{f"{first}__gte": created})
+                & ~Q(**{first: created, f"{second}__lte": pk})
+            )
+        else:
+            queryset = queryset.filter(
+                Q(**{f"{first}__lte": created})
+                & ~Q(**{first: created, f"{second}__gte": pk})
+            )
+    if backward:
+        return queryset.order_by(first, second)
+    return queryset.order_by(f"-{first}", f"-{second}")
+
+
+class CursorPage:
+    """A page of objects with opaque cursors for the neighboring pages."""
+
+    def __init__(self, object_list: list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def __repr__(self) -> str:
+        return f"<CursorPage of {len(self)} objects>"
+
+    def has_next(self) -> bool:
+        """Return True if there are older objects after this page."""
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        """Return True if there are newer objects before this page."""
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        """Return True if there is a page in either direction."""
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate newest-first on `(created, id)` without COUNT or OFFSET.
+
+    Each page fetches one extra row to learn whether another page follows.
+    Subclasses that read from somewhere other than `queryset` override `fetch`.
+    """
+
+    keys = ("created", "id")
+    # Turns the first key back from its cursor text
+    parse_key = staticmethod(datetime.fromisoformat)
+
+    def __init__(self, queryset: QuerySet, per_page: int | None = None):
+        self.queryset = queryset
+        self.per_page = per_page or page_size()
+
+    def get_page(self, cursor: str | None) -> CursorPage:
+        """Return the page identified by `cursor`, or the first page."""
+        decoded = decode_cursor(cursor, self.parse_key)
+        backward, position = decoded if decoded else (False, None)
+        rows = self.fetch(position, backward, self.per_page + 1)
+        if backward and not rows:
+            # Nothing is newer than a stale previous cursor, start over
+            return self.get_page(None)
+        return self._page(rows, position, backward)
+
+    async def aget_page(self, cursor: str | None) -> CursorPage:
+        """Async version of `get_page`."""
+        decoded = decode_cursor(cursor, self.parse_key)
+        backward, position = decoded if decoded else (False, None)
+        rows = await self.afetch(position, backward, self.per_page + 1)
+        if backward and not rows:
+            return await self.aget_page(None)
+        return self._page(rows, position, backward)
+
+    def _page(self, rows: list, position, backward: bool) -> CursorPage:
+        """Build a page and its cursors from the rows fetched for it."""
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if backward:
+            rows.reverse()
+            # Moving backward we came from an older page, so one always follows
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(rows) and position is not None
+        next_cursor = previous_cursor = None
+        if has_next:
+            next_cursor = encode_cursor(self.position(rows[-1]))
+        if has_previous:
+            previous_cursor = encode_cursor(self.position(rows[0]), backward=True)
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+    def position(self, obj) -> tuple[datetime, int]:
+        """Return the `(created, id)` sort key for an object on a page."""
+        return tuple(getattr(obj, key) for key in self.keys)
+
+    def fetch(self, position, backward: bool, limit: int) -> list:
+        """
+        Return up to `limit` objects strictly past `position`.
+
+        Rows come back newest-first, or oldest-first when `backward` is set.
+        """
+        return list(seek(self.queryset, position, backward, self.keys)[:limit])
+
+    async def afetch(self, position, backward: bool, limit: int) -> list:
+        """Async version of `fetch`."""
+        rows = seek(self.queryset, position, backward, self.keys)[:limit]
+        return [obj async for obj in rows]
+
+
+def paginate(
+    request: HttpRequest, queryset: QuerySet, paginator: CursorPaginator | None = None
+):
+    """
+    Return the requested page of `queryset` for a feed view.
+
+    A `?page=` number keeps the old offset paginator working for bookmarked
+    links; everything else goes through `paginator`, by default a cursor
+    paginator over `queryset`.
+    """
+    if "page" in request.GET and "cursor" not in request.GET:
+        return Paginator(queryset, page_size()).get_page(request.GET["page"])
+    paginator = paginator or CursorPaginator(queryset)
+    return paginator.get_page(request.GET.get("cursor"))
+
+
+async def apaginate(
+    request: HttpRequest, queryset: QuerySet, paginator: CursorPaginator | None = None
+):
+    """Async version of `paginate`."""
+    if "page" in request.GET and "cursor" not in request.GET:
+        # The offset paginator counts rows, which has no async version
+        paginator = Paginator(queryset, page_size())
+        return await sync_to_async(paginator.get_page)(request.GET["page"])
+    paginator = paginator or CursorPaginator(queryset)
+    return await paginator.aget_page(request.GET.get("cursor"))
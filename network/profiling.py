@@ -0,0 +1,237 @@
+"""
+Opt-in profiling of sampled and slow requests.
+
+A fraction `PROFILE_SAMPLE_RATE` of requests runs under cProfile. Separately,
+while any request is watched, one background thread samples its stack every
+`PROFILE_INTERVAL_MS`. That is cheap enough to leave on, so a request slower
+than `PROFILE_SLOW_MS` still explains itself without having been chosen in
+advance. Each kept request writes, under `PROFILE_DIR`:
+
+- `<name>.prof`: cProfile stats, for `pstats`, snakeviz or `profile_summary`
+- `<name>.folded`: collapsed stacks, for flamegraph.pl or speedscope
+- `<name>.sql`: every query with its duration
+
+Only the newest `PROFILE_KEEP` requests are kept.
+
+Under ASGI a request is a coroutine on the event loop thread, which runs
+other requests' coroutines in between. `RequestProfile.run` follows just the
+request's own steps there. Queries still run on other threads and only appear
+in the `.sql` file, as do synchronous views, which Django runs on a thread.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+
+DEFAULT_INTERVAL_MS = 5
+DEFAULT_KEEP = 200
+SUFFIXES = (".prof", ".folded", ".sql")
+
+
+def sample_rate() -> float:
+    """Return the fraction of requests to run under cProfile."""
+    return getattr(settings, "PROFILE_SAMPLE_RATE", 0.0)
+
+
+def slow_ms() -> float:
+    """Return the latency above which a request is kept, or 0 for never."""
+    return getattr(settings, "PROFILE_SLOW_MS", 0)
+
+
+def enabled() -> bool:
+    """Return whether any request can be profiled."""
+    return sample_rate() > 0 or slow_ms() > 0
+
+
+def _collapse(frame) -> str:
+    """Return a stack as `outer;...;inner` frames, the folded-stacks format."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """A background thread sampling the stacks of watched threads."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.watched: dict[int, Counter] = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def watch(self, thread_id: int, stacks: Counter) -> None:
+        """Start adding a thread's sampled stacks to `stacks`."""
+        with self.lock:
+            self.watched[thread_id] = stacks
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="stack-sampler", daemon=True
+                )
+                self.thread.start()
+        self.wake.set()
+
+    def unwatch(self, thread_id: int) -> None:
+        """Stop sampling a thread."""
+        with self.lock:
+            self.watched.pop(thread_id, None)
+
+    def run(self) -> None:
+        """Sample every watched thread until the process exits."""
+        while True:
+            # Sampling under the lock means an unwatched counter is final
+            with self.lock:
+                if not self.watched:
+                    self.wake.clear()
+                frames = sys._current_frames()
+                for thread_id, stacks in self.watched.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+                del frames
+            if not self.wake.is_set():
+                # Sleep until a request is watched again
+                self.wake.wait()
+                continue
+            time.sleep(self.interval)
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def _get_sampler() -> StackSampler:
+    """Return this process's stack sampler."""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            interval = getattr(settings, "PROFILE_INTERVAL_MS", DEFAULT_INTERVAL_MS)
+            _sampler = StackSampler(interval / 1000)
+    return _sampler
+
+
+class RequestProfile:
+    """The profile of one request: stack samples, maybe cProfile, and its SQL."""
+
+    def __init__(self):
+        self.queries: list[tuple[float, str]] = []
+        self.profiler = cProfile.Profile() if random.random() < sample_rate() else None
+        self.thread_id = None
+        self.stacks = Counter()
+
+    def __enter__(self) -> RequestProfile:
+        self.start = time.perf_counter()
+        self.resume()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.pause()
+        self.elapsed_ms = (time.perf_counter() - self.start) * 1000
+
+    def resume(self) -> None:
+        """Profile the current thread until `pause`."""
+        self.thread_id = threading.get_ident()
+        _get_sampler().watch(self.thread_id, self.stacks)
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def pause(self) -> None:
+        """Stop profiling the thread `resume` was called on."""
+        if self.profiler is not None:
+            self.profiler.disable()
+        _get_sampler().unwatch(self.thread_id)
+
+    def run(self, coroutine) -> _ProfiledCoroutine:
+        """Return an awaitable profiling `coroutine` only while it runs."""
+        return _ProfiledCoroutine(self, coroutine)
+
+    def record_query(self, sql: str, seconds: float) -> None:
+        """Keep a query run by the request and its duration."""
+        self.queries.append((seconds * 1000, sql))
+
+    def keep(self) -> bool:
+        """Return whether this request was sampled or slow."""
+        threshold = slow_ms()
+        return self.profiler is not None or 0 < threshold <= self.elapsed_ms
+
+    def save(self, view: str) -> str:
+        """Write the profile files, rotate old ones, and return the base path."""
+        directory = settings.PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        name = f"{stamp}-{self.elapsed_ms:.0f}ms-{view}-{uuid.uuid4().hex[:6]}"
+        base = os.path.join(directory, name)
+        if self.profiler is not None:
+            self.profiler.dump_stats(base + ".prof")
+        with open(base + ".folded", "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in self.stacks.items())
+        with open(base + ".sql", "w") as f:
+            f.write(f"-- {len(self.queries)} queries in {self.elapsed_ms:.1f} ms\n")
+            f.writelines(f"-- {ms:.3f} ms\n{sql};\n" for ms, sql in self.queries)
+        rotate(directory, getattr(settings, "PROFILE_KEEP", DEFAULT_KEEP))
+        return base
+
+
+class _ProfiledCoroutine:
+    """Await a coroutine, profiling each step it runs and timing the whole."""
+
+    def __init__(self, profile: RequestProfile, coroutine):
+        self.profile = profile
+        self.coroutine = coroutine
+
+    def __await__(self):
+        profile, coroutine = self.profile, self.coroutine
+        profile.start = time.perf_counter()
+        step, value = coroutine.send, None
+        try:
+            while True:
+                # Between steps the loop runs other requests, so stop watching
+                profile.resume()
+                try:
+                    future = step(value)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    profile.pause()
+                try:
+                    value = yield future
+                except GeneratorExit:
+                    coroutine.close()
+                    raise
+                except BaseException as error:
+                    step, value = coroutine.throw, error
+                else:
+                    step = coroutine.send
+        finally:
+            profile.elapsed_ms = (time.perf_counter() - profile.start) * 1000
+
+
+def rotate(directory: str, keep: int) -> None:
+    """Delete all but the newest `keep` profiled requests."""
+    names = sorted(
+        {
+            os.path.splitext(name)[0]
+            for name in os.listdir(directory)
+            if name.endswith(SUFFIXES)
+        }
+    )
+    # Names start with a timestamp, so they sort oldest first
+    for name in names[: max(0, len(names) - keep)]:
+        for suffix in SUFFIXES:
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass
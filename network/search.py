@@ -0,0 +1,142 @@
+"""
+Ranked full-text search over posts.
+
+Migration 0009 indexes post text: SQLite in an FTS5 table, PostgreSQL in a
+generated `tsvector` column with a GIN index. Either way the database updates
+the index in the same statement that writes the text, so posts written by
+compose, edit_post or `bulk_create` are searchable once committed.
+
+Results are ranked best first, by bm25 on SQLite and `ts_rank` on PostgreSQL,
+and paged with `(score, id)` keyset cursors. Only the newest
+`SEARCH_CANDIDATES` matches are ranked. Finding matches newest first is cheap,
+but scoring them is not, and a common word matches a large share of all
+posts. Other databases fall back to an unranked `icontains` scan.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from typing import TYPE_CHECKING
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Value
+
+from .models import Post
+from .pagination import CursorPaginator, seek
+
+if TYPE_CHECKING:
+    from django.db.models import QuerySet
+
+DEFAULT_CANDIDATES = 10_000
+
+# The newest matches, each with a higher score for a better match, as
+# `(id, score)`; scores are only computed for the rows kept
+MATCHES = {
+    "sqlite": (
+        # FTS5's rank is bm25, lower for better matches
+        'SELECT "rowid" AS "id", -"rank" AS "score" FROM "network_post_fts" '
+        'WHERE "network_post_fts" MATCH %s ORDER BY "rowid" DESC LIMIT %s'
+    ),
+    "postgresql": (
+        'SELECT "id", ts_rank("search_vector", "query")::float8 AS "score" '
+        'FROM "network_post", websearch_to_tsquery(\'english\', %s) AS "query" '
+        'WHERE "search_vector" @@ "query" ORDER BY "id" DESC LIMIT %s'
+    ),
+}
+
+
+def candidates() -> int:
+    """Return how many of the newest matches a search ranks."""
+    return getattr(settings, "SEARCH_CANDIDATES", DEFAULT_CANDIDATES)
+
+
+def _fts5_query(text: str) -> str:
+    """Return an FTS5 query matching posts with every word of `text`."""
+    # Quoted, so input is never read as FTS5 query syntax
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", text))
+
+
+def _finite(key: str) -> float:
+    """Parse a score from a cursor, rejecting NaN and infinities."""
+    score = float(key)
+    if not math.isfinite(score):
+        raise ValueError(f"Invalid score {key!r}")
+    return score
+
+
+def search_keys(
+    text: str, position=None, backward: bool = False, limit: int = 10
+) -> list[tuple[float, int]]:
+    """
+    Return up to `limit` `(score, id)` keys of posts matching `text`.
+
+    Keys come best match first, ties newest first, strictly past `position`;
+    in reverse when `backward` is set. Only the newest `candidates()` matches
+    are considered.
+    """
+    if not text.strip():
+        return []
+    matches = MATCHES.get(connection.vendor)
+    if matches is None:
+        posts = Post.objects.filter(text__icontains=text).annotate(
+            score=Value(0.0, output_field=FloatField())
+        )
+        keyset = seek(posts, position, backward, keys=("score", "id"))
+        return list(keyset.values_list("score", "id")[:limit])
+    query = _fts5_query(text) if connection.vendor == "sqlite" else text
+    if not query:
+        # Only punctuation, which no post is indexed under
+        return []
+    sql = f'SELECT "score", "id" FROM ({matches}) AS "matches"'
+    params = [query, candidates()]
+    if position is not None:
+        sql += (
+            ' WHERE "score" > %s OR ("score" = %s AND "id" > %s)'
+            if backward
+            else ' WHERE "score" < %s OR ("score" = %s AND "id" < %s)'
+        )
+        params += [position[0], position[0], position[1]]
+    direction = "ASC" if backward else "DESC"
+    sql += f' ORDER BY "score" {direction}, "id" {direction} LIMIT %s'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, limit])
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+class SearchPaginator(CursorPaginator):
+    """
+    Page through the posts matching a search, best match first.
+
+    The index only returns `(score, id)` keys; the page's posts are then loaded
+    with one primary-key lookup through `queryset`, and carry their score as
+    `search_score`.
+    """
+
+    keys = ("search_score", "id")
+    parse_key = staticmethod(_finite)
+
+    def __init__(self, queryset: QuerySet, text: str, **kw):
+        super().__init__(queryset, **kw)
+        self.text = text
+
+    def fetch(self, position, backward: bool, limit: int) -> list:
+        """Return up to `limit` matching posts strictly past `position`."""
+        keys = search_keys(self.text, position, backward, limit)
+        return self._posts(keys, self.queryset.in_bulk([pk for _, pk in keys]))
+
+    async def afetch(self, position, backward: bool, limit: int) -> list:
+        """Async version of `fetch`."""
+        keys = await sync_to_async(search_keys)(self.text, position, backward, limit)
+        return self._posts(keys, await self.queryset.ain_bulk([pk for _, pk in keys]))
+
+    def _posts(self, keys: list[tuple[float, int]], posts: dict) -> list:
+        """Return the loaded posts in key order, each with its score."""
+        found = []
+        for score, pk in keys:
+            if pk in posts:
+                posts[pk].search_score = score
+                found.append(posts[pk])
+        return found
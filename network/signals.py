@@ -1,37 +1,252 @@
 """Signals to add to the models."""
 
 import logging
+import time
+from functools import partial
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db.models.signals import m2m_changed
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Max
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
+from django.urls import reverse
+from django.utils import timezone
+
+from . import metrics
 
 logger = logging.getLogger(__name__)
 
 
-@receiver(m2m_changed)
+# Self-follows and self-likes are rejected by the database (see the Follow and
+# Like models), which also covers bulk_create and raw SQL. These receivers only
+# turn the common cases into a ValidationError, from ids already in memory.
+
+
+@receiver(m2m_changed, sender="network.Follow")
 def prevent_self_follow(sender, instance, action, pk_set, **kwargs):
     """Signal that validates the following relationship before adding it."""
-    if not instance.pk or not pk_set:
+    # In either direction the instance is one end of every new row
+    if action == "pre_add" and instance.pk in pk_set:
+        logger.warning(f"User {instance.pk} attempted to follow themselves.")
+        raise ValidationError("Users cannot follow themselves.")
+
+
+@receiver(m2m_changed, sender="network.Like")
+def prevent_self_like(sender, instance, action, reverse, pk_set, **kwargs):
+    """Signal that validates a post's new likes before adding them."""
+    # user.liked_posts.add(...) would need the posts' authors; the trigger
+    # rejects those instead
+    if action == "pre_add" and not reverse and instance.user_id in pk_set:
+        logger.warning(
+            f"User {instance.user_id} attempted to like own post {instance.pk}."
+        )
+        raise ValidationError("Users cannot like own posts.")
+
+
+@receiver(post_save, sender="network.Post")
+def fan_out_new_post(sender, instance, created, raw=False, **kwargs):
+    """Signal that copies a new post into its author's followers' timelines."""
+    if not created or raw:
         return
-    from .models import User  # Import here, safely
+    from .feeds import FeedEngine  # Import here, safely
 
-    if sender == User.following.through and action == "pre_add":
-        if instance.pk in pk_set:
-            logger.warning(f"User {instance} attempted to follow themselves.")
-            raise ValidationError("Users cannot follow themselves.")
+    FeedEngine().publish(instance)
 
 
-@receiver(m2m_changed)
-def prevent_self_like(sender, instance, action, pk_set, **kwargs):
-    """Signal that validates the following relationship before adding it."""
-    if not instance.pk or not pk_set:
+@receiver(post_save, sender="network.Post")
+def purge_first_pages(sender, instance, created, raw=False, **kwargs):
+    """Signal that drops the cached pages a new post should now top."""
+    if not created or raw:
+        return
+    from . import caching  # Import here, safely
+
+    caching.purge_first_pages(
+        reverse("index"), reverse("profile", args=[instance.user.username])
+    )
+
+
+@receiver(post_save, sender="network.Post")
+def count_new_post(sender, instance, created, raw=False, **kwargs):
+    """Signal that counts created posts for the metrics endpoint."""
+    if created and not raw:
+        metrics.POSTS_CREATED.inc()
+
+
+@receiver(post_save, sender="network.Post")
+def publish_new_post(sender, instance, created, raw=False, **kwargs):
+    """Signal that tells open live streams about a new post once it is saved."""
+    if not created or raw:
+        return
+    from . import live  # Import here, safely
+
+    transaction.on_commit(partial(live.publish_post, instance))
+
+
+@receiver(post_save, sender="network.Post")
+def advance_watermarks(sender, instance, created, raw=False, **kwargs):
+    """Signal that raises the "new posts since" watermarks once a post is saved."""
+    if not created or raw:
         return
+    from . import watermarks  # Import here, safely
+
+    transaction.on_commit(partial(watermarks.advance, instance))
+
+
+def _stamp_after_deletes(using: str) -> None:
+    """Stamp one post per author who lost posts, once the deletes commit."""
     from .models import Post  # Import here, safely
 
-    if sender == Post.likes.through and action == "pre_add":
-        if instance.user.pk in pk_set:
-            logger.warning(
-                f"User {instance.user} attempted to like own post {instance.pk}."
-            )
-            raise ValidationError("Users cannot like own posts.")
+    author_ids = connections[using].__dict__.pop("deleted_post_authors", set())
+    if not author_ids:
+        return
+    now = timezone.now()
+    newest = (
+        Post.objects.filter(user_id__in=author_ids)
+        .values("user_id")
+        .annotate(newest=Max("pk"))
+        .values("newest")
+    )
+    if not Post.objects.filter(pk__in=newest).update(modified=now):
+        # The authors have no posts left, so move the All Posts watermark
+        newest = Post.objects.order_by("-created", "-id").values("pk")[:1]
+        Post.objects.filter(pk__in=newest).update(modified=now)
+
+
+@receiver(post_delete, sender="network.Post")
+def stamp_after_delete(sender, instance, using, **kwargs):
+    """Signal that moves the feeds' validators past deleted posts."""
+    # Deleting any post but the most recently changed one would leave the
+    # (modified, id) watermarks as they were, so each author's newest
+    # remaining post is stamped. Authors are collected per connection and the
+    # first callback to run stamps them all, so a cascade over many posts
+    # stamps once; ids left by a rollback only add a stamp at the next commit
+    connection = connections[using]
+    connection.__dict__.setdefault("deleted_post_authors", set()).add(instance.user_id)
+    transaction.on_commit(partial(_stamp_after_deletes, using), using=using)
+
+
+def _notify_follows(follower_ids: set, followee_ids: set, following: bool) -> None:
+    """Tell open streams and the poll watermarks of committed follows."""
+    from . import live, watermarks  # Import here, safely
+
+    # Open Following streams start or stop hearing of the authors' posts
+    for follower_id in follower_ids:
+        for followee_id in followee_ids:
+            live.broker.set_follow(follower_id, followee_id, following)
+    # Their Following feeds change, so read their watermarks afresh
+    watermarks.forget(follower_ids)
+
+
+@receiver(post_save, sender="network.Follow")
+@receiver(post_delete, sender="network.Follow")
+def follow_row_changed(sender, instance, signal, raw=False, **kwargs):
+    """Signal that reports a follow row written on its own, e.g. by the view."""
+    if raw or kwargs.get("created") is False:
+        return
+    following = signal is post_save
+    transaction.on_commit(
+        partial(
+            _notify_follows, {instance.from_user_id}, {instance.to_user_id}, following
+        )
+    )
+
+
+@receiver(post_save, sender="network.User")
+def forget_session_hash(sender, instance, raw=False, **kwargs):
+    """Signal that makes polls recheck sessions after a user changes."""
+    if raw:
+        return
+    from . import watermarks  # Import here, safely
+
+    # A new password or deactivation invalidates the user's sessions
+    transaction.on_commit(partial(watermarks.forget_auth, instance.pk))
+
+
+@receiver(m2m_changed, sender="network.Follow")
+def sync_follows(sender, instance, action, reverse, pk_set, **kwargs):
+    """Signal that updates follow counters, then timelines, when follows change."""
+    from .counters import (  # Import here, safely
+        add_follows,
+        bump_graph_versions,
+        recount_follows,
+    )
+    from .feeds import FeedEngine
+
+    if action == "pre_clear":
+        # The cleared ids are gone by post_clear, so remember them now
+        related = instance.followers if reverse else instance.following
+        instance._cleared_follow_ids = set(related.values_list("pk", flat=True))
+        return
+    if action == "post_clear":
+        pk_set = instance.__dict__.pop("_cleared_follow_ids", set())
+    if action not in ("post_add", "post_remove", "post_clear") or not pk_set:
+        return
+    if reverse:
+        # followee.followers.add(...): each follower gains the one author
+        follower_ids, followee_ids = set(pk_set), {instance.pk}
+    else:
+        follower_ids, followee_ids = {instance.pk}, set(pk_set)
+    transaction.on_commit(
+        partial(_notify_follows, follower_ids, followee_ids, action == "post_add")
+    )
+    # Counters go first since the engine reads follower counts
+    engine = FeedEngine()
+    if action == "post_add":
+        # Only the rows actually inserted are in pk_set, so adding is exact
+        add_follows(follower_ids, followee_ids)
+        metrics.FOLLOWS_CREATED.inc(len(pk_set))
+        for follower_id in follower_ids:
+            engine.follow(follower_id, followee_ids)
+        return
+    # pk_set is what was asked for, not what existed, so recount instead
+    recount_follows(follower_ids | followee_ids)
+    bump_graph_versions(follower_ids)
+    for follower_id in follower_ids:
+        engine.unfollow(follower_id, followee_ids)
+    engine.demote_crossed(dict.fromkeys(followee_ids, len(follower_ids)))
+
+
+@receiver(m2m_changed, sender="network.Like")
+def count_likes(sender, instance, action, reverse, pk_set, **kwargs):
+    """Signal that keeps `Post.like_count` in step with the likes table."""
+    from .counters import add_likes, recount_likes  # Import here, safely
+
+    if action == "pre_clear" and reverse:
+        # The cleared posts are gone by post_clear, so remember them now
+        instance._cleared_like_ids = set(
+            instance.liked_posts.values_list("pk", flat=True)
+        )
+        return
+    if action == "post_add" and pk_set:
+        # Only the rows actually inserted are in pk_set, so adding is exact
+        metrics.LIKES_CREATED.inc(len(pk_set))
+        if reverse:
+            add_likes(pk_set, 1)
+        else:
+            add_likes([instance.pk], len(pk_set))
+    elif action == "post_remove" and pk_set:
+        # pk_set is what was asked for, not what existed, so recount instead
+        recount_likes(pk_set if reverse else [instance.pk])
+    elif action == "post_clear":
+        if reverse:
+            recount_likes(instance.__dict__.pop("_cleared_like_ids", set()))
+        else:
+            recount_likes([instance.pk])
+
+
+def _delay_query(execute, sql, params, many, context):
+    """Database execute wrapper that waits before running each query."""
+    time.sleep(settings.SIMULATED_DB_LATENCY_MS / 1000)
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def simulate_db_latency(sender, connection, **kwargs):
+    """Signal that slows a new connection down to `SIMULATED_DB_LATENCY_MS`."""
+    # Sent on every reconnect of the same connection object, so install once
+    if getattr(settings, "SIMULATED_DB_LATENCY_MS", 0) > 0 and (
+        _delay_query not in connection.execute_wrappers
+    ):
+        connection.execute_wrappers.append(_delay_query)
@@ -1,4 +1,6 @@
 const csrftoken = document.querySelector('meta[name="csrf-token"]').content;
+// How often to ask for new posts when there is no live event stream
+const NEW_POSTS_POLL_MS = 30000;
 
 document.addEventListener("DOMContentLoaded", () => {
   // Edit buttons
@@ -9,8 +11,127 @@ document.addEventListener("DOMContentLoaded", () => {
   document.querySelectorAll(".like-button").forEach((button) => {
     attachLikeListener(button);
   });
+  // Infinite scroll
+  const posts = document.querySelector("#posts");
+  if (posts) {
+    attachInfiniteScroll(posts);
+    attachLiveUpdates(posts);
+  }
 });
 
+function attachLiveUpdates(posts) {
+  const eventsUrl = posts.dataset.eventsUrl;
+  const sinceUrl = posts.dataset.sinceUrl;
+  if (!eventsUrl && !sinceUrl) return;
+  // Count new posts in a banner rather than reshuffle what is being read
+  const banner = document.createElement("button");
+  banner.className = "btn btn-outline-primary btn-block mb-3 d-none";
+  banner.id = "new-posts";
+  banner.addEventListener("click", () => {
+    window.location.href = window.location.pathname;
+  });
+  posts.before(banner);
+  const showCount = (count) => {
+    banner.innerText = `Show ${count} new post${count === 1 ? "" : "s"}`;
+    banner.classList.remove("d-none");
+  };
+  if (!eventsUrl || !("EventSource" in window)) {
+    pollForNewPosts(sinceUrl, showCount);
+    return;
+  }
+  let count = 0;
+  let opened = false;
+  const source = new EventSource(eventsUrl);
+  source.addEventListener("open", () => {
+    opened = true;
+  });
+  source.addEventListener("error", () => {
+    // A stream refused outright, e.g. by a WSGI server, falls back to polling
+    if (opened) return;
+    source.close();
+    pollForNewPosts(sinceUrl, showCount);
+  });
+  source.addEventListener("posts", (event) => {
+    count += JSON.parse(event.data).count;
+    showCount(count);
+  });
+}
+
+function pollForNewPosts(sinceUrl, showCount) {
+  if (!sinceUrl) return;
+  // The first poll returns the newest post id, which later polls count from
+  let after = null;
+  const poll = () => {
+    const url = after === null ? sinceUrl : `${sinceUrl}?after=${after}`;
+    fetch(url)
+      .then((response) => {
+        if (!response.ok) throw new Error(response.statusText);
+        return response.json();
+      })
+      .then((data) => {
+        if (after === null) {
+          after = data.newest || 0;
+        } else if (data.count) {
+          showCount(data.count);
+        }
+      })
+      .catch((error) => {
+        console.error("Error:", error);
+      });
+  };
+  poll();
+  setInterval(poll, NEW_POSTS_POLL_MS);
+}
+
+function attachInfiniteScroll(posts) {
+  const feedUrl = posts.dataset.feedUrl;
+  let cursor = posts.dataset.nextCursor;
+  if (!feedUrl || !cursor || !("IntersectionObserver" in window)) return;
+  const showUser = posts.dataset.showUser === "true";
+  const authenticated = posts.dataset.authenticated === "true";
+  // Older posts are appended as they scroll into view, so drop the link
+  const olderPage = document.querySelector("#older-page");
+  if (olderPage) olderPage.classList.add("d-none");
+  // Load the next batch once this marker below the feed gets close
+  const sentinel = document.createElement("div");
+  posts.after(sentinel);
+  let loading = false;
+  const observer = new IntersectionObserver(
+    (entries) => {
+      if (!entries[0].isIntersecting || loading) return;
+      loading = true;
+      // The feed URL may carry a query already, e.g. a search's `q`
+      const url = new URL(feedUrl, window.location.href);
+      url.searchParams.set("cursor", cursor);
+      fetch(url)
+        .then((response) => response.json())
+        .then((data) => {
+          data.posts.forEach((post) => {
+            posts.append(buildPostCard(post, showUser, authenticated));
+          });
+          cursor = data.next_cursor;
+          if (!cursor) {
+            observer.disconnect();
+            sentinel.remove();
+          }
+        })
+        .catch((error) => {
+          console.error("Error:", error);
+        })
+        .finally(() => {
+          loading = false;
+          // Observe again so a marker still in view loads another batch
+          if (cursor) {
+            observer.unobserve(sentinel);
+            observer.observe(sentinel);
+          }
+        });
+    },
+    { rootMargin: "600px" }
+  );
+  observer.observe(sentinel);
+}
+
 function attachEditListener(editButton) {
   editButton.addEventListener("click", () => {
     const postId = editButton.dataset.postId;
@@ -36,10 +157,12 @@ function attachEditListener(editButton) {
 function attachLikeListener(likeButton) {
   likeButton.addEventListener("click", () => {
     const postId = likeButton.dataset.postId;
+    // Ask for the opposite state; repeating a request is harmless
+    const method = likeButton.classList.contains("liked") ? "DELETE" : "PUT";
     // Disable button to prevent double clicks
     likeButton.disabled = true;
     fetch(`/like/${postId}`, {
-      method: "PUT",
+      method: method,
       headers: {
         "X-CSRFToken": csrftoken,
       },
@@ -53,6 +176,7 @@ function attachLikeListener(likeButton) {
           const heart = data.liked ? "❤️" : "♡";
           likeButton.innerText = `${heart} ${data.num_likes}`;
           likeButton.classList.toggle("liked", data.liked);
+          likeButton.setAttribute("aria-pressed", String(data.liked));
         }
       })
       .catch((error) => {
@@ -75,7 +199,11 @@ function attachSaveListener(saveButton, editButton, textarea) {
         "Content-Type": "application/json",
         "X-CSRFToken": csrftoken,
       },
-      body: JSON.stringify({ text: textarea.value.trim() }),
+      // The version lets the server refuse to overwrite a newer edit
+      body: JSON.stringify({
+        text: textarea.value.trim(),
+        version: Number(editButton.dataset.postVersion),
+      }),
     })
       .then((response) => response.json())
       .then((data) => {
@@ -97,6 +225,7 @@ function attachSaveListener(saveButton, editButton, textarea) {
         saveButton.remove();
         textarea.replaceWith(newParagraph);
         editButton.dataset.postText = data.new_text;
+        editButton.dataset.postVersion = data.version;
         editButton.style.display = "inline-block";
       })
       .catch((error) => {
@@ -106,19 +235,8 @@ function attachSaveListener(saveButton, editButton, textarea) {
   });
 }
 
-function insertPostCard(data) {
-  const postsContainer = document.querySelector("#posts");
-  const newPost = document.createElement("div");
-  newPost.className = "card mb-3";
-  const postBody = document.createElement("div");
-  postBody.className = "card-body";
-  // Post text
-  const postText1 = document.createElement("p");
-  postText1.className = "card-text";
-  postText1.id = `post-${data.post_id}`;
-  postText1.innerText = data.text;
-  // Created date
-  const date = new Date(data.created);
+function formatCreated(iso) {
+  // Match the server-rendered timestamps
   const options = {
     year: "numeric",
     month: "long", // Full month name
@@ -127,44 +245,81 @@ function insertPostCard(data) {
     minute: "2-digit",
     hour12: true, // Use 12-hour format with AM/PM
   };
-  let created = date
+  return new Date(iso)
     .toLocaleString("en-US", options)
     .replace("AM", "a.m.")
     .replace("PM", "p.m.");
-  const postText2 = document.createElement("small");
-  postText2.className = "text-muted";
-  postText2.innerText = `${created} by `;
-  // User profile link
-  const postUser = document.createElement("a");
-  postUser.href = `/profile/${data.username}`;
-  postUser.innerText = data.username;
-  postText2.append(postUser);
+}
+
+function buildPostCard(post, showUser, authenticated) {
+  // Mirror partials/post_card.html for posts loaded from the feed API
+  const card = document.createElement("div");
+  card.className = "card mb-3";
+  const cardBody = document.createElement("div");
+  cardBody.className = "card-body";
+  // Post text
+  const postText = document.createElement("p");
+  postText.className = "card-text";
+  postText.id = `post-${post.post_id}`;
+  postText.innerText = post.text;
+  // Created date and user profile link
+  const postCreated = document.createElement("small");
+  postCreated.className = "text-muted";
+  postCreated.innerText = formatCreated(post.created);
+  if (showUser) {
+    const postUser = document.createElement("a");
+    postUser.href = `/profile/${post.username}`;
+    postUser.innerText = post.username;
+    postCreated.append(" by ", postUser);
+  }
   // Edited marker
   const postEdited = document.createElement("small");
   postEdited.className = "text-muted";
-  postEdited.id = `post-edited-${data.post_id}`;
-  postText2.append(postEdited);
+  postEdited.id = `post-edited-${post.post_id}`;
+  postEdited.innerText = post.was_edited ? "(edited)" : "";
   // Like + edit buttons
-  const postLikeDiv = document.createElement("div");
-  postLikeDiv.className = "mt-2";
-  // Like button
-  const postLike = document.createElement("button");
-  postLike.className = "btn btn-sm like-button disabled";
-  postLike.disabled = true;
-  postLike.setAttribute("aria-disabled", "true");
-  postLike.title = "You can't like your own posts.";
-  postLike.innerText = "♡ 0";
-  attachLikeListener(postLike);
-  // Edit button
-  const postEdit = document.createElement("button");
-  postEdit.className = "btn btn-sm btn-outline-secondary edit-button";
-  postEdit.dataset.postId = data.post_id;
-  postEdit.dataset.postText = data.text;
-  postEdit.innerText = "✏️ Edit";
-  attachLikeListener(postEdit);
-  postLikeDiv.append(postLike, postEdit);
-  postBody.append(postText1, postText2, postLikeDiv);
-  newPost.append(postBody);
+  const buttons = document.createElement("div");
+  buttons.className = "mt-2";
+  const likeButton = document.createElement("button");
+  likeButton.className = "btn btn-sm like-button";
+  if (!authenticated || post.own) {
+    likeButton.classList.add("disabled");
+    likeButton.disabled = true;
+    likeButton.setAttribute("aria-disabled", "true");
+    likeButton.title = authenticated
+      ? "You can't like your own posts."
+      : "Log in to like posts.";
+    likeButton.innerText = `♡ ${post.num_likes}`;
+  } else {
+    likeButton.dataset.postId = post.post_id;
+    likeButton.classList.toggle("liked", post.liked);
+    likeButton.setAttribute("aria-pressed", String(post.liked));
+    likeButton.innerText = `${post.liked ? "❤️" : "♡"} ${post.num_likes}`;
+    attachLikeListener(likeButton);
+  }
+  buttons.append(likeButton);
+  if (post.own) {
+    const editButton = document.createElement("button");
+    editButton.className = "btn btn-sm btn-outline-secondary edit-button";
+    editButton.dataset.postId = post.post_id;
+    editButton.dataset.postText = post.text;
+    editButton.dataset.postVersion = post.version;
+    editButton.innerText = "✏️ Edit";
+    attachEditListener(editButton);
+    buttons.append(" ", editButton);
+  }
+  cardBody.append(postText, postCreated, " ", postEdited, buttons);
+  card.append(cardBody);
+  return card;
+}
+
+function insertPostCard(data) {
+  const postsContainer = document.querySelector("#posts");
+  const newPost = buildPostCard(
+    { ...data, was_edited: false, num_likes: 0, liked: false, own: true },
+    true,
+    true
+  );
   postsContainer.prepend(newPost);
   setTimeout(() => newPost.classList.add("visible"), 50);
   // Remove "no posts yet" placeholder if present
@@ -0,0 +1,20 @@
+"""Template tags for rendering post cards through the fragment cache."""
+
+from django import template
+from django.template.loader import render_to_string
+
+from ..caching import get_card, set_card
+
+register = template.Library()
+
+
+@register.simple_tag
+def card_body(post, show_user=True):
+    """Render the viewer-independent body of a post card, cached by version."""
+    html = get_card(post, show_user)
+    if html is None:
+        html = render_to_string(
+            "network/partials/post_body.html", {"post": post, "show_user": show_user}
+        )
+        set_card(post, show_user, html)
+    return html
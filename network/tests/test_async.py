@@ -0,0 +1,89 @@
+"""Test the async views through Django's ASGI request handler."""
+
+import json
+
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
+
+from network.models import Follow, Like, Post, User
+
+
+class AsyncViewTest(TestCase):
+    """Test that the feeds, compose and toggles work on the event loop."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username="alice", password="test123")
+        cls.bob = User.objects.create_user(username="bob", password="test123")
+        cls.post = Post.objects.create(user=cls.bob, text="Hello from Bob")
+
+    def setUp(self):
+        self.async_client = AsyncClient()
+        self.async_client.force_login(self.alice)
+
+    async def test_feeds(self):
+        """Test that every feed page and API renders under ASGI."""
+        await self.async_client.post(reverse("toggle_follow", args=["bob"]))
+        for url in (
+            reverse("index"),
+            reverse("following"),
+            reverse("profile", args=["bob"]),
+            reverse("api_posts"),
+            reverse("api_following"),
+            reverse("api_profile_posts", args=["bob"]),
+        ):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(b"Hello from Bob", response.content)
+
+    async def test_offset_pages(self):
+        """Test that old `?page=` links still count pages off the event loop."""
+        response = await self.async_client.get(reverse("index"), {"page": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["page"].paginator.count, 1)
+
+    async def test_anonymous_pages(self):
+        """Test that logged-out pages are cached and login redirects work."""
+        client = AsyncClient()
+        for _ in range(2):
+            response = await client.get(reverse("index"))
+            self.assertEqual(response.status_code, 200)
+        response = await client.get(reverse("following"))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_compose(self):
+        """Test that a post composed under ASGI is saved and fanned out."""
+        response = await self.async_client.post(
+            reverse("compose"),
+            json.dumps({"text": "Async hello"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        post = await Post.objects.aget(pk=response.json()["post_id"])
+        self.assertEqual(post.user_id, self.alice.pk)
+
+    async def test_toggles(self):
+        """Test that likes and follows change state and counters under ASGI."""
+        like = reverse("toggle_like", args=[self.post.pk])
+        response = await self.async_client.put(like)
+        self.assertEqual(response.json()["num_likes"], 1)
+        self.assertTrue(await Like.objects.filter(post=self.post).aexists())
+        response = await self.async_client.delete(like)
+        self.assertEqual(response.json()["num_likes"], 0)
+        follow = reverse("toggle_follow", args=["bob"])
+        response = await self.async_client.post(follow)
+        self.assertEqual(response.json()["num_followers"], 1)
+        self.assertTrue(await Follow.objects.filter(to_user=self.bob).aexists())
+        response = await self.async_client.post(
+            reverse("toggle_follow", args=["alice"])
+        )
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(REQUEST_TIMING=True)
+    async def test_middleware_sees_queries(self):
+        """Test that queries run by the async ORM's thread are still timed."""
+        client = AsyncClient()
+        await client.aforce_login(self.alice)
+        response = await client.get(reverse("api_posts"))
+        self.assertRegex(response["Server-Timing"], r'desc="[1-9]\d* queries"')
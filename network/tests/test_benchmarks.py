@@ -0,0 +1,93 @@
+"""Test the benchmark helpers: result comparison, text and the HTTP load driver."""
+
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import SimpleTestCase
+
+from network.benchmarks import http_load, regressions, synthetic_texts, vocabulary
+
+
+def result(p95: float, queries: int) -> dict:
+    """Return a one-view, one-scale `benchmark_views` result."""
+    return {
+        "scales": {
+            "1000": {
+                "views": {"index": {"ms": {"p95": p95}, "queries": {"max": queries}}}
+            }
+        }
+    }
+
+
+class RegressionTest(SimpleTestCase):
+    """Test that `regressions()` flags slower views and extra queries."""
+
+    def test_within_tolerance_passes(self):
+        """Test that noise below the tolerance is not reported."""
+        self.assertEqual(regressions(result(10, 4), result(12, 4), 0.25), [])
+
+    def test_slower_view_flagged(self):
+        """Test that p95 growth beyond the tolerance is reported."""
+        found = regressions(result(10, 4), result(13, 4), 0.25)
+        self.assertEqual(found, ["index @ 1000 posts: p95 10.00 -> 13.00 ms"])
+
+    def test_extra_query_flagged(self):
+        """Test that any increase in queries per request is reported."""
+        found = regressions(result(10, 4), result(9, 5))
+        self.assertEqual(found, ["index @ 1000 posts: 4 -> 5 queries"])
+
+    def test_new_scales_skipped(self):
+        """Test that scales absent from the baseline are not compared."""
+        self.assertEqual(regressions({"scales": {}}, result(10, 4)), [])
+
+
+class SyntheticTextTest(SimpleTestCase):
+    """Test the made-up post texts that searches are benchmarked on."""
+
+    def test_common_words_dominate(self):
+        """Test that texts are repeatable and use early words most often."""
+        words = vocabulary(100)
+        self.assertEqual(len(set(words)), 100)
+        texts = list(synthetic_texts(200, words, random.Random(0)))
+        self.assertEqual(texts, list(synthetic_texts(200, words, random.Random(0))))
+        counts = [" ".join(texts).split().count(word) for word in words]
+        self.assertGreater(counts[0], 10 * counts[-1] + 10)
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """Answer GET /<status> with that status."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(int(self.path[1:]))
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpLoadTest(SimpleTestCase):
+    """Test that `http_load()` counts requests, errors and throughput."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StatusHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_successful_requests(self):
+        """Test that every client keeps requesting until the duration is up."""
+        result = http_load(self.server.server_address, "/200", 4, 0.2)
+        self.assertGreater(result["requests"], 4)
+        self.assertEqual(result["errors"], 0)
+        self.assertGreater(result["rps"], 0)
+        self.assertGreater(result["ms"]["p99"], 0)
+
+    def test_error_statuses_counted(self):
+        """Test that error responses count as failed requests."""
+        result = http_load(self.server.server_address, "/503", 2, 0.1)
+        self.assertEqual(result["errors"], result["requests"])
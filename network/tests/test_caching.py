@@ -0,0 +1,179 @@
+"""Test the post card and anonymous page caches."""
+
+import json
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from network.caching import card_key, card_stats, page_key, page_stats, reset_stats
+from network.models import Post, User
+
+
+class PostCardCacheTest(TestCase):
+    """Test that card bodies are cached per version and layered per viewer."""
+
+    def setUp(self):
+        cache.clear()
+        reset_stats()
+        self.client = Client()
+        self.alice = User.objects.create_user(username="alice", password="test123")
+        self.bob = User.objects.create_user(username="bob", password="test123")
+        self.post = Post.objects.create(user=self.alice, text="First draft")
+
+    def test_second_render_hits_cache(self):
+        """Test that rendering a feed twice renders each card body once."""
+        self.client.login(username="bob", password="test123")
+        self.client.get(reverse("index"))
+        self.assertEqual(card_stats()["misses"], 1)
+        self.assertIsNotNone(cache.get(card_key(self.post, 1, True)))
+        response = self.client.get(reverse("index"))
+        self.assertEqual(card_stats()["hits"], 1)
+        self.assertContains(response, "First draft")
+
+    def test_profile_and_feed_are_cached_separately(self):
+        """Test that cards with and without the author link do not collide."""
+        self.client.get(reverse("index"))
+        response = self.client.get(reverse("profile", args=["alice"]))
+        self.assertEqual(card_stats()["misses"], 2)
+        self.assertNotContains(response, 'by <a href="/profile/alice">')
+
+    def test_edit_bumps_version_and_drops_old_key(self):
+        """Test that an edit moves readers to a fresh key and frees the old one."""
+        self.client.get(reverse("index"))
+        self.client.login(username="alice", password="test123")
+        self.client.put(
+            reverse("edit_post", args=[self.post.pk]),
+            data=json.dumps({"text": "Second draft"}),
+            content_type="application/json",
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 2)
+        self.assertIsNone(cache.get(card_key(self.post, 1, True)))
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "Second draft")
+        self.assertContains(response, "(edited)")
+        self.assertNotContains(response, "First draft")
+
+    def test_saving_unchanged_text_keeps_version(self):
+        """Test that a save without a text change keeps the cached body."""
+        self.post.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 1)
+
+    def test_like_state_is_per_viewer(self):
+        """Test that a cached body still renders each viewer's like state."""
+        self.post.likes.add(self.bob)
+        self.client.login(username="bob", password="test123")
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, 'aria-pressed="true"')
+        carol = User.objects.create_user(username="carol", password="test123")
+        self.client.force_login(carol)
+        response = self.client.get(reverse("index"))
+        self.assertEqual(card_stats()["hits"], 1)
+        self.assertContains(response, 'aria-pressed="false"')
+        self.assertContains(response, "1\n")
+
+    def test_cache_stats_are_staff_only(self):
+        """Test that only staff can read the cache counters."""
+        self.client.login(username="alice", password="test123")
+        response = self.client.get(reverse("cache_stats"))
+        self.assertEqual(response.status_code, 403)
+        User.objects.filter(pk=self.alice.pk).update(is_staff=True)
+        self.client.get(reverse("index"))
+        response = self.client.get(reverse("cache_stats"))
+        self.assertEqual(response.json()["post_cards"]["misses"], 1)
+
+
+class AnonymousPageCacheTest(TestCase):
+    """Test that logged-out feed pages are cached and purged precisely."""
+
+    def setUp(self):
+        cache.clear()
+        reset_stats()
+        self.client = Client()
+        self.alice = User.objects.create_user(username="alice", password="test123")
+        self.posts = [
+            Post.objects.create(user=self.alice, text=f"Post {i}") for i in range(12)
+        ]
+
+    def edit(self, post, text):
+        """Edit a post through the view as its author."""
+        author = Client()
+        author.force_login(post.user)
+        author.put(
+            reverse("edit_post", args=[post.pk]),
+            data=json.dumps({"text": text}),
+            content_type="application/json",
+        )
+
+    def test_second_request_skips_the_database(self):
+        """Test that a cached page is served without any queries."""
+        for url in (reverse("index"), reverse("profile", args=["alice"])):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.client.get(url)
+                self.assertEqual(first.content, second.content)
+        self.assertEqual(page_stats()["hits"], 2)
+
+    def test_logged_in_and_offset_pages_are_not_cached(self):
+        """Test that personalized and `?page=` requests always render."""
+        self.client.get(reverse("index") + "?page=2")
+        self.client.force_login(self.alice)
+        self.client.get(reverse("index"))
+        self.assertIsNone(cache.get(page_key(reverse("index"))))
+        self.assertEqual(page_stats()["misses"], 0)
+
+    @override_settings(CACHE_SHARED=False)
+    def test_not_cached_per_worker(self):
+        """Test that pages are not cached when each worker has its own cache."""
+        self.client.get(reverse("index"))
+        self.assertIsNone(cache.get(page_key(reverse("index"))))
+        self.assertEqual(page_stats()["misses"], 0)
+
+    def test_new_post_purges_first_pages(self):
+        """Test that composing a post purges the index and author's profile."""
+        self.client.get(reverse("index"))
+        self.client.get(reverse("profile", args=["alice"]))
+        author = Client()
+        author.force_login(self.alice)
+        author.post(
+            reverse("compose"),
+            data=json.dumps({"text": "Fresh post"}),
+            content_type="application/json",
+        )
+        self.assertContains(self.client.get(reverse("index")), "Fresh post")
+        self.assertContains(
+            self.client.get(reverse("profile", args=["alice"])), "Fresh post"
+        )
+
+    def test_edit_purges_only_pages_showing_the_post(self):
+        """Test that an edit purges the older page showing the post."""
+        first = self.client.get(reverse("index"))
+        older_url = reverse("index") + "?cursor=" + first.context["page"].next_cursor
+        self.client.get(older_url)
+        self.edit(self.posts[0], "Edited oldest post")
+        self.assertIsNotNone(cache.get(page_key(reverse("index"))))
+        self.assertContains(self.client.get(older_url), "Edited oldest post")
+
+    def test_stale_page_served_while_locked(self):
+        """Test that only the lock holder regenerates an expired page."""
+        self.client.get(reverse("index"))
+        key = page_key(reverse("index"))
+        entry = cache.get(key)
+        entry["fresh_until"] = 0
+        cache.set(key, entry)
+        cache.add(f"{key}:lock", 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("index"))
+        self.assertEqual(response.content, entry["content"])
+        self.assertEqual(page_stats()["stale"], 1)
+        cache.delete(f"{key}:lock")
+        self.client.get(reverse("index"))
+        self.assertGreater(cache.get(key)["fresh_until"], 0)
+
+    def test_anonymous_pages_carry_no_csrf_token(self):
+        """Test that a shared cached page never leaks a visitor's CSRF token."""
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, '<meta name="csrf-token" content="">')
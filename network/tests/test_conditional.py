@@ -0,0 +1,153 @@
+"""Test the ETag and Last-Modified validators of the feeds."""
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import http_date
+
+from network.models import Post, User
+
+
+class ConditionalFeedTest(TestCase):
+    """Test that unchanged feeds answer 304 and changes produce new ETags."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.alice = User.objects.create_user(username="alice", password="test123")
+        self.bob = User.objects.create_user(username="bob", password="test123")
+        self.post = Post.objects.create(user=self.bob, text="Hello")
+        self.client.login(username="alice", password="test123")
+
+    def etag(self, url):
+        """Return the ETag of a fresh GET."""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response["ETag"]
+
+    def test_unchanged_feeds_answer_not_modified(self):
+        """Test that a matching ETag skips the feed query and the render."""
+        urls = [
+            reverse("index"),
+            reverse("following"),
+            reverse("profile", args=["bob"]),
+            reverse("api_posts"),
+            reverse("api_following"),
+            reverse("api_profile_posts", args=["bob"]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.etag(url)
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b"")
+                post_queries = [
+                    query
+                    for query in context.captured_queries
+                    if '"network_post"' in query["sql"]
+                ]
+                self.assertEqual(len(post_queries), 1)
+
+    def test_writes_change_the_etag(self):
+        """Test that new posts, edits and likes each change the ETag."""
+        url = reverse("index")
+        etags = {self.etag(url)}
+        Post.objects.create(user=self.bob, text="Another")
+        etags.add(self.etag(url))
+        self.post.text = "Hello, edited"
+        self.post.save()
+        etags.add(self.etag(url))
+        self.client.put(reverse("toggle_like", args=[self.post.pk]))
+        etags.add(self.etag(url))
+        self.assertEqual(len(etags), 4)
+
+    def test_following_tracks_the_follow_graph(self):
+        """Test that following someone changes the Following feed's ETag."""
+        url = reverse("following")
+        before = self.etag(url)
+        self.alice.following.add(self.bob)
+        self.assertNotEqual(self.etag(url), before)
+
+    def test_profile_tracks_its_header(self):
+        """Test that a profile's ETag changes with its follower count."""
+        url = reverse("profile", args=["bob"])
+        before = self.etag(url)
+        carol = User.objects.create_user(username="carol", password="test123")
+        carol.following.add(self.bob)
+        self.assertNotEqual(self.etag(url), before)
+
+    def test_viewers_get_their_own_etags(self):
+        """Test that the same page has a different ETag per viewer."""
+        url = reverse("index")
+        alice_etag = self.etag(url)
+        anonymous = Client()
+        response = anonymous.get(url, HTTP_IF_NONE_MATCH=alice_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cached_anonymous_page_answers_not_modified(self):
+        """Test that a page cache hit revalidates without any queries."""
+        anonymous = Client()
+        etag = anonymous.get(reverse("index"))["ETag"]
+        with self.assertNumQueries(0):
+            response = anonymous.get(reverse("index"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_profile_is_not_found(self):
+        """Test that an unknown profile still answers 404."""
+        response = self.client.get(reverse("profile", args=["nobody"]))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_if_modified_since_alone(self):
+        """Test that a date alone never revalidates a page that depends on more."""
+        # Later than anything stored, so any Last-Modified would match it
+        since = http_date(self.post.modified.timestamp() + 60)
+        self.alice.following.add(self.bob)
+        for url in (
+            reverse("index"),
+            reverse("following"),
+            reverse("profile", args=["bob"]),
+            reverse("api_following"),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header("Last-Modified"))
+        anonymous = Client()
+        url = reverse("profile", args=["bob"])
+        self.assertFalse(anonymous.get(url).has_header("Last-Modified"))
+
+    def test_anonymous_if_modified_since(self):
+        """Test that logged-out All Posts pages revalidate by date until a delete."""
+        anonymous = Client()
+        older = Post.objects.create(user=self.alice, text="Older")
+        # Dates have whole seconds, so the delete must come in a later one
+        Post.objects.update(modified=self.post.modified - timedelta(minutes=1))
+        since = anonymous.get(reverse("api_posts"))["Last-Modified"]
+        response = anonymous.get(reverse("api_posts"), HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            older.delete()
+        response = anonymous.get(reverse("api_posts"), HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleting_user_stamps_once(self):
+        """Test that deleting a user's posts costs the same queries however many."""
+        url = reverse("index")
+        for posts in (1, 5):
+            with self.subTest(posts=posts):
+                author = User.objects.create_user(username=f"author{posts}")
+                for i in range(posts):
+                    Post.objects.create(user=author, text=f"Post {i}")
+                before = self.etag(url)
+                # Loading the posts and follows, the cascade's deletes, and
+                # two stamps since the author has no posts left
+                with self.assertNumQueries(14):
+                    with self.captureOnCommitCallbacks(execute=True):
+                        author.delete()
+                self.assertNotEqual(self.etag(url), before)
@@ -0,0 +1,261 @@
+"""Test the denormalized counter columns."""
+
+import threading
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from network.counters import reconcile_follow_counts, reconcile_like_counts
+from network.models import Post
+
+User = get_user_model()
+
+
+class LikeCountTest(TestCase):
+    """Test that `Post.like_count` follows the likes table."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="test123")
+        self.bob = User.objects.create_user(username="bob", password="test123")
+        self.charlie = User.objects.create_user(username="charlie", password="test123")
+        self.post = Post.objects.create(user=self.alice, text="Alice's post")
+        self.other = Post.objects.create(user=self.alice, text="Another post")
+
+    def like_count(self, post):
+        """Return the stored like counter of a post."""
+        post.refresh_from_db(fields=["like_count"])
+        return post.like_count
+
+    def test_add_and_remove(self):
+        """Test adding, re-adding and removing likes from the post side."""
+        self.post.likes.add(self.bob, self.charlie)
+        self.post.likes.add(self.bob)  # Already liked, not counted again
+        self.assertEqual(self.like_count(self.post), 2)
+        self.post.likes.remove(self.bob, self.bob.pk + 100)
+        self.assertEqual(self.like_count(self.post), 1)
+        self.assertEqual(self.post.num_likes(), 1)
+
+    def test_reverse_remove_and_clear(self):
+        """Test removing and clearing likes from the user side."""
+        for post in (self.post, self.other):
+            post.likes.add(self.bob, self.charlie)
+        self.charlie.liked_posts.remove(self.post)
+        self.assertEqual(self.like_count(self.post), 1)
+        self.assertEqual(self.like_count(self.other), 2)
+        self.bob.liked_posts.clear()
+        self.assertEqual(self.like_count(self.post), 0)
+        self.assertEqual(self.like_count(self.other), 1)
+
+    def test_post_side_clear(self):
+        """Test clearing every like on a post."""
+        self.post.likes.add(self.bob, self.charlie)
+        self.post.likes.clear()
+        self.assertEqual(self.like_count(self.post), 0)
+
+    def test_toggle_like_updates_counter(self):
+        """Test that the toggle view reports and stores the new count."""
+        self.post.likes.add(self.charlie)
+        client = Client()
+        client.login(username="bob", password="test123")
+        url = reverse("toggle_like", args=[self.post.id])
+        response = client.put(url, content_type="application/json")
+        self.assertEqual(response.json()["num_likes"], 2)
+        self.assertEqual(self.like_count(self.post), 2)
+        response = client.delete(url, content_type="application/json")
+        self.assertEqual(response.json()["num_likes"], 1)
+        self.assertEqual(self.like_count(self.post), 1)
+
+    def test_unlike_with_drifted_counter(self):
+        """Test that unliking a post whose counter is already 0 keeps it at 0."""
+        self.post.likes.add(self.bob)
+        Post.objects.filter(pk=self.post.pk).update(like_count=0)
+        client = Client()
+        client.force_login(self.bob)
+        response = client.delete(reverse("toggle_like", args=[self.post.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["num_likes"], 0)
+        self.assertEqual(self.like_count(self.post), 0)
+
+    def test_reconcile_repairs_drift(self):
+        """Test that reconciliation finds and fixes drifted counters only."""
+        self.post.likes.add(self.bob, self.charlie)
+        self.other.likes.add(self.bob)
+        Post.objects.filter(pk=self.post.pk).update(like_count=7)
+        Post.objects.filter(pk=self.other.pk).update(like_count=0)
+        self.assertEqual(reconcile_like_counts(batch_size=1, dry_run=True), 2)
+        self.assertEqual(self.like_count(self.post), 7)
+        self.assertEqual(reconcile_like_counts(batch_size=1), 2)
+        self.assertEqual(self.like_count(self.post), 2)
+        self.assertEqual(self.like_count(self.other), 1)
+        self.assertEqual(reconcile_like_counts(), 0)
+
+    def test_reconcile_counters_command(self):
+        """Test that the management command repairs drifted counters."""
+        self.post.likes.add(self.bob)
+        Post.objects.filter(pk=self.post.pk).update(like_count=0)
+        out = StringIO()
+        call_command("reconcile_counters", stdout=out)
+        self.assertIn("1 post like counts repaired", out.getvalue())
+        self.assertEqual(self.like_count(self.post), 1)
+
+
+class FollowCountTest(TestCase):
+    """Test that the stored follow counters follow the follows table."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="test123")
+        self.bob = User.objects.create_user(username="bob", password="test123")
+        self.charlie = User.objects.create_user(username="charlie", password="test123")
+
+    def counts(self, user):
+        """Return the stored (followers, following) counters of a user."""
+        user.refresh_from_db(fields=["follower_count", "following_count"])
+        return user.follower_count, user.following_count
+
+    def test_add_remove_and_clear(self):
+        """Test following from both sides, then unfollowing and clearing."""
+        self.alice.following.add(self.bob, self.charlie)
+        self.alice.following.add(self.bob)  # Already following
+        self.charlie.followers.add(self.bob)
+        self.assertEqual(self.counts(self.alice), (0, 2))
+        self.assertEqual(self.counts(self.bob), (1, 1))
+        self.assertEqual(self.counts(self.charlie), (2, 0))
+        self.alice.following.remove(self.charlie)
+        self.assertEqual(self.counts(self.alice), (0, 1))
+        self.assertEqual(self.counts(self.charlie), (1, 0))
+        self.bob.followers.clear()
+        self.assertEqual(self.counts(self.alice), (0, 0))
+        self.assertEqual(self.counts(self.bob), (0, 1))
+
+    def test_unfollow_with_drifted_counters(self):
+        """Test that unfollowing with both counters already at 0 keeps them at 0."""
+        self.alice.following.add(self.bob)
+        User.objects.update(follower_count=0, following_count=0)
+        client = Client()
+        client.force_login(self.alice)
+        response = client.delete(reverse("toggle_follow", args=["bob"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts(self.alice), (0, 0))
+        self.assertEqual(self.counts(self.bob), (0, 0))
+
+    def test_toggle_follow_reports_stored_count(self):
+        """Test that the toggle view returns the updated follower counter."""
+        self.charlie.following.add(self.bob)
+        client = Client()
+        client.login(username="alice", password="test123")
+        url = reverse("toggle_follow", args=["bob"])
+        self.assertEqual(client.post(url).json()["num_followers"], 2)
+        self.assertEqual(client.delete(url).json()["num_followers"], 1)
+        self.assertEqual(self.counts(self.bob), (1, 0))
+
+    def test_profile_header_is_one_query(self):
+        """Test that the profile reads counters and follow state in one query."""
+        self.alice.following.add(self.bob)
+        client = Client()
+        client.login(username="alice", password="test123")
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(reverse("profile", args=["bob"]))
+        self.assertContains(response, "1 follower</span>")
+        self.assertTrue(response.context["is_following"])
+        follow_queries = [
+            query["sql"]
+            for query in context.captured_queries
+            if "network_user_following" in query["sql"]
+        ]
+        self.assertEqual(len(follow_queries), 1)
+        self.assertIn("EXISTS", follow_queries[0])
+
+    def test_reconcile_repairs_drift(self):
+        """Test that reconciliation repairs drifted follow counters."""
+        self.alice.following.add(self.bob)
+        User.objects.filter(pk=self.alice.pk).update(following_count=5)
+        User.objects.filter(pk=self.bob.pk).update(follower_count=0)
+        self.assertEqual(reconcile_follow_counts(batch_size=2), 2)
+        self.assertEqual(self.counts(self.alice), (0, 1))
+        self.assertEqual(self.counts(self.bob), (1, 0))
+
+
+class ConcurrentToggleTest(TransactionTestCase):
+    """Test that racing like requests leave exact state and counters."""
+
+    THREADS = 8
+    ROUNDS = 5
+
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            # Threads need their own connections to one on-disk database, which
+            # the settings give the tests unless TEST["NAME"] is overridden
+            self.skipTest("needs a file-backed test database")
+        self.author = User.objects.create_user(username="author", password="test123")
+        self.post = Post.objects.create(user=self.author, text="Hot post")
+        self.fans = [
+            User.objects.create_user(username=f"fan{i}", password="test123")
+            for i in range(self.THREADS)
+        ]
+
+    def hammer(self, fan, methods, statuses):
+        """Send `methods` for one fan from its own thread and connection."""
+        try:
+            client = Client()
+            client.force_login(fan)
+            url = reverse("toggle_like", args=[self.post.pk])
+            for method in methods:
+                statuses.append(getattr(client, method)(url).status_code)
+        finally:
+            connection.close()
+
+    def test_double_clicks_from_many_threads(self):
+        """Test that every fan double-liking, or liking then unliking, is exact."""
+        # Even fans double-click like; odd fans like and then change their mind
+        plans = {
+            fan: (
+                ["put", "put"] * self.ROUNDS
+                if i % 2 == 0
+                else ["put", "delete"] * self.ROUNDS
+            )
+            for i, fan in enumerate(self.fans)
+        }
+        statuses = []
+        threads = [
+            threading.Thread(target=self.hammer, args=(fan, methods, statuses))
+            for fan, methods in plans.items()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(statuses, [200] * self.THREADS * self.ROUNDS * 2)
+        likers = set(self.post.likes.values_list("username", flat=True))
+        self.assertEqual(likers, {fan.username for fan in self.fans[::2]})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, len(likers))
+
+    def race(self, fan, method):
+        """Send `method` for one fan from every thread at once."""
+        statuses = []
+        threads = [
+            threading.Thread(target=self.hammer, args=(fan, [method], statuses))
+            for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(statuses, [200] * self.THREADS)
+
+    def test_one_fan_clicking_from_many_threads(self):
+        """Test that one fan's simultaneous likes, then unlikes, count once."""
+        fan = self.fans[0]
+        self.race(fan, "put")
+        self.assertEqual(list(self.post.likes.all()), [fan])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.race(fan, "delete")
+        self.assertFalse(self.post.likes.exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
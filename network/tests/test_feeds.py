@@ -0,0 +1,237 @@
+"""Test the materialized Following timelines."""
+
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from network.feeds import FeedEngine, TimelinePaginator, merge_streams
+from network.models import Post, TimelineEntry
+
+User = get_user_model()
+
+
+class TimelineTest(TestCase):
+    """Test that timelines follow posts and the follow graph."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="test123")
+        self.bob = User.objects.create_user(username="bob", password="test123")
+        self.charlie = User.objects.create_user(username="charlie", password="test123")
+
+    def timeline(self, user):
+        """Return the post ids in a user's timeline, newest first."""
+        return list(
+            TimelineEntry.objects.filter(owner=user)
+            .order_by("-created", "-post_id")
+            .values_list("post_id", flat=True)
+        )
+
+    def test_new_post_fans_out_to_followers(self):
+        """Test that a new post lands in every follower's timeline only."""
+        self.alice.following.add(self.bob)
+        post = Post.objects.create(user=self.bob, text="Hello followers")
+        self.assertEqual(self.timeline(self.alice), [post.pk])
+        self.assertEqual(self.timeline(self.charlie), [])
+        self.assertEqual(self.timeline(self.bob), [])
+
+    def test_follow_backfills_existing_posts(self):
+        """Test that following someone copies their earlier posts."""
+        first = Post.objects.create(user=self.bob, text="First")
+        second = Post.objects.create(user=self.bob, text="Second")
+        self.alice.following.add(self.bob)
+        self.assertEqual(self.timeline(self.alice), [second.pk, first.pk])
+
+    def test_reverse_follow_backfills_existing_posts(self):
+        """Test that adding from the followers side also backfills."""
+        post = Post.objects.create(user=self.bob, text="First")
+        self.bob.followers.add(self.alice, self.charlie)
+        self.assertEqual(self.timeline(self.alice), [post.pk])
+        self.assertEqual(self.timeline(self.charlie), [post.pk])
+
+    def test_unfollow_prunes_only_that_author(self):
+        """Test that unfollowing removes that author's posts and no others."""
+        Post.objects.create(user=self.bob, text="Bob")
+        charlie_post = Post.objects.create(user=self.charlie, text="Charlie")
+        self.alice.following.add(self.bob, self.charlie)
+        self.alice.following.remove(self.bob)
+        self.assertEqual(self.timeline(self.alice), [charlie_post.pk])
+
+    def test_clear_prunes_timeline(self):
+        """Test that clearing follows from either side empties timelines."""
+        Post.objects.create(user=self.bob, text="Bob")
+        self.alice.following.add(self.bob)
+        self.charlie.following.add(self.bob)
+        self.bob.followers.clear()
+        self.assertEqual(self.timeline(self.alice), [])
+        self.assertEqual(self.timeline(self.charlie), [])
+
+    def test_rebuild_matches_incremental(self):
+        """Test that a rebuild reproduces the incrementally built timelines."""
+        self.alice.following.add(self.bob, self.charlie)
+        self.bob.following.add(self.charlie)
+        for user in (self.alice, self.bob, self.charlie):
+            Post.objects.create(user=user, text=f"Post by {user}")
+        before = {user: self.timeline(user) for user in (self.alice, self.bob)}
+        TimelineEntry.objects.all().delete()
+        self.assertEqual(FeedEngine().rebuild(batch_size=1), 3)
+        after = {user: self.timeline(user) for user in (self.alice, self.bob)}
+        self.assertEqual(before, after)
+
+    def test_rebuild_timelines_command(self):
+        """Test that the management command rebuilds missing entries."""
+        self.alice.following.add(self.bob)
+        Post.objects.create(user=self.bob, text="Bob")
+        TimelineEntry.objects.all().delete()
+        call_command("rebuild_timelines", stdout=StringIO())
+        self.assertEqual(len(self.timeline(self.alice)), 1)
+
+
+class FollowingFeedTest(TestCase):
+    """Test the following view reading from the timeline."""
+
+    def setUp(self):
+        self.client = Client()
+        self.alice = User.objects.create_user(username="alice", password="test123")
+        self.bob = User.objects.create_user(username="bob", password="test123")
+        self.alice.following.add(self.bob)
+        for i in range(15):
+            Post.objects.create(user=self.bob, text=f"Bob's post {i + 1}")
+        Post.objects.create(user=self.alice, text="Alice's own post")
+        self.client.login(username="alice", password="test123")
+
+    def test_following_cursor_pages(self):
+        """Test that cursor pages cover the followed posts only."""
+        response = self.client.get(reverse("following"))
+        first = response.context["page"]
+        self.assertEqual(len(first), 10)
+        response = self.client.get(
+            reverse("following") + f"?cursor={first.next_cursor}"
+        )
+        second = response.context["page"]
+        self.assertEqual(len(second), 5)
+        self.assertFalse(second.has_next())
+        posts = list(first) + list(second)
+        self.assertEqual(posts, list(Post.objects.filter(user=self.bob)))
+
+    def test_following_legacy_page(self):
+        """Test that old ?page= links still work on the following feed."""
+        response = self.client.get(reverse("following") + "?page=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page"]), 5)
+
+
+@override_settings(FEED_CELEBRITY_THRESHOLD=2)
+class HybridFeedTest(TestCase):
+    """Test merging celebrities' posts into timelines at read time."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="test123")
+        self.bob = User.objects.create_user(username="bob", password="test123")
+        self.star = User.objects.create_user(username="star", password="test123")
+        self.alice.following.add(self.bob, self.star)
+        self.bob.following.add(self.star)
+
+    def test_celebrity_posts_are_not_fanned_out(self):
+        """Test that only authors below the threshold are pushed."""
+        Post.objects.create(user=self.star, text="To the masses")
+        bob_post = Post.objects.create(user=self.bob, text="To my one follower")
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list("post_id", flat=True)),
+            [bob_post.pk],
+        )
+
+    def test_read_merges_celebrity_posts_in_order(self):
+        """Test that pages interleave pushed and pulled posts by (created, id)."""
+        for i in range(12):
+            author = self.star if i % 3 else self.bob
+            Post.objects.create(user=author, text=f"Post {i}")
+        expected = list(
+            Post.objects.filter(user__in=[self.bob, self.star]).order_by(
+                "-created", "-id"
+            )
+        )
+        paginator = TimelinePaginator(Post.objects.all(), self.alice, per_page=5)
+        page = paginator.get_page(None)
+        seen = list(page)
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            seen.extend(page)
+        self.assertEqual(seen, expected)
+        page = paginator.get_page(page.previous_cursor)
+        self.assertEqual(list(page), expected[5:10])
+
+    def test_unfollow_below_threshold_fans_out_old_posts(self):
+        """Test that a demoted celebrity's posts are pushed to their followers."""
+        post = Post.objects.create(user=self.star, text="Written as a celebrity")
+        self.bob.following.remove(self.star)
+        self.assertTrue(
+            TimelineEntry.objects.filter(owner=self.alice, post=post).exists()
+        )
+
+    def test_engine_strategies_agree(self):
+        """Test that pull, push and hybrid engines read the same feed."""
+        for i in range(6):
+            Post.objects.create(user=(self.bob, self.star)[i % 2], text=f"{i}")
+        reads = []
+        for threshold in (0, 2, float("inf")):
+            engine = FeedEngine(threshold)
+            engine.rebuild()
+            reads.append(engine.read(self.alice, limit=4))
+        self.assertEqual(reads[0], reads[1])
+        self.assertEqual(reads[1], reads[2])
+
+    def test_merge_streams_dedupes(self):
+        """Test that a post present in two streams is merged once."""
+        a, b, c = [(timezone.now() + timedelta(seconds=i), i) for i in range(3)]
+        merged = list(merge_streams([[c, b], [c, a]]))
+        self.assertEqual(merged, [c, b, a])
+
+
+class TimelineMigrationTest(TransactionTestCase):
+    """Test that migrating fills the timelines of follows made before it."""
+
+    before = [("network", "0001_initial")]
+    after = [("network", "0002_timelineentry")]
+
+    def migrate(self, targets):
+        """Migrate the test database and return the app registry at `targets`."""
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        # Leave the schema as the other tests expect it
+        self.migrate(self.latest())
+
+    def latest(self) -> list[tuple[str, str]]:
+        """Return the newest migration of every app."""
+        return MigrationExecutor(connection).loader.graph.leaf_nodes()
+
+    def test_existing_follows_get_timelines(self):
+        """Test that a follow from before the migration shows in Following."""
+        apps = self.migrate(self.before)
+        OldUser = apps.get_model("network", "User")
+        OldPost = apps.get_model("network", "Post")
+        alice = OldUser.objects.create(username="alice")
+        bob = OldUser.objects.create(username="bob")
+        alice.following.add(bob)
+        post = OldPost.objects.create(user=bob, text="Before timelines")
+        OldPost.objects.create(user=alice, text="Own post")
+        TimelineEntry = self.migrate(self.after).get_model("network", "TimelineEntry")
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list("owner_id", "post_id")),
+            [(alice.pk, post.pk)],
+        )
+        self.migrate(self.latest())
+        client = Client()
+        client.force_login(User.objects.get(username="alice"))
+        response = client.get(reverse("following"))
+        self.assertContains(response, "Before timelines")
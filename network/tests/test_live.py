@@ -0,0 +1,177 @@
+"""Test the live new-post broker and its Server-Sent Events streams."""
+
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.test import Client, SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from network import live
+from network.models import Post, User
+from project4.asgi import application
+
+
+class BrokerTest(SimpleTestCase):
+    """Test that the broker delivers each post once to the right streams."""
+
+    def setUp(self):
+        self.broker = live.Broker()
+
+    def post(self, author_id: int) -> dict:
+        """Return a published post message."""
+        return {"post_id": 1, "author_id": author_id, "username": "bob"}
+
+    async def test_publish_delivers_once(self):
+        """Test that a stream on several published channels gets one copy."""
+        subscription = live.Subscription(asyncio.get_running_loop(), viewer_id=1)
+        self.broker.subscribe(subscription, ["posts", "author:2"])
+        self.assertEqual(self.broker.publish(["posts", "author:2"], self.post(2)), 1)
+        await asyncio.wait_for(subscription.ready.wait(), 1)
+        self.assertEqual(subscription.take(), {"count": 1, "posts": [self.post(2)]})
+        self.assertFalse(subscription.ready.is_set())
+
+    async def test_own_posts_skipped(self):
+        """Test that viewers are not told about their own posts."""
+        subscription = live.Subscription(asyncio.get_running_loop(), viewer_id=2)
+        self.broker.subscribe(subscription, ["posts"])
+        self.broker.publish(["posts"], self.post(2))
+        await asyncio.sleep(0)
+        self.assertEqual(subscription.count, 0)
+
+    async def test_pending_posts_are_capped(self):
+        """Test that a slow stream keeps an exact count but few payloads."""
+        subscription = live.Subscription(asyncio.get_running_loop(), viewer_id=1)
+        self.broker.subscribe(subscription, ["posts"])
+        for _ in range(live.MAX_PENDING + 5):
+            self.broker.publish(["posts"], self.post(2))
+        await asyncio.sleep(0)
+        event = subscription.take()
+        self.assertEqual(event["count"], live.MAX_PENDING + 5)
+        self.assertEqual(len(event["posts"]), live.MAX_PENDING)
+
+    async def test_set_follow_updates_following_streams(self):
+        """Test that following or unfollowing changes what a stream hears."""
+        subscription = live.Subscription(asyncio.get_running_loop(), viewer_id=1)
+        self.broker.subscribe(subscription, ["following:1"])
+        self.broker.set_follow(1, 2, True)
+        self.assertEqual(self.broker.publish(["author:2"], self.post(2)), 1)
+        self.broker.set_follow(1, 2, False)
+        self.assertEqual(self.broker.publish(["author:2"], self.post(2)), 0)
+
+    def test_unsubscribe_forgets_channels(self):
+        """Test that a closed stream leaves nothing behind."""
+        subscription = live.Subscription(None, viewer_id=1)
+        self.broker.subscribe(subscription, ["posts", "author:2"])
+        self.assertEqual(self.broker.streams(), 1)
+        self.broker.unsubscribe(subscription)
+        self.assertEqual(self.broker.streams(), 0)
+        self.assertEqual(subscription.channels, set())
+
+
+class EventStreamTest(TransactionTestCase):
+    """Test the event streams as the ASGI server runs them."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="test123")
+        self.bob = User.objects.create_user(username="bob", password="test123")
+        self.carol = User.objects.create_user(username="carol", password="test123")
+        self.alice.following.add(self.bob)
+        client = Client()
+        client.force_login(self.alice)
+        self.cookie = f"sessionid={client.cookies['sessionid'].value}".encode()
+
+    async def open(self, feed: str, cookie: bytes = b"", host: bytes = b""):
+        """Start a stream and return its task, messages sent, and inbox."""
+        headers = [(b"cookie", cookie)] if cookie else []
+        headers += [(b"host", host)] if host else []
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": f"/events/{feed}",
+            "headers": headers,
+        }
+        inbox, sent = asyncio.Queue(), asyncio.Queue()
+        task = asyncio.create_task(application(scope, inbox.get, sent.put))
+        return task, sent, inbox
+
+    async def body(self, sent: asyncio.Queue) -> bytes:
+        """Return the next body chunk sent."""
+        while (message := await asyncio.wait_for(sent.get(), 5))["type"] != (
+            "http.response.body"
+        ):
+            pass
+        return message["body"]
+
+    async def close(self, task, inbox):
+        """Disconnect a stream and wait for it to end."""
+        await inbox.put({"type": "http.disconnect"})
+        await asyncio.wait_for(task, 5)
+
+    async def test_following_stream_hears_followed_authors(self):
+        """Test that a Following stream is told of followed authors' posts only."""
+        task, sent, inbox = await self.open("following", self.cookie)
+        start = await asyncio.wait_for(sent.get(), 5)
+        self.assertEqual(start["status"], 200)
+        self.assertIn((b"content-type", b"text/event-stream"), start["headers"])
+        self.assertEqual(await self.body(sent), b": open\n\n")
+        await Post.objects.acreate(user=self.carol, text="Not followed")
+        post = await Post.objects.acreate(user=self.bob, text="Followed")
+        name, data = (await self.body(sent)).decode().strip().split("\n")
+        self.assertEqual(name, "event: posts")
+        event = json.loads(data.removeprefix("data: "))
+        self.assertEqual(event["count"], 1)
+        self.assertEqual(event["posts"][0]["post_id"], post.pk)
+        self.assertEqual(event["posts"][0]["username"], "bob")
+        await self.close(task, inbox)
+        self.assertEqual(live.broker.streams(), 0)
+
+    async def test_follows_made_anywhere_reach_open_streams(self):
+        """Test that follows by the view and by the ORM update open streams."""
+        task, sent, inbox = await self.open("following", self.cookie)
+        self.assertEqual(await self.body(sent), b": open\n\n")
+        client = Client()
+        await sync_to_async(client.force_login)(self.alice)
+        await sync_to_async(client.delete)(reverse("toggle_follow", args=["bob"]))
+        await sync_to_async(self.alice.following.add)(self.carol)
+        await Post.objects.acreate(user=self.bob, text="Unfollowed")
+        post = await Post.objects.acreate(user=self.carol, text="Followed")
+        event = (await self.body(sent)).decode().strip().split("\n")[1]
+        event = json.loads(event.removeprefix("data: "))
+        self.assertEqual(event["count"], 1)
+        self.assertEqual(event["posts"][0]["post_id"], post.pk)
+        await self.close(task, inbox)
+
+    @override_settings(ALLOWED_HOSTS=["example.com"])
+    async def test_host_checked(self):
+        """Test that streams are refused for hosts not in `ALLOWED_HOSTS`."""
+        for host, status in ((b"evil.test", 400), (b"", 400), (b"example.com", 200)):
+            with self.subTest(host=host):
+                task, sent, inbox = await self.open("posts", host=host)
+                self.assertEqual((await sent.get())["status"], status)
+                if status == 200:
+                    await self.close(task, inbox)
+                else:
+                    await asyncio.wait_for(task, 5)
+
+    @override_settings(LIVE_HEARTBEAT_SECONDS=0.01)
+    async def test_idle_stream_sends_keep_alives(self):
+        """Test that an idle stream sends comments to stay open."""
+        task, sent, inbox = await self.open("posts")
+        self.assertEqual(await self.body(sent), b": open\n\n")
+        self.assertEqual(await self.body(sent), b": keep-alive\n\n")
+        await self.close(task, inbox)
+
+    async def test_refusals(self):
+        """Test anonymous Following streams, unknown feeds and other methods."""
+        for feed, status in (("following", 403), ("nope", 404)):
+            with self.subTest(feed=feed):
+                task, sent, inbox = await self.open(feed)
+                self.assertEqual((await sent.get())["status"], status)
+                await asyncio.wait_for(task, 5)
+
+    def test_django_refuses_streams(self):
+        """Test that a stream request reaching Django, e.g. under WSGI, is refused."""
+        url = reverse("events", args=["posts"])
+        self.assertTrue(url.startswith(live.PREFIX))
+        self.assertEqual(Client().get(url).status_code, 503)
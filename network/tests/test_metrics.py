@@ -0,0 +1,100 @@
+"""Test the Prometheus metrics endpoint and the events feeding it."""
+
+import json
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+
+from network.models import Post, User
+
+
+def sample(name: str, **labels) -> float:
+    """Return the current value of a metric sample in this process."""
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@override_settings(PROMETHEUS_METRICS=True, PROMETHEUS_TOKEN="scrape-me")
+class MetricsTest(TestCase):
+    """Test that requests, cache lookups and activity are exported."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.alice = User.objects.create_user(username="alice", password="test123")
+        self.bob = User.objects.create_user(username="bob", password="test123")
+        self.post = Post.objects.create(user=self.alice, text="Hello")
+
+    def test_requests_are_counted_per_view(self):
+        """Test that each request is counted with its view and status."""
+        labels = {"view": "index", "method": "GET", "status": "200"}
+        before = sample("network_requests_total", **labels)
+        queries = sample("network_db_queries_per_request_count", view="index")
+        self.client.get(reverse("index"))
+        self.assertEqual(sample("network_requests_total", **labels), before + 1)
+        self.assertEqual(
+            sample("network_db_queries_per_request_count", view="index"), queries + 1
+        )
+
+    def test_endpoint_serves_text_format(self):
+        """Test that /metrics answers in the Prometheus text format."""
+        self.client.get(reverse("index"))
+        response = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape-me"
+        )
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertContains(response, "# TYPE network_request_duration_seconds")
+        self.assertContains(response, 'network_requests_total{method="GET"')
+
+    def test_activity_counters(self):
+        """Test that posts, likes and follows are counted however they're made."""
+        names = (
+            "network_posts_created_total",
+            "network_likes_created_total",
+            "network_follows_created_total",
+        )
+        before = [sample(name) for name in names]
+        self.client.force_login(self.bob)
+        self.client.post(
+            reverse("compose"),
+            data=json.dumps({"text": "Hi"}),
+            content_type="application/json",
+        )
+        self.client.put(reverse("toggle_like", args=[self.post.pk]))
+        self.client.put(reverse("toggle_like", args=[self.post.pk]))
+        self.client.post(reverse("toggle_follow", args=["alice"]))
+        self.alice.following.add(self.bob)
+        after = [sample(name) for name in names]
+        self.assertEqual([b - a for a, b in zip(before, after)], [1, 1, 2])
+
+    def test_cache_lookups(self):
+        """Test that page cache misses and hits are exported."""
+        before = sample("network_cache_lookups_total", cache="page", result="hits")
+        self.client.get(reverse("profile", args=["alice"]))
+        self.client.get(reverse("profile", args=["alice"]))
+        after = sample("network_cache_lookups_total", cache="page", result="hits")
+        self.assertEqual(after, before + 1)
+
+    def test_restricted_to_staff_and_scrapers(self):
+        """Test that anonymous users, other users and wrong tokens are refused."""
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        wrong = self.client.get(url, HTTP_AUTHORIZATION="Bearer guess")
+        self.assertEqual(wrong.status_code, 403)
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.alice.is_staff = True
+        self.alice.save()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(PROMETHEUS_TOKEN="")
+    def test_no_token_configured(self):
+        """Test that an empty token never matches."""
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer ")
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(PROMETHEUS_METRICS=False)
+    def test_disabled(self):
+        """Test that the endpoint is hidden when metrics are off."""
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
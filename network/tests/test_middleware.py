@@ -0,0 +1,70 @@
+"""Test the Server-Timing middleware."""
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from network.middleware import reset_timing_stats, timing_stats
+from network.models import Post, User
+
+
+@override_settings(REQUEST_TIMING=True)
+class ServerTimingTest(TestCase):
+    """Test that timed requests report and aggregate their timings."""
+
+    def setUp(self):
+        reset_timing_stats()
+        self.client = Client()
+        self.alice = User.objects.create_user(username="alice", password="test123")
+        Post.objects.create(user=self.alice, text="Hello")
+        self.client.force_login(self.alice)
+
+    def timings(self, response) -> dict[str, str]:
+        """Parse a Server-Timing header into `{metric: params}`."""
+        return dict(
+            entry.strip().split(";", 1)
+            for entry in response["Server-Timing"].split(",")
+        )
+
+    def test_header_reports_each_phase(self):
+        """Test that a page reports db, template, view and total durations."""
+        response = self.client.get(reverse("index"))
+        timings = self.timings(response)
+        self.assertEqual(list(timings), ["db", "tpl", "view", "total"])
+        self.assertRegex(timings["db"], r'^dur=[\d.]+;desc="[1-9]\d* queries"$')
+        self.assertNotEqual(timings["tpl"], "dur=0.00")
+
+    def test_query_count_matches(self):
+        """Test that the reported query count is the request's query count."""
+        # The session is read from the cache
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("index"))
+        self.assertIn('desc="3 queries"', response["Server-Timing"])
+
+    def test_json_views_render_no_template(self):
+        """Test that a JSON view spends no time in templates."""
+        response = self.client.get(reverse("api_posts"))
+        self.assertEqual(self.timings(response)["tpl"], "dur=0.00")
+
+    def test_histograms_per_view(self):
+        """Test that each view's requests are counted in its own histograms."""
+        self.client.get(reverse("index"))
+        self.client.get(reverse("index"))
+        self.client.get(reverse("profile", args=["alice"]))
+        stats = timing_stats()
+        self.assertEqual(stats["index"]["requests"], 2)
+        self.assertEqual(stats["profile"]["requests"], 1)
+        self.assertEqual(stats["index"]["total"]["buckets"]["inf"], 2)
+
+    def test_stats_are_staff_only(self):
+        """Test that only staff can read the timing histograms."""
+        self.assertEqual(self.client.get(reverse("timing_stats")).status_code, 403)
+        User.objects.filter(pk=self.alice.pk).update(is_staff=True)
+        response = self.client.get(reverse("timing_stats"))
+        self.assertIn("timing_stats", response.json())
+
+    @override_settings(REQUEST_TIMING=False)
+    def test_disabled_adds_nothing(self):
+        """Test that with timing off responses carry no header."""
+        response = self.client.get(reverse("index"))
+        self.assertFalse(response.has_header("Server-Timing"))
+        self.assertEqual(timing_stats(), {})
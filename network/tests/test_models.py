@@ -22,6 +22,8 @@ class UserModelTest(TestCase):
     def test_num_following_and_followers(self):
         """Test to ensure number following and followers."""
         self.alice.following.add(self.bob)
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
         self.assertEqual(self.alice.num_following(), 1)
         self.assertEqual(self.bob.num_followers(), 1)
 
@@ -0,0 +1,77 @@
+"""Test the cursor paginator."""
+
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from network.models import Post
+from network.pagination import CursorPaginator, decode_cursor, encode_cursor
+
+User = get_user_model()
+
+
+class CursorTokenTest(TestCase):
+    """Test encoding and decoding of cursor tokens."""
+
+    def test_round_trip(self):
+        """Test that a cursor decodes back to its position and direction."""
+        position = (timezone.now(), 42)
+        self.assertEqual(decode_cursor(encode_cursor(position)), (False, position))
+        self.assertEqual(
+            decode_cursor(encode_cursor(position, backward=True)), (True, position)
+        )
+
+    def test_malformed_cursor_is_ignored(self):
+        """Test that garbage cursors decode to None instead of raising."""
+        for cursor in ("", "not-base64!", "bm9wZQ", "eHxub3R8YW55dGhpbmc"):
+            self.assertIsNone(decode_cursor(cursor))
+
+
+class CursorPaginatorTest(TestCase):
+    """Test walking a feed forward and backward with cursors."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="alice", password="test123")
+        now = timezone.now()
+        # Two posts share each timestamp so the id tiebreaker is exercised
+        for i in range(25):
+            post = Post.objects.create(user=self.user, text=f"Post {i}")
+            Post.objects.filter(pk=post.pk).update(
+                created=now + timedelta(seconds=i // 2)
+            )
+        self.expected = list(Post.objects.order_by("-created", "-id"))
+        self.paginator = CursorPaginator(Post.objects.all())
+
+    def test_first_page(self):
+        """Test that the first page has the newest posts and no previous page."""
+        page = self.paginator.get_page(None)
+        self.assertEqual(list(page), self.expected[:10])
+        self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+    def test_walk_forward_and_back(self):
+        """Test that next and previous cursors visit every post exactly once."""
+        seen = []
+        pages = [self.paginator.get_page(None)]
+        seen.extend(pages[0])
+        while pages[-1].has_next():
+            pages.append(self.paginator.get_page(pages[-1].next_cursor))
+            seen.extend(pages[-1])
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        # Walk back from the last page to the first
+        page = pages[-1]
+        for expected_page in reversed(pages[:-1]):
+            page = self.paginator.get_page(page.previous_cursor)
+            self.assertEqual(list(page), list(expected_page))
+        self.assertFalse(page.has_previous())
+
+    def test_no_count_query(self):
+        """Test that fetching a page never counts the table."""
+        page = self.paginator.get_page(None)
+        with self.assertNumQueries(1) as context:
+            page = self.paginator.get_page(page.next_cursor)
+        self.assertNotIn("COUNT(", context.captured_queries[0]["sql"].upper())
+        self.assertEqual(len(page), 10)
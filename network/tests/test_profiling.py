@@ -0,0 +1,113 @@
+"""Test the sampling profiler middleware and its summary command."""
+
+import os
+import pstats
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.urls import reverse
+
+from network import views
+from network.models import Post, User
+
+
+def slow_query(execute, sql, params, many, context):
+    """Database execute wrapper that makes each query take at least 2 ms."""
+    time.sleep(0.002)
+    return execute(sql, params, many, context)
+
+
+def slow_post_json(post, viewer):
+    """Serialize a post on the event loop, slowly enough to be sampled."""
+    time.sleep(0.02)
+    return POST_JSON(post, viewer)
+
+
+POST_JSON = views._post_json
+
+
+class SamplingProfilerTest(TestCase):
+    """Test that sampled and slow requests leave profiles behind."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(lambda: [os.remove(p) for p in self.files()])
+        self.client = Client()
+        alice = User.objects.create_user(username="alice", password="test123")
+        Post.objects.create(user=alice, text="Hello")
+        self.client.force_login(alice)
+
+    def files(self) -> list[str]:
+        """Return the paths written to the profile directory."""
+        return [os.path.join(self.directory, n) for n in os.listdir(self.directory)]
+
+    def suffixes(self) -> list[str]:
+        """Return the sorted file suffixes in the profile directory."""
+        return sorted(os.path.splitext(path)[1] for path in self.files())
+
+    def test_sampled_request_writes_profile_stacks_and_sql(self):
+        """Test that a sampled request keeps cProfile stats, stacks and SQL."""
+        with self.settings(PROFILE_SAMPLE_RATE=1, PROFILE_DIR=self.directory):
+            self.client.get(reverse("index"))
+        self.assertEqual(self.suffixes(), [".folded", ".prof", ".sql"])
+        (sql,) = [path for path in self.files() if path.endswith(".sql")]
+        self.assertIn("-index-", sql)
+        with open(sql) as f:
+            self.assertIn('FROM "network_post"', f.read())
+
+    def test_slow_request_keeps_stacks_without_cprofile(self):
+        """Test that a slow unsampled request is kept without cProfile."""
+        with self.settings(PROFILE_SLOW_MS=1, PROFILE_DIR=self.directory):
+            with connection.execute_wrapper(slow_query):
+                self.client.get(reverse("index"))
+        self.assertEqual(self.suffixes(), [".folded", ".sql"])
+
+    @mock.patch("network.views._post_json", slow_post_json)
+    async def test_async_view_frames_are_profiled(self):
+        """Test that under ASGI the profiles follow the view on the event loop."""
+        client = AsyncClient()
+        await client.aforce_login(await User.objects.aget(username="alice"))
+        with self.settings(PROFILE_SAMPLE_RATE=1, PROFILE_DIR=self.directory):
+            response = await client.get(reverse("api_posts"))
+        self.assertEqual(response.status_code, 200)
+        paths = {os.path.splitext(path)[1]: path for path in self.files()}
+        with open(paths[".folded"]) as f:
+            self.assertIn("views.py:_feed_json", f.read())
+        functions = pstats.Stats(paths[".prof"]).stats
+        self.assertIn(
+            "api_posts", {name for path, _, name in functions if path == views.__file__}
+        )
+
+    def test_fast_unsampled_requests_are_dropped(self):
+        """Test that nothing is written below the threshold."""
+        with self.settings(PROFILE_SLOW_MS=60_000, PROFILE_DIR=self.directory):
+            self.client.get(reverse("index"))
+        self.assertEqual(self.files(), [])
+
+    def test_rotation_keeps_newest(self):
+        """Test that only the newest `PROFILE_KEEP` requests are kept."""
+        with self.settings(
+            PROFILE_SAMPLE_RATE=1, PROFILE_KEEP=2, PROFILE_DIR=self.directory
+        ):
+            for view in ("index", "following", "index"):
+                self.client.get(reverse(view))
+        self.assertEqual(len(self.files()), 6)
+        self.assertTrue(any("-following-" in path for path in self.files()))
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_summary_command(self):
+        """Test that the summary merges functions and queries across samples."""
+        with self.settings(PROFILE_DIR=self.directory):
+            self.client.get(reverse("index"))
+            self.client.get(reverse("profile", args=["alice"]))
+        out = StringIO()
+        call_command("profile_summary", "--dir", self.directory, stdout=out)
+        report = out.getvalue()
+        self.assertIn("2 requests, 2 with cProfile", report)
+        self.assertIn("Hottest functions by tottime", report)
+        self.assertIn('FROM "network_post"', report)
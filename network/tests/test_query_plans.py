@@ -0,0 +1,103 @@
+"""Test that the feed and toggle queries are served by their indexes."""
+
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from network.models import Follow, Like, Post, TimelineEntry
+from network.pagination import seek
+from network.search import search_keys
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite only")
+class QueryPlanTest(TestCase):
+    """Test the SQLite query plans of the hot queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username="alice", password="test123")
+        cls.bob = User.objects.create_user(username="bob", password="test123")
+        cls.post = Post.objects.create(user=cls.bob, text="Hello")
+        cls.position = (timezone.now(), cls.post.pk)
+
+    def assertUsesIndex(self, queryset, index):
+        """Assert the plan searches `index` and never sorts in a temp B-tree."""
+        plan = queryset.explain()
+        self.assertIn(f"INDEX {index}", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+        self.assertNotRegex(plan, r"SCAN \w+$|SCAN \w+\n")
+
+    def test_global_feed_uses_created_index(self):
+        """Test that the All Posts feed walks `(created, id)` in order."""
+        for position in (None, self.position):
+            for backward in (False, True):
+                with self.subTest(position=position, backward=backward):
+                    posts = Post.objects.with_viewer_liked(self.alice)
+                    self.assertUsesIndex(
+                        seek(posts, position, backward)[:11], "post_created_id"
+                    )
+
+    def test_profile_feed_uses_user_created_index(self):
+        """Test that a profile feed seeks `(user, created, id)` in order."""
+        for position in (None, self.position):
+            for backward in (False, True):
+                with self.subTest(position=position, backward=backward):
+                    posts = self.bob.posts.with_viewer_liked(self.alice)
+                    self.assertUsesIndex(
+                        seek(posts, position, backward)[:11], "post_user_created"
+                    )
+
+    def test_following_feed_uses_timeline_index(self):
+        """Test that a timeline page seeks `(owner, created, post)` in order."""
+        entries = TimelineEntry.objects.filter(owner=self.alice)
+        for position in (None, self.position):
+            with self.subTest(position=position):
+                keyset = seek(entries, position, keys=("created", "post_id"))
+                self.assertUsesIndex(keyset[:10], "timeline_owner_created")
+
+    def test_like_toggle_uses_unique_index(self):
+        """Test that finding one like probes the `(post, user)` unique index."""
+        likes = Like.objects.filter(post_id=self.post.pk, user_id=self.alice.pk)
+        self.assertRegex(likes.explain(), r"INDEX \w+_uniq \(post_id=\? AND user_id=")
+
+    def test_follow_toggle_uses_unique_index(self):
+        """Test that finding one follow probes the `(from, to)` unique index."""
+        follows = Follow.objects.filter(
+            from_user_id=self.alice.pk, to_user_id=self.bob.pk
+        )
+        self.assertRegex(
+            follows.explain(), r"INDEX \w+_uniq \(from_user_id=\? AND to_user_id="
+        )
+
+    def test_reverse_lookups_use_covering_indexes(self):
+        """Test that followers and liked posts are read from covering indexes."""
+        followers = Follow.objects.filter(to_user_id=self.bob.pk).values_list(
+            "from_user_id", flat=True
+        )
+        self.assertIn("COVERING INDEX follow_to_from", followers.explain())
+        liked = Like.objects.filter(user_id=self.alice.pk).values_list(
+            "post_id", flat=True
+        )
+        self.assertIn("COVERING INDEX like_user_post", liked.explain())
+
+    def test_watermarks_use_modified_indexes(self):
+        """Test that the ETag watermarks are single index seeks."""
+        latest = Post.objects.order_by("-modified", "-id").values("modified", "id")
+        self.assertUsesIndex(latest[:1], "post_modified_id")
+        self.assertUsesIndex(latest.filter(user=self.bob)[:1], "post_user_modified")
+
+    def test_search_uses_full_text_index(self):
+        """Test that a search probes the FTS5 index instead of scanning posts."""
+        with CaptureQueriesContext(connection) as captured:
+            search_keys("hello", (1.0, self.post.pk))
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {captured[0]['sql']}")
+            plan = "\n".join(row[-1] for row in cursor.fetchall())
+        self.assertIn("VIRTUAL TABLE INDEX", plan)
+        self.assertNotIn("network_post ", plan)
@@ -0,0 +1,103 @@
+"""Test full-text search over posts."""
+
+import json
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from network.models import Post, User
+from network.pagination import encode_cursor
+from network.search import SearchPaginator, search_keys
+
+
+class SearchTest(TestCase):
+    """Test that searches are ranked, paged, and follow posts as they change."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username="alice", password="test123")
+        cls.once = Post.objects.create(
+            user=cls.alice, text="A garden with a dog, two cats and a very tall tree"
+        )
+        cls.twice = Post.objects.create(user=cls.alice, text="Dog meets dog")
+        cls.other = Post.objects.create(user=cls.alice, text="Nothing to see here")
+
+    def ids(self, text: str) -> list[int]:
+        """Return the ids of the posts matching `text`, best first."""
+        return [pk for _, pk in search_keys(text)]
+
+    def test_ranked_and_stemmed(self):
+        """Test that better matches come first and word forms match."""
+        self.assertEqual(self.ids("dog"), [self.twice.pk, self.once.pk])
+        self.assertEqual(self.ids("dogs"), [self.twice.pk, self.once.pk])
+        self.assertEqual(self.ids("dog tree"), [self.once.pk])
+        self.assertEqual(self.ids("unicorn"), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        """Test that quotes, operators and blanks are searched as plain words."""
+        for text in ('"dog', "dog OR (", "NOT dog*", "", "  ", "-:^"):
+            with self.subTest(text=text):
+                search_keys(text)
+        self.assertEqual(self.ids('dog" OR "here'), [])
+
+    def test_index_follows_writes(self):
+        """Test that composed and edited posts are found by their new text."""
+        client = Client()
+        client.force_login(self.alice)
+        response = client.post(
+            reverse("compose"),
+            json.dumps({"text": "A zebra crossing"}),
+            content_type="application/json",
+        )
+        post_id = response.json()["post_id"]
+        self.assertEqual(self.ids("zebra"), [post_id])
+        client.put(
+            reverse("edit_post", args=[post_id]),
+            json.dumps({"text": "A giraffe crossing"}),
+            content_type="application/json",
+        )
+        self.assertEqual(self.ids("zebra"), [])
+        self.assertEqual(self.ids("giraffe"), [post_id])
+        Post.objects.filter(pk=post_id).delete()
+        self.assertEqual(self.ids("giraffe"), [])
+
+    def test_walk_forward_and_back(self):
+        """Test that cursors visit every match once, in rank order, both ways."""
+        for i in range(5):
+            Post.objects.create(user=self.alice, text=f"Dog number {i}")
+        expected = self.ids("dog")
+        paginator = SearchPaginator(Post.objects.all(), "dog", per_page=3)
+        pages = [paginator.get_page(None)]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([post.pk for page in pages for post in page], expected)
+        previous = paginator.get_page(pages[-1].previous_cursor)
+        self.assertEqual(list(previous), list(pages[-2]))
+
+    @override_settings(SEARCH_CANDIDATES=1)
+    def test_only_newest_matches_ranked(self):
+        """Test that a common word ranks only its newest matches."""
+        self.assertEqual(self.ids("dog"), [self.twice.pk])
+        newest = Post.objects.create(user=self.alice, text="A dog")
+        self.assertEqual(self.ids("dog"), [newest.pk])
+
+    def test_bad_cursor_starts_over(self):
+        """Test that a cursor with a non-finite score gives the first page."""
+        paginator = SearchPaginator(Post.objects.all(), "dog")
+        cursor = encode_cursor((float("nan"), self.once.pk))
+        self.assertEqual(len(paginator.get_page(cursor)), 2)
+
+    def test_views(self):
+        """Test the search page and its JSON API."""
+        response = self.client.get(reverse("search"), {"q": "dog"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Dog meets dog")
+        self.assertNotContains(response, "Nothing to see here")
+        self.assertContains(response, 'value="dog"')
+        data = self.client.get(reverse("api_search"), {"q": "dog"}).json()
+        self.assertEqual(
+            [post["post_id"] for post in data["posts"]], [self.twice.pk, self.once.pk]
+        )
+        self.assertIsNone(data["next_cursor"])
+        response = self.client.get(reverse("search"))
+        self.assertContains(response, "Enter words to search for.")
@@ -0,0 +1,71 @@
+"""Test the seed command's synthetic dataset generator."""
+
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Count, F
+from django.test import TestCase
+
+from network.models import Follow, Like, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class SeedCommandTest(TestCase):
+    """Test that `seed --users` generates a consistent power-law dataset."""
+
+    def seed(self, *args):
+        """Run the seed command quietly with small batches."""
+        call_command("seed", "--batch-size", "7", *args, stdout=StringIO())
+
+    def test_default_seeds_demo_accounts(self):
+        """Test that a plain `seed` still creates the three demo accounts."""
+        self.seed()
+        self.assertEqual(User.objects.count(), 3)
+        self.assertTrue(User.objects.get(username="alice").check_password("testpass"))
+
+    def test_synthetic_dataset_is_consistent(self):
+        """Test that counters match the rows and no one likes their own post."""
+        self.seed("--users", "40", "--posts-per-user", "3", "--mean-likes", "6")
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Post.objects.count(), 120)
+        self.assertTrue(Like.objects.exists())
+        self.assertFalse(Like.objects.filter(user=F("post__user")).exists())
+        self.assertFalse(Follow.objects.filter(from_user=F("to_user")).exists())
+        for post in Post.objects.annotate(actual=Count("likes")):
+            self.assertEqual(post.like_count, post.actual)
+        for user in User.objects.annotate(actual=Count("followers")):
+            self.assertEqual(user.follower_count, user.actual)
+        self.assertTrue(TimelineEntry.objects.exists())
+        self.assertTrue(User.objects.get(username="user0").check_password("testpass"))
+
+    def test_popularity_follows_a_power_law(self):
+        """Test that the first-ranked user collects the most followers."""
+        self.seed("--users", "60", "--posts-per-user", "0", "--mean-follows", "10")
+        counts = User.objects.order_by("pk").values_list("follower_count", flat=True)
+        self.assertEqual(counts[0], max(counts))
+
+    def test_same_seed_same_graph(self):
+        """Test that the RNG seed makes the generated graph reproducible."""
+        graphs = []
+        for prefix in ("a", "b"):
+            self.seed("--users", "30", "--prefix", prefix, "--skip-timelines")
+            follows = Follow.objects.filter(from_user__username__startswith=prefix)
+            graphs.append(
+                {
+                    (follower[1:], followee[1:])
+                    for follower, followee in follows.values_list(
+                        "from_user__username", "to_user__username"
+                    )
+                }
+            )
+        self.assertTrue(graphs[0])
+        self.assertEqual(graphs[0], graphs[1])
+
+    def test_existing_prefix_rejected(self):
+        """Test that seeding twice with one prefix fails before inserting."""
+        self.seed("--users", "5", "--skip-timelines")
+        with self.assertRaises(CommandError):
+            self.seed("--users", "5")
@@ -1,11 +1,15 @@
 """Test Signal functions."""
 
+import time
+
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from django.db import transaction
-from django.test import TestCase
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from network.models import Post
+from network.models import Follow, Like, Post
+from network.signals import _delay_query, simulate_db_latency
 
 User = get_user_model()
 
@@ -70,3 +74,75 @@ class SignalTest(TestCase):
                 self.post.likes.add(self.alice, charlie)
         self.post.refresh_from_db()
         self.assertEqual(self.post.likes.count(), 0)
+
+
+class ThroughModelConstraintTest(TestCase):
+    """Test that the database rejects self-follows and self-likes."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="test123")
+        self.bob = User.objects.create_user(username="bob", password="test123")
+        self.post = Post.objects.create(user=self.alice, text="Alice's post")
+
+    def test_bulk_create_self_follow_rejected(self):
+        """Test that a bulk insert containing a self-follow is rejected whole."""
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Follow.objects.bulk_create(
+                    [
+                        Follow(from_user=self.bob, to_user=self.alice),
+                        Follow(from_user=self.alice, to_user=self.alice),
+                    ]
+                )
+        self.assertFalse(Follow.objects.exists())
+
+    def test_bulk_create_self_like_rejected(self):
+        """Test that a bulk insert containing a self-like is rejected whole."""
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Like.objects.bulk_create(
+                    [
+                        Like(post=self.post, user=self.bob),
+                        Like(post=self.post, user=self.alice),
+                    ]
+                )
+        self.assertFalse(Like.objects.exists())
+
+    def test_reverse_self_like_rejected(self):
+        """Test that liking one's own post from the user side is rejected."""
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                self.alice.liked_posts.add(self.post)
+        self.assertEqual(self.post.likes.count(), 0)
+
+    def test_valid_add_runs_no_validation_queries(self):
+        """Test that adding a like never loads the post's author to validate it."""
+        post = Post.objects.get(pk=self.post.pk)
+        with CaptureQueriesContext(connection) as queries:
+            post.likes.add(self.bob)
+        for query in queries.captured_queries:
+            self.assertNotIn('FROM "network_user"', query["sql"])
+            self.assertNotIn('FROM "network_post" ', query["sql"])
+
+
+class SimulatedLatencyTest(TestCase):
+    """Test the simulated database latency used by benchmarks."""
+
+    def tearDown(self):
+        if _delay_query in connection.execute_wrappers:
+            connection.execute_wrappers.remove(_delay_query)
+
+    def test_off_by_default(self):
+        """Test that connections are left alone without the setting."""
+        simulate_db_latency(sender=None, connection=connection)
+        self.assertNotIn(_delay_query, connection.execute_wrappers)
+
+    @override_settings(SIMULATED_DB_LATENCY_MS=20)
+    def test_delays_each_query_once(self):
+        """Ensure reconnecting does not stack up delays."""
+        for _ in range(3):
+            simulate_db_latency(sender=None, connection=connection)
+        self.assertEqual(connection.execute_wrappers.count(_delay_query), 1)
+        start = time.perf_counter()
+        User.objects.exists()
+        self.assertGreaterEqual(time.perf_counter() - start, 0.02)
@@ -1,12 +1,23 @@
 """Test views module functions."""
 
 import json
-
-from django.test import Client, TestCase
+import os
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+import network
+from network import middleware
 from network.models import Post, User
 
+APP_DIR = os.path.dirname(network.__file__)
+
 
 class AuthRedirectTest(TestCase):
     """Tests that login and register views respect the `next` parameter."""
@@ -61,6 +72,55 @@ class AuthRedirectTest(TestCase):
         self.assertRedirects(response, reverse("index"))
 
 
+class AuthQueryCountTest(TestCase):
+    """Test that logging in and registering run only the queries they need."""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="alice", password="test123")
+
+    def register(self, username):
+        """Post the registration form for `username`."""
+        return self.client.post(
+            reverse("register"),
+            data={
+                "username": username,
+                "email": f"{username}@example.com",
+                "password": "test123",
+                "confirmation": "test123",
+            },
+        )
+
+    def user_queries(self, queries):
+        """Return the captured queries that touch the user or follows tables."""
+        return [
+            query["sql"].split(" ")[0]
+            for query in queries.captured_queries
+            if '"network_user' in query["sql"]
+        ]
+
+    def test_login_query_count(self):
+        """Test that login reads the user once and writes only `last_login`."""
+        # One user read, one `last_login` update, and seven for the new session
+        with self.assertNumQueries(9) as queries:
+            self.client.post(
+                reverse("login"), data={"username": "alice", "password": "test123"}
+            )
+        self.assertEqual(self.user_queries(queries), ["SELECT", "UPDATE"])
+        self.assertIn('SET "last_login" ', queries.captured_queries[5]["sql"])
+
+    def test_register_query_count(self):
+        """Test that registering inserts the user without validation reads."""
+        with CaptureQueriesContext(connection) as queries:
+            self.register("bob")
+        self.assertEqual(self.user_queries(queries), ["INSERT", "UPDATE"])
+
+    def test_register_taken_username(self):
+        """Test that a taken username is reported by the unique index."""
+        response = self.register("alice")
+        self.assertContains(response, "Username already taken.")
+
+
 class ComposeViewTest(TestCase):
     """Tests for the compose method."""
 
@@ -186,6 +246,56 @@ class EditPostViewTest(TestCase):
         self.assertEqual(self.post.text, "Updated text")
         self.assertTrue(self.post.was_edited)
 
+    def test_edit_post_is_one_read_and_one_update(self):
+        """Test that an edit reads the post once and writes it once."""
+        self.client.login(username="author", password="pass123")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.put(
+                reverse("edit_post", args=[self.post.id]),
+                data=json.dumps({"text": "Updated text", "version": 1}),
+                content_type="application/json",
+            )
+        self.assertEqual(response.json()["version"], 2)
+        post_queries = [
+            query["sql"]
+            for query in context.captured_queries
+            if '"network_post"' in query["sql"]
+        ]
+        self.assertEqual(len(post_queries), 2)
+        self.assertIn('"version" = 1', post_queries[1])
+
+    def test_edit_post_with_stale_version_conflicts(self):
+        """Test that an edit based on an old version is refused with 409."""
+        self.post.text = "Edited elsewhere"
+        self.post.save()
+        self.client.login(username="author", password="pass123")
+        response = self.client.put(
+            reverse("edit_post", args=[self.post.id]),
+            data=json.dumps({"text": "Overwrite", "version": 1}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 409)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, "Edited elsewhere")
+
+    def test_edit_racing_another_edit_conflicts(self):
+        """Test that an edit loses if the row changed after it was read."""
+        post = Post.objects.get(pk=self.post.pk)
+        Post.objects.filter(pk=post.pk).update(text="Raced", version=2)
+        self.assertFalse(post.edit("Too late"))
+        post.refresh_from_db()
+        self.assertEqual(post.text, "Raced")
+
+    def test_edit_post_with_too_long_text(self):
+        """Test that calling edit_post with too long text generates an error (400)."""
+        self.client.login(username="author", password="pass123")
+        response = self.client.put(
+            reverse("edit_post", args=[self.post.id]),
+            data=json.dumps({"text": "x" * 513}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
     def test_edit_post_with_empty_text(self):
         """Test that calling edit_post with empty text generates an error (400)."""
         self.client.login(username="author", password="pass123")
@@ -254,6 +364,29 @@ class IndexViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.context["page"]), 5)
 
+    def test_index_cursor_pagination(self):
+        """Ensure cursor links walk the feed without repeating posts."""
+        response = self.client.get(reverse("index"))
+        first = response.context["page"]
+        self.assertEqual(len(first), 10)
+        self.assertFalse(first.has_previous())
+        self.assertContains(response, f"?cursor={first.next_cursor}")
+        response = self.client.get(reverse("index") + f"?cursor={first.next_cursor}")
+        second = response.context["page"]
+        self.assertEqual(len(second), 10)
+        self.assertFalse(set(first) & set(second))
+        response = self.client.get(
+            reverse("index") + f"?cursor={second.previous_cursor}"
+        )
+        self.assertEqual(list(response.context["page"]), list(first))
+
+    def test_index_invalid_cursor_returns_first_page(self):
+        """Ensure a malformed cursor falls back to the first page."""
+        response = self.client.get(reverse("index") + "?cursor=garbage")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page"]), 10)
+        self.assertFalse(response.context["page"].has_previous())
+
     def test_index_view_anonymous_user(self):
         """Ensure anonymous users can access the index view."""
         response = self.client.get(reverse("index"))
@@ -362,6 +495,23 @@ class ToggleFollowViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertFalse(self.bob in self.alice.following.all())
 
+    def test_repeated_requests_are_idempotent(self):
+        """Test that repeating a POST or DELETE leaves the follow as requested."""
+        self.client.login(username="alice", password="pass123")
+        url = reverse("toggle_follow", args=[self.bob.username])
+        for method, following, num_followers in [
+            (self.client.post, True, 1),
+            (self.client.post, True, 1),
+            (self.client.delete, False, 0),
+            (self.client.delete, False, 0),
+        ]:
+            response = method(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["following"], following)
+            self.assertEqual(response.json()["num_followers"], num_followers)
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.following_count, 0)
+
     def test_invalid_method_returns_400(self):
         """Test that GET or PUT methods return 400 errors."""
         self.client.login(username="alice", password="pass123")
@@ -397,10 +547,10 @@ class ToggleLikeViewTest(TestCase):
         self.assertTrue(self.alice in self.bob_post.likes.all())
 
     def test_unlike_post_successfully(self):
-        """Test that a second PUT unlikes the post."""
+        """Test that a DELETE request unlikes the post."""
         self.bob_post.likes.add(self.alice)
         self.client.login(username="alice", password="pass123")
-        response = self.client.put(
+        response = self.client.delete(
             reverse("toggle_like", args=[self.bob_post.id]),
             content_type="application/json",
         )
@@ -416,6 +566,34 @@ class ToggleLikeViewTest(TestCase):
         )
         self.assertEqual(response.status_code, 403)
 
+    def test_repeated_requests_are_idempotent(self):
+        """Test that repeating a PUT or DELETE leaves the like as requested."""
+        self.client.login(username="alice", password="pass123")
+        url = reverse("toggle_like", args=[self.bob_post.id])
+        for method, liked, num_likes in [
+            (self.client.put, True, 1),
+            (self.client.put, True, 1),
+            (self.client.delete, False, 0),
+            (self.client.delete, False, 0),
+        ]:
+            response = method(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["liked"], liked)
+            self.assertEqual(response.json()["num_likes"], num_likes)
+        self.bob_post.refresh_from_db()
+        self.assertEqual(self.bob_post.like_count, 0)
+
+    def test_like_is_one_round_trip_without_count(self):
+        """Test that liking writes the row and counter without a COUNT."""
+        self.client.login(username="alice", password="pass123")
+        url = reverse("toggle_like", args=[self.bob_post.id])
+        with CaptureQueriesContext(connection) as context:
+            self.client.put(url)
+        sql = [query["sql"] for query in context.captured_queries]
+        self.assertFalse(any("COUNT(" in query for query in sql))
+        self.assertTrue(any(query.startswith("INSERT") for query in sql))
+        self.assertTrue(any("RETURNING" in query for query in sql))
+
     def test_toggle_like_requires_login(self):
         """Test that unauthenticated users cannot like posts."""
         response = self.client.put(
@@ -431,3 +609,256 @@ class ToggleLikeViewTest(TestCase):
         self.assertEqual(response.status_code, 400)
         response = self.client.post(reverse("toggle_like", args=[self.bob_post.id]))
         self.assertEqual(response.status_code, 400)
+
+
+class ViewerLikedTest(TestCase):
+    """Tests for rendering the viewer's like state without loading likers."""
+
+    def setUp(self):
+        """Create a hot post, a cold post and a viewer who liked the hot one."""
+        self.client = Client()
+        self.author = User.objects.create_user(username="author", password="pass123")
+        self.viewer = User.objects.create_user(username="viewer", password="pass123")
+        self.cold = Post.objects.create(user=self.author, text="Cold post")
+        self.hot = Post.objects.create(user=self.author, text="Hot post")
+        fans = User.objects.bulk_create(
+            User(username=f"fan{i}", password="!") for i in range(50)
+        )
+        self.hot.likes.add(self.viewer, *fans)
+
+    def test_viewer_liked_annotation(self):
+        """Ensure each post on the page knows whether the viewer liked it."""
+        self.client.login(username="viewer", password="pass123")
+        for url in (reverse("index"), reverse("profile", args=["author"])):
+            response = self.client.get(url)
+            liked = {post.pk: post.viewer_liked for post in response.context["page"]}
+            self.assertEqual(liked, {self.hot.pk: True, self.cold.pk: False})
+            self.assertContains(response, 'aria-pressed="true"', count=1)
+            self.assertContains(response, "51", count=1)
+
+    def test_anonymous_viewer_liked_is_false(self):
+        """Ensure anonymous viewers see no liked posts."""
+        response = self.client.get(reverse("index"))
+        self.assertFalse(any(post.viewer_liked for post in response.context["page"]))
+
+    def test_likers_are_never_loaded(self):
+        """Ensure rendering a feed never joins users through the likes table."""
+        self.client.login(username="viewer", password="pass123")
+        for url in (reverse("index"), reverse("profile", args=["author"])):
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(url)
+            for query in context.captured_queries:
+                self.assertNotIn('JOIN "network_post_likes"', query["sql"])
+
+
+class FeedApiTest(TestCase):
+    """Tests for the JSON feed batches used by infinite scroll."""
+
+    def setUp(self):
+        """Create two authors, one followed by the viewer, with a few posts."""
+        self.client = Client()
+        self.viewer = User.objects.create_user(username="viewer", password="pass123")
+        self.alice = User.objects.create_user(username="alice", password="pass123")
+        self.bob = User.objects.create_user(username="bob", password="pass123")
+        self.viewer.following.add(self.alice)
+        self.alice_posts = [
+            Post.objects.create(user=self.alice, text=f"Alice {i}") for i in range(12)
+        ]
+        self.bob_post = Post.objects.create(user=self.bob, text="Bob")
+        self.viewer_post = Post.objects.create(user=self.viewer, text="Mine")
+        self.alice_posts[-1].likes.add(self.viewer)
+
+    def collect(self, url):
+        """Follow next cursors to the end, returning every batch's post ids."""
+        batches, cursor = [], ""
+        while True:
+            data = self.client.get(url, {"cursor": cursor} if cursor else {}).json()
+            batches.append([post["post_id"] for post in data["posts"]])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return batches
+
+    def test_posts_pages_through_everything(self):
+        """Ensure `/api/posts` returns every post once, newest first."""
+        batches = self.collect(reverse("api_posts"))
+        self.assertEqual([len(batch) for batch in batches], [10, 4])
+        ids = [pk for batch in batches for pk in batch]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_post_json_fields(self):
+        """Ensure each post carries the fields a card needs for this viewer."""
+        self.client.login(username="viewer", password="pass123")
+        posts = self.client.get(reverse("api_posts")).json()["posts"]
+        mine, newest_alice = posts[0], posts[2]
+        self.assertEqual(mine["username"], "viewer")
+        self.assertTrue(mine["own"])
+        self.assertEqual(newest_alice["text"], "Alice 11")
+        self.assertTrue(newest_alice["liked"])
+        self.assertEqual(newest_alice["num_likes"], 1)
+        self.assertFalse(newest_alice["own"])
+        self.assertFalse(newest_alice["was_edited"])
+
+    def test_following_only_returns_followed_posts(self):
+        """Ensure `/api/following` returns the viewer's timeline only."""
+        self.assertEqual(self.client.get(reverse("api_following")).status_code, 302)
+        self.client.login(username="viewer", password="pass123")
+        ids = {pk for batch in self.collect(reverse("api_following")) for pk in batch}
+        self.assertEqual(ids, {post.pk for post in self.alice_posts})
+
+    def test_profile_posts(self):
+        """Ensure `/api/profile/<username>/posts` returns that user's posts."""
+        url = reverse("api_profile_posts", args=["bob"])
+        self.assertEqual(self.collect(url), [[self.bob_post.pk]])
+        missing = reverse("api_profile_posts", args=["nobody"])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_batch_query_count(self):
+        """Ensure a batch costs one query, after the ETag's, however large."""
+        with self.assertNumQueries(2):
+            self.client.get(reverse("api_posts"))
+
+
+def _call_site(frame) -> str:
+    """Return the template line or app code line that ran a query."""
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == "render_annotated":
+            node = frame.f_locals.get("self")
+            if getattr(node, "origin", None) and getattr(node, "token", None):
+                return f"{node.origin.template_name}:{node.token.lineno}"
+        path = code.co_filename
+        # The app's own execute wrapper is never where a query came from
+        if code is middleware._report_query.__code__:
+            frame = frame.f_back
+            continue
+        if path.startswith(APP_DIR) and os.sep + "tests" + os.sep not in path:
+            where = os.path.relpath(path, os.path.dirname(APP_DIR))
+            return f"{where}:{frame.f_lineno} in {code.co_name}"
+        frame = frame.f_back
+    return "outside the app"
+
+
+class QueryBudgetMixin:
+    """Assert a block stays within a query budget, showing SQL by call site."""
+
+    @contextmanager
+    def assertQueryBudget(self, budget: int):
+        """Fail if the block runs more than `budget` queries."""
+        sites = defaultdict(list)
+
+        def record(execute, sql, params, many, context):
+            sites[_call_site(sys._getframe(1))].append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            yield
+        total = sum(len(queries) for queries in sites.values())
+        if total > budget:
+            lines = [f"{total} queries, over the budget of {budget}:"]
+            for site, queries in sorted(sites.items(), key=lambda item: -len(item[1])):
+                lines.append(f"  {len(queries)}x {site}")
+                lines.extend(f"      {sql}" for sql in queries)
+            self.fail("\n".join(lines))
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Test that every view stays within a query budget at any page size."""
+
+    # Queries per request for a logged-in viewer, user included; the session
+    # is read from the cache. A like is the post lookup plus the insert and
+    # counter update in a savepoint. A follow also looks up the followee, runs
+    # the counter path in a nested savepoint, bumps both users' counters and
+    # copies the followee's recent posts into the follower's feed (whether
+    # they are a celebrity, then their posts)
+    BUDGETS = {
+        "index": 3,
+        "following": 5,
+        "profile": 4,
+        "api_posts": 3,
+        "api_following": 5,
+        "api_profile_posts": 4,
+        "compose": 5,
+        "edit_post": 3,
+        "toggle_like": 6,
+        "toggle_follow": 11,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(username="viewer", password="pass123")
+        authors = [
+            User.objects.create_user(username=f"author{i}", password="pass123")
+            for i in range(3)
+        ]
+        likers = [
+            User.objects.create_user(username=f"liker{i}", password="pass123")
+            for i in range(3)
+        ]
+        cls.viewer.following.add(*authors)
+        for i in range(60):
+            post = Post.objects.create(user=authors[i % 3], text=f"Post {i}")
+            post.likes.add(*likers[: i % 4])
+            if i % 2:
+                post.likes.add(cls.viewer)
+        # The viewer's own post, edited once, shows the edit controls and marker
+        cls.own = Post.objects.create(user=cls.viewer, text="Mine")
+        cls.own.edit("Mine, edited")
+        cls.author = authors[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.viewer)
+
+    def request(self, view: str):
+        """Request a view the way the page's JavaScript or a browser would."""
+        if view == "compose":
+            return self.client.post(
+                reverse(view), {"text": "New"}, content_type="application/json"
+            )
+        if view == "edit_post":
+            return self.client.put(
+                reverse(view, args=[self.own.pk]),
+                {"text": "Mine, edited again"},
+                content_type="application/json",
+            )
+        if view == "toggle_like":
+            # A post the viewer has not liked, so the like changes something
+            return self.client.put(reverse(view, args=[self.own.pk - 2]))
+        if view in ("profile", "api_profile_posts", "toggle_follow"):
+            username = "liker0" if view == "toggle_follow" else self.author.username
+            method = self.client.post if view == "toggle_follow" else self.client.get
+            return method(reverse(view, args=[username]))
+        return self.client.get(reverse(view))
+
+    def test_views_within_budget(self):
+        """Test that each view stays within its budget."""
+        for view, budget in self.BUDGETS.items():
+            with self.subTest(view=view):
+                with self.assertQueryBudget(budget):
+                    response = self.request(view)
+                self.assertLess(response.status_code, 300)
+
+    def test_budget_independent_of_page_size(self):
+        """Test that a page of 50 posts runs as many queries as a page of 10."""
+        for view in ("index", "following", "profile", "api_posts"):
+            counts = []
+            for size in (10, 50):
+                with self.subTest(view=view, size=size), override_settings(
+                    FEED_PAGE_SIZE=size
+                ):
+                    cache.clear()
+                    with CaptureQueriesContext(connection) as queries:
+                        self.request(view)
+                    counts.append(len(queries))
+            self.assertEqual(counts[0], counts[1], view)
+
+    def test_failure_groups_sql_by_call_site(self):
+        """Test that an overrun lists each query under the code that ran it."""
+        with self.assertRaises(AssertionError) as failure:
+            with self.assertQueryBudget(0):
+                self.request("index")
+        message = str(failure.exception)
+        self.assertIn("over the budget of 0", message)
+        self.assertRegex(
+            message, r"1x network/conditional\.py:\d+ in _latest\n +SELECT"
+        )
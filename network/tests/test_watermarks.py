@@ -0,0 +1,115 @@
+"""Test the "new posts since" polling endpoints and their watermarks."""
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from network.models import Post, User
+
+
+class SincePollTest(TestCase):
+    """Test that polls count new posts, and cost no query when there are none."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.alice = User.objects.create_user(username="alice", password="test123")
+        self.bob = User.objects.create_user(username="bob", password="test123")
+        self.carol = User.objects.create_user(username="carol", password="test123")
+        self.old = Post.objects.create(user=self.bob, text="Before")
+
+    def post(self, user: User, text: str = "Hello") -> Post:
+        """Create a post and run what its commit would."""
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(user=user, text=text)
+
+    def follow(self, user: User) -> None:
+        """Have Alice follow a user through the view."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("toggle_follow", args=[user.username]))
+
+    def poll(self, name: str, after: int | None = None) -> dict:
+        """Poll a `since` endpoint and return its JSON."""
+        data = {} if after is None else {"after": after}
+        response = self.client.get(reverse(name), data)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_all_posts(self):
+        """Test that the first poll sets a baseline and later ones count from it."""
+        self.assertEqual(
+            self.poll("api_posts_since"), {"count": 0, "newest": self.old.pk}
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.poll("api_posts_since", self.old.pk)["count"], 0)
+        newest = self.post(self.carol)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.poll("api_posts_since", self.old.pk),
+                {"count": 1, "newest": newest.pk},
+            )
+
+    def test_following(self):
+        """Test that only followed authors' posts count, and no news is free."""
+        self.client.force_login(self.alice)
+        self.follow(self.bob)
+        self.assertEqual(self.poll("api_following_since")["newest"], self.old.pk)
+        self.post(self.carol)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.poll("api_following_since", self.old.pk)["count"], 0)
+        newest = self.post(self.bob)
+        self.assertEqual(
+            self.poll("api_following_since", self.old.pk),
+            {"count": 1, "newest": newest.pk},
+        )
+        self.follow(self.carol)
+        self.assertEqual(self.poll("api_following_since", self.old.pk)["count"], 2)
+
+    @override_settings(FEED_CELEBRITY_THRESHOLD=1)
+    def test_celebrity_posts(self):
+        """Test that posts merged at read time, not fanned out, still count."""
+        self.client.force_login(self.alice)
+        self.follow(self.bob)
+        self.poll("api_following_since")
+        newest = self.post(self.bob)
+        self.assertEqual(
+            self.poll("api_following_since", self.old.pk),
+            {"count": 1, "newest": newest.pk},
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.poll("api_following_since", newest.pk)["count"], 0)
+
+    @override_settings(CACHE_SHARED=False)
+    def test_cache_per_worker(self):
+        """Test that without a shared cache polls read the database, not the cache."""
+        self.client.force_login(self.alice)
+        self.follow(self.bob)
+        self.assertEqual(self.poll("api_following_since")["newest"], self.old.pk)
+        # Its commit callbacks never run, as if another worker had handled it
+        newest = Post.objects.create(user=self.bob, text="Elsewhere")
+        for name in ("api_posts_since", "api_following_since"):
+            with self.subTest(name=name):
+                self.assertEqual(
+                    self.poll(name, self.old.pk), {"count": 1, "newest": newest.pk}
+                )
+        self.assertIsNone(cache.get("since:posts"))
+
+    def test_invalidated_session(self):
+        """Test that a session ended by a password change is refused."""
+        self.client.login(username="alice", password="test123")
+        self.poll("api_following_since")
+        with self.assertNumQueries(0):
+            self.poll("api_following_since", self.old.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.set_password("changed")
+            self.alice.save()
+        response = self.client.get(reverse("api_following_since"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_refusals(self):
+        """Test anonymous Following polls and malformed ids."""
+        self.assertEqual(
+            self.client.get(reverse("api_following_since")).status_code, 403
+        )
+        response = self.client.get(reverse("api_posts_since"), {"after": "x"})
+        self.assertEqual(response.status_code, 400)
@@ -4,13 +4,32 @@ from . import views
 
 urlpatterns = [
     path("", views.index, name="index"),
+    path("api/following", views.api_following, name="api_following"),
+    path(
+        "api/following/since",
+        views.api_following_since,
+        name="api_following_since",
+    ),
+    path("api/posts", views.api_posts, name="api_posts"),
+    path("api/posts/since", views.api_posts_since, name="api_posts_since"),
+    path(
+        "api/profile/<str:username>/posts",
+        views.api_profile_posts,
+        name="api_profile_posts",
+    ),
+    path("api/search", views.api_search, name="api_search"),
+    path("cache/stats", views.cache_stats, name="cache_stats"),
     path("compose", views.compose, name="compose"),
     path("edit/<int:post_id>", views.edit_post, name="edit_post"),
+    path("events/<str:feed>", views.events, name="events"),
     path("follow/<str:username>", views.toggle_follow, name="toggle_follow"),
     path("following", views.following, name="following"),
     path("like/<int:post_id>", views.toggle_like, name="toggle_like"),
     path("login", views.login_view, name="login"),
     path("logout", views.logout_view, name="logout"),
+    path("metrics", views.metrics_view, name="metrics"),
     path("profile/<str:username>", views.profile, name="profile"),
     path("register", views.register, name="register"),
+    path("search", views.search, name="search"),
+    path("timing/stats", views.timing_stats, name="timing_stats"),
 ]
@@ -2,28 +2,196 @@
 
 from __future__ import annotations
 
+import hmac
 import json
+from functools import wraps
 from typing import TYPE_CHECKING
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db import IntegrityError
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404, redirect, render
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
+from django.template.response import TemplateResponse
 from django.urls import reverse
 from django.utils.http import url_has_allowed_host_and_scheme
 
 from network.models import Post
 
-from .models import Post, User
+from . import metrics, middleware, watermarks
+from .caching import cache_anonymous_page, card_stats, page_stats
+from .conditional import conditional_feed
+from .counters import set_follow, set_like
+from .feeds import FeedEngine, TimelinePaginator
+from .models import Follow, Post, User
+from .pagination import CursorPaginator, apaginate
+from .search import SearchPaginator
 
 if TYPE_CHECKING:
-    from django.http import HttpRequest, HttpResponse
+    from django.http import HttpRequest
+
+
+def _with_user(view):
+    """
+    Load `request.user` before an async view and its decorators run.
+
+    The lazy user Django attaches would query the database on first use,
+    which is not allowed on the event loop.
+    """
+
+    @wraps(view)
+    async def wrapper(request: HttpRequest, *args, **kwargs):
+        request.user = await request.auser()
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def _post_json(post: Post, viewer) -> dict:
+    """Return the compact JSON form of a feed post."""
+    return {
+        "post_id": post.id,
+        "username": post.user.username,
+        "text": post.text,
+        "created": post.created,
+        "was_edited": post.was_edited,
+        "version": post.version,
+        "num_likes": post.like_count,
+        "liked": post.viewer_liked,
+        "own": post.user_id == viewer.id,
+    }
+
+
+async def _feed_json(request: HttpRequest, paginator: CursorPaginator) -> JsonResponse:
+    """Return the cursor page a feed API request asks for as JSON."""
+    page = await paginator.aget_page(request.GET.get("cursor"))
+    return JsonResponse(
+        {
+            "posts": [_post_json(post, request.user) for post in page],
+            "next_cursor": page.next_cursor,
+        }
+    )
+
+
+@_with_user
+@login_required
+@conditional_feed("following")
+async def api_following(request: HttpRequest) -> JsonResponse:
+    """Return a batch of the current user's Following feed as JSON."""
+    posts = Post.objects.select_related("user").with_viewer_liked(request.user)
+    return await _feed_json(request, TimelinePaginator(posts, request.user))
+
+
+@_with_user
+@conditional_feed("posts")
+async def api_posts(request: HttpRequest) -> JsonResponse:
+    """Return a batch of all posts as JSON."""
+    posts = Post.objects.select_related("user").with_viewer_liked(request.user)
+    return await _feed_json(request, CursorPaginator(posts))
+
+
+@_with_user
+@conditional_feed("profile")
+async def api_profile_posts(request: HttpRequest, username: str) -> JsonResponse:
+    """Return a batch of a user's posts as JSON."""
+    user = await aget_object_or_404(User, username=username)
+    posts = user.posts.with_viewer_liked(request.user)
+    return await _feed_json(request, CursorPaginator(posts))
+
+
+async def _since_json(request: HttpRequest, newest: int, posts) -> JsonResponse:
+    """
+    Return how many of `posts` are newer than `?after=`, and the newest id.
+
+    Without `after`, the count is 0: a client's first poll sets its baseline.
+    """
+    after = request.GET.get("after", str(newest))
+    if not after.isdigit():
+        return JsonResponse({"error": "Invalid after id."}, status=400)
+    # Usually nothing is past the watermark, and that costs no query
+    count = await posts.filter(pk__gt=int(after)).acount() if newest > int(after) else 0
+    return JsonResponse({"count": count, "newest": newest or None})
+
+
+async def api_posts_since(request: HttpRequest) -> JsonResponse:
+    """Count the posts newer than `?after=<id>` for clients polling for news."""
+    return await _since_json(request, await watermarks.anewest_post(), Post.objects)
+
+
+async def api_following_since(request: HttpRequest) -> JsonResponse:
+    """
+    Count the Following feed posts newer than `?after=<id>` for polling clients.
+
+    The viewer is checked against a cached session auth hash rather than
+    loaded, so a poll with no news costs at most the session lookup.
+    """
+    user_id = await watermarks.aviewer_id(request)
+    if user_id is None:
+        return JsonResponse({"error": "Log in first."}, status=403)
+    return await _since_json(
+        request,
+        await watermarks.anewest_following(user_id),
+        watermarks.following_posts(user_id),
+    )
+
+
+@_with_user
+async def api_search(request: HttpRequest) -> JsonResponse:
+    """Return a batch of the posts matching `?q=` as JSON, best match first."""
+    posts = Post.objects.select_related("user").with_viewer_liked(request.user)
+    query = request.GET.get("q", "")
+    return await _feed_json(request, SearchPaginator(posts, query))
+
+
+def events(request: HttpRequest, feed: str) -> JsonResponse:
+    """
+    Refuse live event streams that reached Django.
+
+    Under ASGI, project4/asgi.py sends `/events/` to network/live.py before
+    Django sees it; a WSGI worker cannot hold streams open.
+    """
+    return JsonResponse({"error": "Live updates need the ASGI server."}, status=503)
+
+
+@login_required
+def cache_stats(request: HttpRequest) -> JsonResponse:
+    """Report this worker's cache hits and misses to staff."""
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Staff only."}, status=403)
+    return JsonResponse({"post_cards": card_stats(), "pages": page_stats()})
+
+
+def _has_scrape_token(request: HttpRequest) -> bool:
+    """Return whether a request carries the `PROMETHEUS_TOKEN` bearer token."""
+    token = getattr(settings, "PROMETHEUS_TOKEN", "")
+    sent = request.headers.get("Authorization", "")
+    return bool(token) and hmac.compare_digest(sent, f"Bearer {token}")
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """Expose request, cache and activity metrics to staff or a Prometheus scraper."""
+    if not settings.PROMETHEUS_METRICS:
+        raise Http404("Metrics are disabled.")
+    if not (request.user.is_staff or _has_scrape_token(request)):
+        return JsonResponse({"error": "Staff or scrape token only."}, status=403)
+    content, content_type = metrics.exposition()
+    return HttpResponse(content, content_type=content_type)
 
 
 @login_required
-def compose(request: HttpRequest) -> JsonResponse:
+def timing_stats(request: HttpRequest) -> JsonResponse:
+    """Report this worker's per-view timing histograms to staff."""
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Staff only."}, status=403)
+    return JsonResponse(middleware.timing_stats())
+
+
+@_with_user
+@login_required
+async def compose(request: HttpRequest) -> JsonResponse:
     """Create a new post."""
     if request.method != "POST":
         return JsonResponse({"error": "POST request required."}, status=400)
@@ -35,13 +203,14 @@ def compose(request: HttpRequest) -> JsonResponse:
     if not text:
         return JsonResponse({"error": "Post text cannot be empty."}, status=400)
     post = Post(user=request.user, text=text)
-    post.save()
+    await post.asave()
     return JsonResponse(
         {
             "message": "Post created successfully.",
             "post_id": post.id,
             "created": post.created,
             "text": post.text,
+            "version": post.version,
             "username": request.user.username,
         },
         status=201,
@@ -50,60 +219,78 @@ def compose(request: HttpRequest) -> JsonResponse:
 
 @login_required
 def edit_post(request: HttpRequest, post_id: int) -> JsonResponse:
-    """Edit an existing post"""
+    """
+    Edit an existing post.
+
+    An optional `version` in the body is the one the client last saw; if the
+    post has moved on since, nothing is written and a 409 is returned.
+    """
     if request.method != "PUT":
         return JsonResponse({"error": "PUT request required."}, status=400)
-    post = get_object_or_404(Post, pk=post_id)
+    # One primary-key read; the rest of the row is never needed
+    post = get_object_or_404(
+        Post.objects.only("user_id", "text", "version", "was_edited", "created"),
+        pk=post_id,
+    )
     # Ensure only the author can edit
-    if post.user != request.user:
+    if post.user_id != request.user.pk:
         return JsonResponse({"error": "You can only edit your own posts."}, status=403)
     try:
         data = json.loads(request.body)
-        new_text = data.get("text", "").strip()
-        if not new_text:
-            return JsonResponse({"error": "Text cannot be empty."}, status=400)
-        post.text = new_text
-        post.save()
-        return JsonResponse(
-            {
-                "message": "Post updated successfully.",
-                "was_edited": post.was_edited,
-                "new_text": post.text,
-            }
-        )
     except json.JSONDecodeError:
         return JsonResponse({"error": "Invalid JSON."}, status=400)
+    new_text = data.get("text", "").strip()
+    if not new_text:
+        return JsonResponse({"error": "Text cannot be empty."}, status=400)
+    if len(new_text) > Post._meta.get_field("text").max_length:
+        return JsonResponse({"error": "Text is too long."}, status=400)
+    expected = data.get("version", post.version)
+    if expected != post.version or not post.edit(new_text):
+        return JsonResponse(
+            {"error": "This post was edited elsewhere; reload to see it."},
+            status=409,
+        )
+    return JsonResponse(
+        {
+            "message": "Post updated successfully.",
+            "was_edited": post.was_edited,
+            "new_text": post.text,
+            "version": post.version,
+        }
+    )
 
 
+@_with_user
 @login_required
-def following(request: HttpRequest) -> HttpResponse:
+@conditional_feed("following")
+async def following(request: HttpRequest) -> HttpResponse:
     """Show all posts for users the current user is following."""
-    # Get posts from those users only
     posts = (
-        # Get users the current user is following
-        Post.objects.filter(user__in=request.user.following.all())
+        Post.objects
         # Optimizes future calls to post.user
         .select_related("user")
-        # Optimizes future calls to post.likes.count()
-        .prefetch_related("likes")
+        # Whether the viewer liked each post, without loading the likers
+        .with_viewer_liked(request.user)
     )
-    # Paginate
-    paginator = Paginator(posts, 10)  # 10 posts per page
-    i_page = request.GET.get("page") or 1
-    page = paginator.get_page(i_page)
-    return render(request, "network/following.html", {"page": page})
+    # Old ?page= links still page through the join over followed users
+    followed = posts.filter(user__in=request.user.following.all())
+    # Cursor pages read the materialized timeline instead
+    page = await apaginate(request, followed, TimelinePaginator(posts, request.user))
+    # Rendered by the handler, off the event loop
+    return TemplateResponse(request, "network/following.html", {"page": page})
 
 
-def index(request: HttpRequest) -> HttpResponse:
+@_with_user
+@cache_anonymous_page
+@conditional_feed("posts")
+async def index(request: HttpRequest) -> HttpResponse:
     """Show all posts."""
-    # Get all posts and prefetch likes to improve performance
-    # Optimizes future calls to post.user and post.likes.count()
-    posts = Post.objects.all().select_related("user").prefetch_related("likes")
+    # Get all posts, optimizing future calls to post.user and annotating
+    # whether the viewer liked each one without loading the likers
+    posts = Post.objects.select_related("user").with_viewer_liked(request.user)
     # Paginate
-    paginator = Paginator(posts, 10)  # 10 posts per page
-    i_page = request.GET.get("page") or 1
-    page = paginator.get_page(i_page)
-    return render(request, "network/index.html", {"page": page})
+    page = await apaginate(request, posts)
+    return TemplateResponse(request, "network/index.html", {"page": page})
 
 
 def login_view(request: HttpRequest) -> HttpResponse:
@@ -144,21 +331,29 @@ def logout_view(request: HttpRequest) -> HttpResponse:
     return redirect(reverse("index"))
 
 
-def profile(request: HttpRequest, username: str) -> HttpResponse:
+@_with_user
+@cache_anonymous_page
+@conditional_feed("profile")
+async def profile(request: HttpRequest, username: str) -> HttpResponse:
     """Show the profile for a user."""
-    user = get_object_or_404(User, username=username)
-    # Get user posts and pptimizes future calls to post.likes.count()
-    posts = user.posts.prefetch_related("likes")
-    # Paginate
-    paginator = Paginator(posts, 10)  # 10 posts per page
-    i_page = request.GET.get("page") or 1
-    page = paginator.get_page(i_page)
-    is_following = False
-    is_own_profile = False
+    users = User.objects.all()
     if request.user.is_authenticated:
-        is_following = request.user.following.filter(pk=user.pk).exists()
-        is_own_profile = request.user == user
-    return render(
+        # Fetch the header and whether the viewer follows it in one query
+        users = users.annotate(
+            viewer_follows=Exists(
+                Follow.objects.filter(
+                    from_user_id=request.user.pk, to_user_id=OuterRef("pk")
+                )
+            )
+        )
+    user = await aget_object_or_404(users, username=username)
+    # Get user posts, annotating whether the viewer liked each one
+    posts = user.posts.with_viewer_liked(request.user)
+    # Paginate
+    page = await apaginate(request, posts)
+    is_following = getattr(user, "viewer_follows", False)
+    is_own_profile = request.user == user
+    return TemplateResponse(
         request,
         "network/profile.html",
         {
@@ -170,6 +365,17 @@ def profile(request: HttpRequest, username: str) -> HttpResponse:
     )
 
 
+@_with_user
+async def search(request: HttpRequest) -> HttpResponse:
+    """Show the posts matching `?q=`, best match first."""
+    query = request.GET.get("q", "").strip()
+    posts = Post.objects.select_related("user").with_viewer_liked(request.user)
+    page = await SearchPaginator(posts, query).aget_page(request.GET.get("cursor"))
+    return TemplateResponse(
+        request, "network/search.html", {"page": page, "query": query}
+    )
+
+
 def register(request: HttpRequest) -> HttpResponse:
     """
     Handle the register get/post request.
@@ -194,7 +400,6 @@ def register(request: HttpRequest) -> HttpResponse:
     # Attempt to create new user
     try:
         user = User.objects.create_user(username, email, password)
-        user.save()
     except IntegrityError:
         return render(
             request,
@@ -212,55 +417,62 @@ def register(request: HttpRequest) -> HttpResponse:
     return redirect(next_url)
 
 
+def _set_follow(follower_id: int, user: User, following: bool) -> int:
+    """Follow or unfollow a user and update the follower's timeline together."""
+    engine = FeedEngine()
+    with transaction.atomic():
+        changed, num_followers = set_follow(follower_id, user, following)
+        if changed and following:
+            engine.follow(follower_id, [user.pk])
+            metrics.FOLLOWS_CREATED.inc()
+        elif changed:
+            engine.unfollow(follower_id, [user.pk])
+            engine.demote_crossed({user.pk: 1})
+    return num_followers
+
+
+@_with_user
 @login_required
-def toggle_follow(request: HttpRequest, username: str) -> JsonResponse:
-    """Toggle the follow status for an existing user."""
+async def toggle_follow(request: HttpRequest, username: str) -> JsonResponse:
+    """Follow (POST) or unfollow (DELETE) an existing user, idempotently."""
     if request.method not in ("DELETE", "POST"):
         return JsonResponse({"error": "DELETE or POST request required."}, status=400)
-    user = get_object_or_404(User, username=username)
+    user = await aget_object_or_404(User, username=username)
     if user == request.user:
         return JsonResponse({"error": "You can't follow yourself."}, status=403)
-    # Current following status
-    following = request.user.following.filter(pk=user.pk).exists()
-    if following and request.method != "DELETE":
-        return JsonResponse({"error": "DELETE request required."}, status=400)
-    if not following and request.method != "POST":
-        return JsonResponse({"error": "POST request required."}, status=400)
-    # Toggle status
-    following = not following
-    if following:
-        request.user.following.add(user)
-    else:
-        request.user.following.remove(user)
+    # The method is the desired state, so a repeated request changes nothing
+    following = request.method == "POST"
+    # Transactions only work in synchronous code
+    num_followers = await sync_to_async(_set_follow)(request.user.pk, user, following)
     return JsonResponse(
         {
-            "message": "User following toggled successfully.",
+            "message": "User following updated successfully.",
             "following": following,
-            "num_followers": user.num_followers(),
+            "num_followers": num_followers,
         }
     )
 
 
+@_with_user
 @login_required
-def toggle_like(request: HttpRequest, post_id: int) -> JsonResponse:
-    """Toggle the like status on an existing post"""
-    if request.method != "PUT":
-        return JsonResponse({"error": "PUT request required."}, status=400)
-    post = get_object_or_404(Post, pk=post_id)
-    if post.user == request.user:
+async def toggle_like(request: HttpRequest, post_id: int) -> JsonResponse:
+    """Like (PUT) or unlike (DELETE) an existing post, idempotently."""
+    if request.method not in ("DELETE", "PUT"):
+        return JsonResponse({"error": "DELETE or PUT request required."}, status=400)
+    post = await aget_object_or_404(
+        Post.objects.only("user_id", "like_count"), pk=post_id
+    )
+    if post.user_id == request.user.pk:
         return JsonResponse({"error": "You can't like your own posts."}, status=403)
-    # Current liked status
-    liked = post.likes.filter(pk=request.user.pk).exists()
-    # Toggle status
-    liked = not liked
-    if liked:
-        post.likes.add(request.user)
-    else:
-        post.likes.remove(request.user)
+    # The method is the desired state, so a repeated request changes nothing
+    liked = request.method == "PUT"
+    changed, num_likes = await sync_to_async(set_like)(post, request.user.pk, liked)
+    if changed and liked:
+        metrics.LIKES_CREATED.inc()
     return JsonResponse(
         {
-            "message": "Post like toggled successfully.",
+            "message": "Post like updated successfully.",
             "liked": liked,
-            "num_likes": post.likes.count(),
+            "num_likes": num_likes,
         }
     )
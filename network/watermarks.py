@@ -0,0 +1,193 @@
+"""
+High-watermarks in the cache that answer "any new posts since?" polls.
+
+`/api/posts/since` and `/api/following/since` are for clients that cannot hold
+a live event stream (see network/live.py). They tell a client how many posts
+are newer than the newest one it has. Most polls find nothing, so they are
+answered from watermarks in the cache:
+
+- the newest post overall;
+- per user, the newest post in their Following feed, raised when a post is
+  fanned out to them;
+- per author, their newest post, and per user, the celebrities they follow,
+  whose posts are merged at read time rather than fanned out.
+
+Only a poll that finds news counts the new posts in the database. A missing
+watermark is read from the database, and a follow or unfollow forgets the
+follower's. Watermarks are only kept in a cache all workers share
+(`CACHE_SHARED`); otherwise a worker that missed a post or an unfollow would
+answer from its own stale copy, so every poll reads the database.
+
+Watermarks expire after `POLL_WATERMARK_TIMEOUT` seconds. That bounds how
+long one can lag behind a post that skipped the signals, e.g. one made by
+`bulk_create`, or behind an author who became a celebrity.
+
+Following polls check the session against each user's session auth hash,
+cached beside the watermarks and dropped whenever the user is saved.
+"""
+
+from __future__ import annotations
+
+import itertools
+from typing import TYPE_CHECKING, Iterable
+
+from django.conf import settings
+from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY, aget_user
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils.crypto import constant_time_compare
+
+from .feeds import BATCH_SIZE, FeedEngine
+from .models import Follow, Post
+
+if TYPE_CHECKING:
+    from django.db.models import QuerySet
+    from django.http import HttpRequest
+
+DEFAULT_TIMEOUT = 60
+NEWEST_KEY = "since:posts"
+
+
+def timeout() -> int:
+    """Return the seconds a watermark is trusted before it is read again."""
+    return getattr(settings, "POLL_WATERMARK_TIMEOUT", DEFAULT_TIMEOUT)
+
+
+def shared() -> bool:
+    """Return whether watermarks are kept, i.e. the cache is shared."""
+    return getattr(settings, "CACHE_SHARED", False)
+
+
+def following_key(user_id: int) -> str:
+    """Return the cache key of the newest post in a user's Following feed."""
+    return f"since:following:{user_id}"
+
+
+def auth_key(user_id: int) -> str:
+    """Return the cache key of a user's current session auth hash."""
+    return f"since:auth:{user_id}"
+
+
+def author_key(author_id: int) -> str:
+    """Return the cache key of an author's newest post."""
+    return f"since:author:{author_id}"
+
+
+def celebrities_key(user_id: int) -> str:
+    """Return the cache key of the celebrities a user follows."""
+    return f"since:celebrities:{user_id}"
+
+
+def advance(post: Post, batch_size: int = BATCH_SIZE) -> None:
+    """Raise the watermarks a new post tops, once it is committed."""
+    if not shared():
+        return
+    # Two commits racing can leave the lower id here until it expires
+    if post.pk > cache.get(NEWEST_KEY, 0):
+        cache.set(NEWEST_KEY, post.pk, timeout())
+    cache.set(author_key(post.user_id), post.pk, timeout())
+    # Celebrities' followers check the author's watermark instead
+    if FeedEngine().celebrity_ids([post.user_id]):
+        return
+    follower_ids = (
+        Follow.objects.filter(to_user_id=post.user_id)
+        .values_list("from_user_id", flat=True)
+        .iterator(chunk_size=batch_size)
+    )
+    while batch := list(itertools.islice(follower_ids, batch_size)):
+        cache.set_many(
+            {following_key(follower_id): post.pk for follower_id in batch}, timeout()
+        )
+
+
+def forget(user_ids: Iterable[int]) -> None:
+    """Drop the Following watermarks of users who followed or unfollowed."""
+    if not shared():
+        return
+    cache.delete_many(
+        [key for pk in user_ids for key in (following_key(pk), celebrities_key(pk))]
+    )
+
+
+def forget_auth(user_id: int) -> None:
+    """Drop a user's cached session auth hash, e.g. when their password changes."""
+    cache.delete(auth_key(user_id))
+
+
+async def aviewer_id(request: HttpRequest) -> int | None:
+    """
+    Return the id of the logged-in viewer, or None, checking the session as
+    `get_user` does.
+
+    A session whose auth hash matches the user's cached one is trusted without
+    loading the user; otherwise the user is loaded, which also ends sessions a
+    password change invalidated.
+    """
+    user_id = await request.session.aget(SESSION_KEY)
+    if user_id is None:
+        return None
+    session_hash = await request.session.aget(HASH_SESSION_KEY)
+    if shared() and session_hash:
+        known = await cache.aget(auth_key(user_id))
+        if known is not None and constant_time_compare(session_hash, known):
+            return int(user_id)
+    user = await aget_user(request)
+    if not user.is_authenticated:
+        return None
+    if shared():
+        await cache.aset(auth_key(user.pk), user.get_session_auth_hash(), timeout())
+    return user.pk
+
+
+async def anewest_post() -> int:
+    """Return the id of the newest post, or 0 if there are none."""
+    if not shared():
+        return await _newest(Post.objects.all())
+    newest = await cache.aget(NEWEST_KEY)
+    if newest is None:
+        newest = await _newest(Post.objects.all())
+        # A post committed meanwhile may have set a higher one already
+        await cache.aadd(NEWEST_KEY, newest, timeout())
+    return newest
+
+
+async def anewest_following(user_id: int) -> int:
+    """Return the id of the newest post in a user's Following feed, or 0."""
+    if not shared():
+        return await _newest(following_posts(user_id))
+    keys = [following_key(user_id), celebrities_key(user_id)]
+    found = await cache.aget_many(keys)
+    newest = found.get(keys[0])
+    if newest is None:
+        newest = await _newest(following_posts(user_id))
+        await cache.aadd(keys[0], newest, timeout())
+    celebrity_ids = found.get(keys[1])
+    if celebrity_ids is None:
+        celebrities = FeedEngine().followed_celebrities(user_id)
+        celebrity_ids = (
+            [pk async for pk in celebrities] if celebrities is not None else []
+        )
+        await cache.aset(keys[1], celebrity_ids, timeout())
+    if not celebrity_ids:
+        return newest
+    found = await cache.aget_many([author_key(pk) for pk in celebrity_ids])
+    newest = max(newest, *found.values(), 0)
+    if missing := [pk for pk in celebrity_ids if author_key(pk) not in found]:
+        posts = Post.objects.filter(user_id__in=missing).values("user_id")
+        rows = posts.order_by().annotate(newest=Max("pk"))
+        # Celebrities without posts are cached too, as 0
+        fresh = {author_key(pk): 0 for pk in missing}
+        fresh.update({author_key(row["user_id"]): row["newest"] async for row in rows})
+        await cache.aset_many(fresh, timeout())
+        newest = max(newest, *fresh.values(), 0)
+    return newest
+
+
+def following_posts(user_id: int) -> QuerySet:
+    """Return the posts in a user's Following feed, in no particular order."""
+    return Post.objects.filter(user__followers=user_id)
+
+
+async def _newest(posts: QuerySet) -> int:
+    """Return the highest id among `posts`, or 0 if there are none."""
+    return (await posts.aaggregate(newest=Max("pk")))["newest"] or 0
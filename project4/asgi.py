@@ -11,6 +11,16 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project4.settings')
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project4.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from network.live import PREFIX, events_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Serve live event streams without Django's handler, see network/live.py."""
+    if scope["type"] == "http" and scope["path"].startswith(PREFIX):
+        return await events_application(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -45,7 +45,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "network.middleware.StaticFilesMiddleware",
+    "network.middleware.SamplingProfilerMiddleware",
+    "network.middleware.MetricsMiddleware",
+    "network.middleware.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -80,6 +83,35 @@ WSGI_APPLICATION = "project4.wsgi.application"
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 # Database config for Render
 DATABASES = {"default": dj_database_url.config(default="sqlite:///db.sqlite3")}
+# SQLite tests run on a file rather than in memory, so that threads racing
+# each other in the tests each get a connection to the same database
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    DATABASES["default"]["TEST"] = {
+        "NAME": os.path.join(BASE_DIR, "test_db.sqlite3"),
+    }
+
+# Cache shared by every worker when REDIS_URL is set, otherwise one per process
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+# Whether all workers see the same cache. gunicorn runs WEB_CONCURRENCY
+# workers, one by default, and a per-process cache is only shared by one
+CACHE_SHARED = bool(REDIS_URL) or int(os.environ.get("WEB_CONCURRENCY", 1)) == 1
+
+# Sessions are read through the cache when it is shared, so a request needs
+# no session query; with a cache per worker, a logout would not reach the others
+SESSION_ENGINE = (
+    "django.contrib.sessions.backends.cached_db"
+    if CACHE_SHARED
+    else "django.contrib.sessions.backends.db"
+)
 
 
 AUTH_USER_MODEL = "network.User"
@@ -121,3 +153,39 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 STATIC_URL = "/static/"
+
+
+# Network app
+# Posts per feed page
+FEED_PAGE_SIZE = int(os.environ.get("FEED_PAGE_SIZE", 10))
+# Authors with at least this many followers are not fanned out on write; their
+# posts are merged into followers' timelines at read time instead
+FEED_CELEBRITY_THRESHOLD = int(os.environ.get("FEED_CELEBRITY_THRESHOLD", 10000))
+# Seconds a rendered post card body stays cached; edits switch to a new key
+POST_CARD_CACHE_TIMEOUT = int(os.environ.get("POST_CARD_CACHE_TIMEOUT", 3600))
+# Seconds a logged-out feed page is served from the cache before regenerating
+ANON_PAGE_CACHE_TIMEOUT = int(os.environ.get("ANON_PAGE_CACHE_TIMEOUT", 30))
+# Add a Server-Timing header and per-view timing histograms to every response
+REQUEST_TIMING = os.environ.get("REQUEST_TIMING", "False") == "True"
+# Serve request, cache and activity metrics at /metrics for Prometheus
+PROMETHEUS_METRICS = os.environ.get("PROMETHEUS_METRICS", "False") == "True"
+# Bearer token a scraper sends to read /metrics; staff can read it signed in
+PROMETHEUS_TOKEN = os.environ.get("PROMETHEUS_TOKEN", "")
+# Run this fraction of requests under cProfile, and keep the stack samples of
+# any request slower than PROFILE_SLOW_MS; both are off at 0
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SLOW_MS = int(os.environ.get("PROFILE_SLOW_MS", 0))
+# Milliseconds between stack samples of a request being watched
+PROFILE_INTERVAL_MS = int(os.environ.get("PROFILE_INTERVAL_MS", 5))
+# Where profiles are written, and how many of the newest requests to keep
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 200))
+# Sleep this many milliseconds before every query, to rehearse a distant
+# database; for benchmarks such as benchmark_servers, keep 0 in production
+SIMULATED_DB_LATENCY_MS = int(os.environ.get("SIMULATED_DB_LATENCY_MS", 0))
+# Seconds between keep-alive comments on an idle live event stream
+LIVE_HEARTBEAT_SECONDS = int(os.environ.get("LIVE_HEARTBEAT_SECONDS", 15))
+# Seconds a "new posts since" watermark is trusted before it is read again
+POLL_WATERMARK_TIMEOUT = int(os.environ.get("POLL_WATERMARK_TIMEOUT", 60))
+# How many of the newest matches of a search are ranked for its results
+SEARCH_CANDIDATES = int(os.environ.get("SEARCH_CANDIDATES", 10000))